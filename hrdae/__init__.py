@@ -5,9 +5,12 @@ from .dataloaders.datasets import (
     CTDatasetOption,
     MNISTDatasetOption,
     MovingMNISTDatasetOption,
+    ShardedCTDatasetOption,
     SlicedCTDatasetOption,
 )
 from .dataloaders.transforms import (
+    BatchRandomShift2dOption,
+    BatchRandomShift3dOption,
     Crop2dOption,
     MinMaxNormalizationOption,
     Normalize2dOption,
@@ -87,6 +90,11 @@ cs.store(
     name="sliced_ct",
     node=SlicedCTDatasetOption,
 )
+cs.store(
+    group="config/experiment/dataloader/dataset",
+    name="sharded_ct",
+    node=ShardedCTDatasetOption,
+)
 cs.store(
     group="config/experiment/dataloader/transform",
     name="to_tensor",
@@ -122,6 +130,16 @@ cs.store(
     name="random_shift3d",
     node=RandomShift3dOption,
 )
+cs.store(
+    group="config/experiment/dataloader/transform",
+    name="batch_random_shift2d",
+    node=BatchRandomShift2dOption,
+)
+cs.store(
+    group="config/experiment/dataloader/transform",
+    name="batch_random_shift3d",
+    node=BatchRandomShift3dOption,
+)
 cs.store(
     group="config/experiment/dataloader/transform",
     name="uniform_shape3d",
@@ -2,10 +2,18 @@ import warnings
 from datetime import datetime
 
 import hydra
+import torch.multiprocessing as mp
 from omegaconf import DictConfig, OmegaConf
 
-from .dataloaders import create_dataloader
+from .dataloaders import (
+    create_dataloader,
+    memory_footprint,
+    pop_cache_stats,
+    transform_caches,
+)
+from .distributed import destroy_process_group, init_process_group, is_main_process
 from .models import create_model
+from .models.trainer import Hook, ReportHook
 from .option import Option, TrainExpOption, save_options
 
 warnings.filterwarnings("ignore")
@@ -29,6 +37,13 @@ def main(cfg: DictConfig):
         isinstance(opt.experiment, TrainExpOption)
         and type(opt.experiment) is TrainExpOption
     ):
+        if opt.experiment.world_size > 1:
+            mp.spawn(
+                train_worker,
+                args=(opt.experiment,),
+                nprocs=opt.experiment.world_size,
+            )
+            return
         train(opt.experiment)
         return
     raise NotImplementedError(f"{opt.experiment.__class__.__name__} is not implemented")
@@ -36,15 +51,36 @@ def main(cfg: DictConfig):
 
 def train(opt: TrainExpOption) -> None:
     train_loader, val_loader = create_dataloader(opt.dataloader, is_train=True)
+    # every rank holds its own copy, reported once
+    footprint = memory_footprint(train_loader.dataset)
+    if footprint > 0 and is_main_process():
+        print(f"in-memory volumes: {footprint / 1024**2:.1f} MiB")
     model = create_model(opt.model, opt.n_epoch, steps_per_epoch=len(train_loader))
 
+    hooks: list[Hook] = []
+    # the val split shares the dataset, and so the cache
+    caches = transform_caches(train_loader.dataset)
+    if len(caches) > 0:
+        # lookups of this rank and its workers
+        hooks.append(ReportHook("transform cache", lambda: pop_cache_stats(caches)))
     model.train(
         train_loader,
         val_loader,
         n_epoch=opt.n_epoch,
         result_dir=opt.result_dir,
         debug=opt.debug,
+        hooks=hooks,
     )
 
 
-main()
+def train_worker(rank: int, opt: TrainExpOption) -> None:
+    warnings.filterwarnings("ignore")
+    init_process_group(rank, opt.world_size, opt.master_port)
+    try:
+        train(opt)
+    finally:
+        destroy_process_group()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,13 @@
 from torch.utils.data import DataLoader
 
-from .basic import BasicDataLoaderOption, create_basic_dataloader
+from .basic import (
+    BasicDataLoaderOption,
+    create_basic_dataloader,
+    memory_footprint,
+    transform_caches,
+)
 from .datasets import create_dataset
+from .datasets.transform_cache import pop_cache_stats
 from .option import DataLoaderOption
 from .transforms import TransformOption, create_transform
 
@@ -17,6 +23,9 @@ def create_dataloader(
 
 __all__ = [
     "create_dataloader",
+    "memory_footprint",
+    "transform_caches",
+    "pop_cache_stats",
     "create_dataset",
     "create_transform",
     "TransformOption",
@@ -1,12 +1,46 @@
-from dataclasses import dataclass
+import random
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator
 
+import numpy as np
+import torch
 from omegaconf import MISSING
-from torch.utils.data import DataLoader, random_split
+from torch.utils.data import (
+    DataLoader,
+    Dataset,
+    DistributedSampler,
+    IterableDataset,
+    Subset,
+    random_split,
+)
 from torchvision import transforms
 
-from .datasets import DatasetOption, create_dataset
+from ..distributed import get_device, is_distributed
+from .datasets import (
+    CT,
+    CTDatasetOption,
+    DatasetOption,
+    MovingMNIST,
+    SeqDivideWrapper,
+    SlicedCT,
+    SlicedCTDatasetOption,
+    TransformCache,
+    create_dataset,
+)
+from .datasets.moving_mnist import collate_batched
+from .datasets.pyramid import pyramid_level_dir
+from .datasets.sharded_ct import ShardedCT
+from .datasets.transform_cache import transform_config_key
 from .option import DataLoaderOption
-from .transforms import TransformOption, create_transform
+from .sampler import VolumeGroupedBatchSampler
+from .transforms import (
+    Pool3dOption,
+    Transform,
+    TransformOption,
+    create_transform,
+    is_deterministic,
+)
 
 
 @dataclass
@@ -15,6 +49,195 @@ class BasicDataLoaderOption(DataLoaderOption):
     transform: dict[str, TransformOption] = MISSING
     transform_order_train: list[str] = MISSING
     transform_order_val: list[str] = MISSING
+    # applied to collated batches on the training device
+    batch_transform_order_train: list[str] = field(default_factory=list)
+    batch_transform_order_val: list[str] = field(default_factory=list)
+    transform_cache_dir: str = ""
+    transform_cache_max_gb: float = 0.0  # 0: unlimited
+    group_by_volume: bool = False  # SlicedCT or frames of a sequence
+    num_workers: int = 0
+    pin_memory: bool = False
+    persistent_workers: bool = False
+    prefetch_factor: int = 2
+    multiprocessing_context: str = ""  # "" | "fork" | "spawn" | "forkserver"
+
+
+def split_pyramid_level(
+    opt: BasicDataLoaderOption,
+    transform_order: list[str],
+) -> tuple[Path | None, list[str]]:
+    # a leading Pool3d is replaced by reading the stored pyramid level
+    if (
+        not isinstance(opt.dataset, (CTDatasetOption, SlicedCTDatasetOption))
+        or not opt.dataset.use_pyramid
+        or len(transform_order) == 0
+    ):
+        return None, transform_order
+    first = opt.transform[transform_order[0]]
+    if not isinstance(first, Pool3dOption):
+        return None, transform_order
+    level = pyramid_level_dir(Path(opt.dataset.root), first.pool_size)
+    if not level.exists():
+        print(f"pyramid level {level} not found, pooling on the fly")
+        return None, transform_order
+    return level, transform_order[1:]
+
+
+def create_basic_transform(
+    opt: BasicDataLoaderOption,
+    transform_order: list[str],
+) -> tuple[Transform, TransformCache | None]:
+    if opt.transform_cache_dir == "" or not isinstance(
+        opt.dataset, (CTDatasetOption, SlicedCTDatasetOption)
+    ):
+        return (
+            transforms.Compose(
+                [create_transform(opt.transform[name]) for name in transform_order]
+            ),
+            None,
+        )
+
+    # split into the deterministic prefix (cached on disk) and the rest
+    num_deterministic = 0
+    for name in transform_order:
+        if not is_deterministic(opt.transform[name]):
+            break
+        num_deterministic += 1
+    prefix = [opt.transform[name] for name in transform_order[:num_deterministic]]
+    suffix = [opt.transform[name] for name in transform_order[num_deterministic:]]
+    transform = transforms.Compose([create_transform(t) for t in suffix])
+    if len(prefix) == 0:
+        return transform, None
+
+    cache = TransformCache(
+        Path(opt.transform_cache_dir),
+        transforms.Compose([create_transform(t) for t in prefix]),
+        transform_config_key(prefix),
+        max_bytes=int(opt.transform_cache_max_gb * 1024**3),
+    )
+    return transform, cache
+
+
+class BatchTransformDataLoader(DataLoader):
+    def __init__(self, *args: Any, batch_transform: Transform, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.batch_transform = batch_transform
+        self.device = get_device()
+
+    def __iter__(self) -> Iterator[Any]:  # type: ignore
+        for batch in super().__iter__():
+            batch = {
+                k: v.to(self.device, non_blocking=self.pin_memory)
+                for k, v in batch.items()
+            }
+            yield self.batch_transform(batch)
+
+
+def seed_worker(worker_id: int) -> None:
+    # torch seeds each worker differently, but not random / numpy
+    seed = torch.initial_seed() % 2**32
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def create_basic_loader_kwargs(opt: BasicDataLoaderOption) -> dict[str, Any]:
+    if opt.num_workers == 0:
+        return {"pin_memory": opt.pin_memory}
+    return {
+        "num_workers": opt.num_workers,
+        "pin_memory": opt.pin_memory,
+        "persistent_workers": opt.persistent_workers,
+        "prefetch_factor": opt.prefetch_factor,
+        "worker_init_fn": seed_worker,
+        "multiprocessing_context": (
+            opt.multiprocessing_context if opt.multiprocessing_context != "" else None
+        ),
+    }
+
+
+def create_basic_loader(
+    opt: BasicDataLoaderOption,
+    dataset: Dataset,
+    shuffle: bool,
+    batch_transform: Transform | None = None,
+) -> DataLoader:
+    if isinstance(dataset, IterableDataset):
+        # shuffled by the dataset itself
+        shuffle = False
+    kwargs = create_basic_loader_kwargs(opt)
+    loader_class: type[DataLoader] = DataLoader
+    if batch_transform is not None:
+        loader_class = BatchTransformDataLoader
+        kwargs["batch_transform"] = batch_transform
+
+    if isinstance(dataset, Subset):
+        source, indices = dataset.dataset, list(dataset.indices)
+    else:
+        source, indices = dataset, list(range(len(dataset)))  # type: ignore
+    if isinstance(source, MovingMNIST) and source.batched_assembly:
+        kwargs["collate_fn"] = collate_batched
+
+    if is_distributed() and not isinstance(dataset, IterableDataset):
+        assert not opt.group_by_volume, "group_by_volume is not supported with ddp"
+        return loader_class(
+            dataset,
+            batch_size=opt.batch_size,
+            sampler=DistributedSampler(dataset, shuffle=shuffle),
+            **kwargs,
+        )
+
+    if not opt.group_by_volume:
+        return loader_class(
+            dataset, batch_size=opt.batch_size, shuffle=shuffle, **kwargs
+        )
+
+    if isinstance(source, SeqDivideWrapper):
+        # frames of one sequence are consecutive, so its sequence cache hits
+        volume_indices = [index // source.period for index in indices]
+    else:
+        assert isinstance(source, SlicedCT), "group_by_volume requires SlicedCT"
+        volume_indices = [index // source.slice_num for index in indices]
+    return loader_class(
+        dataset,
+        batch_sampler=VolumeGroupedBatchSampler(
+            volume_indices,
+            batch_size=opt.batch_size,
+            shuffle=shuffle,
+        ),
+        **kwargs,
+    )
+
+
+def memory_footprint(dataset: Dataset) -> int:
+    # bytes held by in-memory volumes, 0 for datasets that load lazily
+    if isinstance(dataset, Subset):
+        return memory_footprint(dataset.dataset)
+    if isinstance(dataset, SeqDivideWrapper):
+        return memory_footprint(dataset.base)
+    if isinstance(dataset, CT) and dataset.in_memory:
+        return dataset.memory_footprint()
+    return 0
+
+
+def transform_caches(dataset: Dataset) -> list[TransformCache]:
+    if isinstance(dataset, Subset):
+        return transform_caches(dataset.dataset)
+    if isinstance(dataset, SeqDivideWrapper):
+        return transform_caches(dataset.base)
+    if isinstance(dataset, CT) and dataset.cache is not None:
+        return [dataset.cache]
+    return []
+
+
+def manifest_split_indices(dataset: Dataset, split: str) -> list[int] | None:
+    if isinstance(dataset, SeqDivideWrapper):
+        indices = manifest_split_indices(dataset.base, split)
+        if indices is None:
+            return None
+        return [i * dataset.period + j for i in indices for j in range(dataset.period)]
+    if isinstance(dataset, CT) and len(dataset.splits) > 0:
+        return dataset.split_indices(split)
+    return None
 
 
 def create_basic_dataloader(
@@ -22,35 +245,50 @@ def create_basic_dataloader(
     is_train: bool,
 ) -> tuple[DataLoader, DataLoader | None]:
     transform_order = opt.transform_order_train if is_train else opt.transform_order_val
-    transform = transforms.Compose(
-        [create_transform(opt.transform[name]) for name in transform_order]
+    pyramid_level, transform_order = split_pyramid_level(opt, transform_order)
+    transform, cache = create_basic_transform(opt, transform_order)
+    dataset = create_dataset(opt.dataset, transform, is_train, cache, pyramid_level)
+    batch_transform_order = (
+        opt.batch_transform_order_train if is_train else opt.batch_transform_order_val
     )
-    dataset = create_dataset(opt.dataset, transform, is_train)
+    batch_transform = None
+    if len(batch_transform_order) > 0:
+        batch_transform = transforms.Compose(
+            [create_transform(opt.transform[name]) for name in batch_transform_order]
+        )
 
     if is_train:
-        train_size = int(opt.train_val_ratio * len(dataset))  # type: ignore
-        val_size = len(dataset) - train_size  # type: ignore
-        train_dataset, val_dataset = random_split(
-            dataset,
-            [train_size, val_size],
+        train_dataset: Dataset
+        val_dataset: Dataset
+        train_indices = manifest_split_indices(dataset, "train")
+        val_indices = manifest_split_indices(dataset, "val")
+        if isinstance(dataset, ShardedCT):
+            train_dataset, val_dataset = dataset.split(opt.train_val_ratio)
+        elif train_indices is not None and val_indices is not None:
+            # fixed split stored in the manifest
+            train_dataset = Subset(dataset, train_indices)
+            val_dataset = Subset(dataset, val_indices)
+        else:
+            train_size = int(opt.train_val_ratio * len(dataset))  # type: ignore
+            val_size = len(dataset) - train_size  # type: ignore
+            # every rank must draw the same split
+            generator = torch.Generator().manual_seed(0) if is_distributed() else None
+            train_dataset, val_dataset = random_split(
+                dataset,
+                [train_size, val_size],
+                generator=generator,
+            )
+        train_loader = create_basic_loader(
+            opt, train_dataset, shuffle=is_train, batch_transform=batch_transform
         )
-        train_loader = DataLoader(
-            train_dataset,
-            batch_size=opt.batch_size,
-            shuffle=is_train,
-        )
-        val_loader = DataLoader(
-            val_dataset,
-            batch_size=opt.batch_size,
-            shuffle=is_train,
+        val_loader = create_basic_loader(
+            opt, val_dataset, shuffle=is_train, batch_transform=batch_transform
         )
         return train_loader, val_loader
 
     return (
-        DataLoader(
-            dataset,
-            batch_size=opt.batch_size,
-            shuffle=is_train,
+        create_basic_loader(
+            opt, dataset, shuffle=is_train, batch_transform=batch_transform
         ),
         None,
     )
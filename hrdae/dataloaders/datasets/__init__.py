@@ -1,6 +1,8 @@
+from pathlib import Path
+
 from torch.utils.data import Dataset
 
-from ..transforms import Transform
+from ..transforms import Transform, is_stochastic
 from .ct import CT, CTDatasetOption, create_ct_dataset
 from .mnist import MNISTDatasetOption, create_mnist_dataset
 from .moving_mnist import (
@@ -10,13 +12,26 @@ from .moving_mnist import (
 )
 from .option import DatasetOption
 from .seq_divide_wrapper import SeqDivideWrapper
+from .sharded_ct import ShardedCTDatasetOption, create_sharded_ct_dataset
 from .sliced_ct import SlicedCT, SlicedCTDatasetOption, create_sliced_ct_dataset
+from .transform_cache import TransformCache
+
+
+def _divide_sequences(
+    dataset: Dataset, period: int, transform: Transform
+) -> SeqDivideWrapper:
+    # a cached sequence would reuse one random draw for all of its frames
+    if is_stochastic(transform):
+        return SeqDivideWrapper(dataset, period, cache_size=0)
+    return SeqDivideWrapper(dataset, period)
 
 
 def create_dataset(
     opt: DatasetOption,
     transform: Transform,
     is_train: bool,
+    cache: TransformCache | None = None,
+    pyramid_level: Path | None = None,
 ) -> Dataset:
     if isinstance(opt, MNISTDatasetOption) and type(opt) is MNISTDatasetOption:
         return create_mnist_dataset(opt, transform, is_train)
@@ -26,16 +41,21 @@ def create_dataset(
     ):
         dataset = create_moving_mnist_dataset(opt, transform, is_train)
         if not opt.sequential:
-            return SeqDivideWrapper(dataset, MovingMNIST.PERIOD)
+            return _divide_sequences(dataset, MovingMNIST.PERIOD, transform)
         return dataset
     if isinstance(opt, CTDatasetOption) and type(opt) is CTDatasetOption:
-        dataset = create_ct_dataset(opt, transform, is_train)
+        dataset = create_ct_dataset(opt, transform, is_train, cache, pyramid_level)
         if not opt.sequential:
-            return SeqDivideWrapper(dataset, CT.PERIOD)
+            return _divide_sequences(dataset, CT.PERIOD, transform)
         return dataset
     if isinstance(opt, SlicedCTDatasetOption) and type(opt) is SlicedCTDatasetOption:
-        dataset = create_sliced_ct_dataset(opt, transform, is_train)
+        dataset = create_sliced_ct_dataset(
+            opt, transform, is_train, cache, pyramid_level
+        )
         if not opt.sequential:
-            return SeqDivideWrapper(dataset, SlicedCT.PERIOD)
+            return _divide_sequences(dataset, SlicedCT.PERIOD, transform)
         return dataset
+    if isinstance(opt, ShardedCTDatasetOption) and type(opt) is ShardedCTDatasetOption:
+        assert opt.sequential, "ShardedCT streams whole sequences"
+        return create_sharded_ct_dataset(opt, transform, is_train)
     raise NotImplementedError(f"dataset {opt.__class__.__name__} not implemented")
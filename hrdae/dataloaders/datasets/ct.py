@@ -1,17 +1,22 @@
 import random
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Callable
+from typing import Callable, Iterable
 
 import numpy as np
 from omegaconf import MISSING
-from torch import Tensor, cat, from_numpy, gather, int64, tensor, where
+from torch import Tensor, empty, from_numpy, int64, tensor, where
 from torch.utils.data import Dataset
+from torchvision import transforms
 from tqdm import tqdm
 
-from ..transforms import Transform
-from .functions import optimize_output
+from ..transforms import MinMaxNormalization, Transform
+from .functions import dequantize, optimize_output, quantize
+from .manifest import load_manifest, load_manifest_threshold
 from .option import DatasetOption
+from .transform_cache import TransformCache
+from .volume_store import VolumeStore
 
 
 @dataclass
@@ -24,6 +29,12 @@ class CTDatasetOption(DatasetOption):
     content_phase: str = "all"
     motion_phase: str = "0"
     motion_aggregation: str = "concat"
+    volume_store: str = ""
+    preload_workers: int = 0
+    preload_executor: str = "thread"  # "thread" | "process"
+    storage_dtype: str = ""  # "" (as loaded) | "float16" | "uint8"
+    manifest: str = ""
+    use_pyramid: bool = False
 
 
 class BasicSliceIndexer:
@@ -31,23 +42,76 @@ class BasicSliceIndexer:
         self.threshold = threshold
         self.min_occupancy = min_occupancy
 
-    def __call__(self, x: Tensor) -> Tensor:
-        mask = where(x > self.threshold, 1, 0)
-        choices = []
-        n, d, h, w = x.size()
-        for i in range(w):
-            if mask[:, :, :, i].sum() < self.min_occupancy * n * d * h:
-                continue
-            choices.append(i)
+    def occupancy(self, x: Tensor) -> Tensor:
+        # (..., n, d, h, w) -> (..., w), in a single reduction
+        return (x > self.threshold).float().mean(dim=(-4, -3, -2))
+
+    def index(self, x: Tensor) -> Tensor:
+        # candidate slices of a volume, looked up by choose()
+        return self.index_occupancy(self.occupancy(x))
 
+    def index_occupancy(self, occupancy: Tensor) -> Tensor:
+        (choices,) = where(occupancy >= self.min_occupancy)
         if len(choices) > 0:
-            return tensor([random.choice(choices)], dtype=int64)
+            return choices
+        return occupancy.argmax().reshape(1)
+
+    def choose(self, choices: Tensor) -> Tensor:
+        return choices[random.randrange(len(choices))].reshape(1)
+
+    def __call__(self, x: Tensor) -> Tensor:
+        return self.choose(self.index(x))
+
+
+def assemble_ct_output(
+    x_3d: Tensor,
+    slice_idx: Tensor,
+    content_phase: str,
+    motion_phase: str,
+    motion_aggregation: str,
+) -> dict[str, Tensor]:
+    # (n, d, h, w) -> (n, d, h, s) -> (n, s, d, h)
+    x_2d = x_3d.index_select(-1, slice_idx).permute(0, 3, 1, 2)
+    # (n, d, h, w) -> (n, c, d, h, w)
+    x_3d = x_3d.unsqueeze(1)
+
+    return optimize_output(
+        x_2d,
+        x_3d,
+        content_phase,
+        motion_phase,
+        motion_aggregation,
+    )
 
-        return tensor([int(mask.sum(dim=(0, 1)).argmax())], dtype=int64)
+
+_preload_dataset: "CT | None" = None
+
+
+def _is_min_max_normalization(transform: Transform | None) -> bool:
+    # the space build_manifest computes the occupancy in
+    if isinstance(transform, transforms.Compose):
+        return len(transform.transforms) == 1 and _is_min_max_normalization(
+            transform.transforms[0]
+        )
+    return isinstance(transform, MinMaxNormalization)
+
+
+def _init_preload(dataset: "CT") -> None:
+    global _preload_dataset
+    _preload_dataset = dataset
+
+
+def _preload_one(index: int) -> tuple[Tensor, float, float]:
+    assert _preload_dataset is not None
+    return _preload_dataset._preload_one(index)
 
 
 def create_ct_dataset(
-    opt: CTDatasetOption, transform: Transform, is_train: bool
+    opt: CTDatasetOption,
+    transform: Transform,
+    is_train: bool,
+    cache: TransformCache | None = None,
+    pyramid_level: Path | None = None,
 ) -> Dataset:
     slice_indexer: Callable[[Tensor], Tensor]
     if len(opt.slice_index) == 0:
@@ -66,6 +130,13 @@ def create_ct_dataset(
         content_phase=opt.content_phase,
         motion_phase=opt.motion_phase,
         motion_aggregation=opt.motion_aggregation,
+        volume_store=Path(opt.volume_store) if opt.volume_store != "" else None,
+        cache=cache,
+        preload_workers=opt.preload_workers,
+        preload_executor=opt.preload_executor,
+        storage_dtype=opt.storage_dtype,
+        manifest=Path(opt.manifest) if opt.manifest != "" else None,
+        pyramid_level=pyramid_level,
     )
 
 
@@ -83,28 +154,72 @@ class CT(Dataset):
         content_phase: str = "all",
         motion_phase: str = "0",
         motion_aggregation: str = "concat",  # "concat" | "sum"
+        volume_store: Path | None = None,
+        cache: TransformCache | None = None,
+        preload_workers: int = 0,
+        preload_executor: str = "thread",  # "thread" | "process"
+        storage_dtype: str = "",  # "" (as loaded) | "float16" | "uint8"
+        manifest: Path | None = None,
+        pyramid_level: Path | None = None,  # read instead of a leading Pool3d
     ) -> None:
         super().__init__()
 
         self.paths = []
         data_root = root / "CT"
-        for i, path in enumerate(sorted(data_root.glob("**/*"))):
-            if is_train and i % (1 + self.TRAIN_PER_TEST) != 0:
-                self.paths.append(path)
-            elif not is_train and i % (1 + self.TRAIN_PER_TEST) == 0:
-                self.paths.append(path)
+        self.data_root = data_root
+        self.volume_store = VolumeStore(volume_store) if volume_store else None
+        self.cache = cache
+        self.pyramid_level = pyramid_level
+        self.splits: list[str] = []
+        occupancies: list[list[float]] = []
+        if manifest is not None:
+            for entry in load_manifest(manifest):
+                if is_train == (entry["split"] != "test"):
+                    self.paths.append(data_root / entry["path"])
+                    self.splits.append(entry["split"])
+                    occupancies.append(entry["occupancy"])
+        else:
+            for i, path in enumerate(sorted(data_root.glob("**/*"))):
+                if is_train and i % (1 + self.TRAIN_PER_TEST) != 0:
+                    self.paths.append(path)
+                elif not is_train and i % (1 + self.TRAIN_PER_TEST) == 0:
+                    self.paths.append(path)
 
-        self.data: list[Tensor] = []
+        self.transform = transform
+        self.in_memory = in_memory
+        self.storage_dtype = storage_dtype
+        self.data: Tensor | list[Tensor] = []
+        self.scales: list[float] = []
+        self.offsets: list[float] = []
         if in_memory:
-            for path in tqdm(self.paths, desc="loading datasets..."):
-                t = from_numpy(np.load(path)["arr_0"])
-                if transform is not None:
-                    t = transform(t)
-                self.data.append(t)
+            self.data = self._preload(preload_workers, preload_executor)
+
+        # volumes in memory are fixed, so their slice candidates are too
+        self.slice_choices: list[Tensor] = []
+        if in_memory and isinstance(slice_indexer, BasicSliceIndexer):
+            if manifest is not None:
+                threshold = load_manifest_threshold(manifest)
+                if threshold != slice_indexer.threshold:
+                    raise ValueError(
+                        f"manifest threshold {threshold} does not match "
+                        f"the slice indexer threshold {slice_indexer.threshold}"
+                    )
+            # the manifest occupancy is of the min-max normalized volume, any
+            # other transform (or a cached or pooled source) recomputes it
+            use_manifest = (
+                manifest is not None
+                and cache is None
+                and pyramid_level is None
+                and _is_min_max_normalization(transform)
+            )
+            for i in range(len(self.data)):
+                if use_manifest and len(occupancies[i]) == self.data[i].size(-1):
+                    choices = slice_indexer.index_occupancy(tensor(occupancies[i]))
+                else:
+                    choices = slice_indexer.index(self._get_volume(i))
+                self.slice_choices.append(choices)
 
         self.slice_indexer = slice_indexer
-        self.transform = transform
-        self.in_memory = in_memory
         self.content_phase = content_phase
         self.motion_phase = motion_phase
         self.motion_aggregation = motion_aggregation
@@ -112,68 +227,126 @@ class CT(Dataset):
     def __len__(self) -> int:
         return len(self.paths)
 
-    def __getitem__(self, index: int) -> dict[str, Tensor]:
+    def split_indices(self, split: str) -> list[int]:
+        # only available with a manifest
+        assert len(self.splits) > 0
+        return [i for i, s in enumerate(self.splits) if s == split]
+
+    def _source(self, index: int) -> Path:
+        path = self.paths[index]
+        if self.pyramid_level is not None:
+            return self.pyramid_level / path.relative_to(self.data_root)
+        return path
+
+    def _load(self, index: int) -> Tensor:
+        path = self._source(index)
+        if path != self.paths[index]:  # pooled level
+            return from_numpy(np.load(str(path))["arr_0"])
+        if self.volume_store is not None:
+            key = path.relative_to(self.data_root).as_posix()
+            if key in self.volume_store:
+                return self.volume_store[key]
+        return from_numpy(np.load(str(path))["arr_0"])
+
+    def _load_cached(self, index: int) -> Tensor:
+        # the cache holds the deterministic transform prefix,
+        # self.transform only the remaining (stochastic) suffix
+        if self.cache is not None:
+            return self.cache(self._source(index), lambda: self._load(index))
+        return self._load(index)
+
+    def _preload_one(self, index: int) -> tuple[Tensor, float, float]:
+        t = self._load_cached(index)
+        if self.transform is not None:
+            t = self.transform(t)
+        if self.storage_dtype != "":
+            return quantize(t, self.storage_dtype)
+        return t, 1.0, 0.0
+
+    def _preload(self, num_workers: int, executor: str) -> Tensor | list[Tensor]:
+        indices = range(len(self.paths))
+        pool: Executor | None = None
+        results: Iterable[tuple[Tensor, float, float]]
+        if num_workers == 0:
+            results = map(self._preload_one, indices)
+        elif executor == "thread":
+            pool = ThreadPoolExecutor(num_workers)
+            results = pool.map(self._preload_one, indices)
+        elif executor == "process":
+            pool = ProcessPoolExecutor(
+                num_workers, initializer=_init_preload, initargs=(self,)
+            )
+            results = pool.map(_preload_one, indices)
+        else:
+            raise KeyError(f"unknown executor {executor}")
+
+        # volumes of the same shape go into one preallocated shared tensor
+        data: Tensor | None = None
+        volumes: list[Tensor] = []
+        scales, offsets = [], []
+        for i, (t, scale, offset) in enumerate(
+            tqdm(results, total=len(indices), desc="loading datasets...")
+        ):
+            scales.append(scale)
+            offsets.append(offset)
+            if data is None and len(volumes) == 0:
+                data = empty((len(indices),) + t.size(), dtype=t.dtype)
+                data.share_memory_()
+            if data is not None and t.size() == data.size()[1:]:
+                data[i] = t
+                continue
+            if data is not None:
+                volumes = list(data[:i])
+                data = None
+            volumes.append(t)
+        if pool is not None:
+            pool.shutdown()
+        self.scales, self.offsets = scales, offsets
+        return data if data is not None else volumes
+
+    def memory_footprint(self) -> int:
+        if isinstance(self.data, Tensor):
+            return self.data.nelement() * self.data.element_size()
+        return sum(t.nelement() * t.element_size() for t in self.data)
+
+    def _get_volume(self, index: int) -> Tensor:
         if len(self.data) > 0:
             assert self.in_memory
-            x_3d = self.data[index]
-        else:  # not in memory
-            assert not self.in_memory
-            x_3d = from_numpy(np.load(str(self.paths[index]))["arr_0"])
-            if self.transform is not None:
-                x_3d = self.transform(x_3d)
-
-        x_3d = x_3d.float()
-        n, d, h, w = x_3d.size()
-        assert n == self.PERIOD, f"expected {self.PERIOD} but got {n}"
+            if self.storage_dtype != "":
+                return dequantize(
+                    self.data[index], self.scales[index], self.offsets[index]
+                )
+            return self.data[index]
+        # not in memory
+        assert not self.in_memory
+        x_3d = self._load_cached(index)
+        if self.transform is not None:
+            x_3d = self.transform(x_3d)
+        return x_3d
+
+    def has_frame(self, index: int) -> bool:
+        return self.in_memory
 
-        rt = random.randint(0, self.PERIOD - 1)
+    def get_frame(self, index: int, frame: int) -> Tensor:
+        # (c, d, h, w), equal to self[index]["xp"][frame]
+        # without the slicing and phase assembly
+        return self._get_volume(index)[frame].float().unsqueeze(0)
+
+    def __getitem__(self, index: int) -> dict[str, Tensor]:
+        x_3d = self._get_volume(index).float()
+        n = x_3d.size(0)
+        assert n == self.PERIOD, f"expected {self.PERIOD} but got {n}"
 
         # (s,)
-        slice_idx = self.slice_indexer(x_3d)
-        # (n, d, h, s)
-        idx_expanded = (
-            slice_idx.unsqueeze(0).unsqueeze(1).unsqueeze(2).repeat(n, d, h, 1)
-        )
+        if len(self.slice_choices) > 0:
+            assert isinstance(self.slice_indexer, BasicSliceIndexer)
+            slice_idx = self.slice_indexer.choose(self.slice_choices[index])
+        else:
+            slice_idx = self.slice_indexer(x_3d)
 
-        # (n, d, h, s)
-        x_2d = gather(x_3d, -1, idx_expanded)
-        # (d, h, s)
-        x_2d_0 = x_2d[0]
-        x_2d_t = x_2d[self.PERIOD // 2]
-        x_2d_rt = x_2d[rt]
-        # (d, h, w)
-        x_3d_0 = x_3d[0]
-        x_3d_t = x_3d[self.PERIOD // 2]
-        x_3d_rt = x_3d[rt]
-
-        # (n, d, h, s) -> (n, s, d, h)
-        x_2d = x_2d.permute(0, 3, 1, 2)
-        # (d, h, s) -> (s, d, h)
-        x_2d_0 = x_2d_0.permute(2, 0, 1)
-        x_2d_t = x_2d_t.permute(2, 0, 1)
-        x_2d_rt = x_2d_rt.unsqueeze(0)
-        # (2 * s, d, h)
-        x_2d_all = cat([x_2d_0, x_2d_t], dim=0)
-        # (n, d, h, w) -> (n, c, d, h, w)
-        x_3d = x_3d.unsqueeze(1)
-        # (d, h, w) -> (c, d, h, w)
-        x_3d_0 = x_3d_0.unsqueeze(0)
-        x_3d_t = x_3d_t.unsqueeze(0)
-        x_3d_rt = x_3d_rt.unsqueeze(0)
-        # (2 * c, d, h, w)
-        x_3d_all = cat([x_3d_0, x_3d_t], dim=0)
-
-        return optimize_output(
-            x_2d,
-            x_2d_0,
-            x_2d_t,
-            x_2d_rt,
-            x_2d_all,
+        return assemble_ct_output(
             x_3d,
-            x_3d_0,
-            x_3d_t,
-            x_3d_rt,
-            x_3d_all,
+            slice_idx,
             self.content_phase,
             self.motion_phase,
             self.motion_aggregation,
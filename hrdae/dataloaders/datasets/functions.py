@@ -1,57 +1,51 @@
-from torch import Tensor, cat
+from random import randint
+
+from torch import Tensor, cat, uint8
+
+
+def select_phase(x: Tensor, phase: str, rt: int, dim: int = 0) -> Tensor:
+    # (*, n, k, ...) -> (*, k | 2 * k, ...), only the requested phase is built
+    n = x.size(dim)
+    if phase == "0":
+        return x.select(dim, 0)
+    if phase == "t":
+        return x.select(dim, n // 2)
+    if phase == "random":
+        return x.select(dim, rt)
+    if phase == "all":
+        return cat([x.select(dim, 0), x.select(dim, n // 2)], dim=dim)
+    raise KeyError(f"unknown phase {phase}")
 
 
 def optimize_output(
-    x_2d: Tensor,
-    x_2d_0: Tensor,
-    x_2d_t: Tensor,
-    x_2d_rt: Tensor,
-    x_2d_all: Tensor,
-    x_3d: Tensor,
-    x_3d_0: Tensor,
-    x_3d_t: Tensor,
-    x_3d_rt: Tensor,
-    x_3d_all: Tensor,
+    x_2d: Tensor,  # (*, n, s, ...)
+    x_3d: Tensor,  # (*, n, c, ...)
     content_phase: str,
     motion_phase: str,
     motion_aggregation: str,
     pred_diff: bool = False,
+    batch_dims: int = 0,  # number of leading batch dimensions
 ) -> dict[str, Tensor]:
-    if content_phase == "all":
-        xp_0 = x_3d_all
-    elif content_phase == "0":
-        xp_0 = x_3d_0
-    elif content_phase == "t":
-        xp_0 = x_3d_t
-    elif content_phase == "random":
-        xp_0 = x_3d_rt
-    else:
-        raise KeyError(f"unknown content phase {content_phase}")
+    rt = randint(0, x_3d.size(batch_dims) - 1)
+    xp_0 = select_phase(x_3d, content_phase, rt, batch_dims)
 
     xp = x_3d
     if pred_diff:
-        xp = xp - xp_0.unsqueeze(0)
+        xp = xp - xp_0.unsqueeze(batch_dims)
 
-    xm_0 = x_2d_0  # pseudo
-    if motion_phase == "0":
-        pass
-    elif motion_phase == "t":
-        xm_0 = x_2d_t
-    elif motion_phase == "random":
-        xm_0 = x_2d_rt
-    elif motion_phase == "all":
-        xm_0 = x_2d_all
-    else:
-        raise KeyError(f"unknown motion phase {motion_phase}")
+    xm_0 = select_phase(x_2d, motion_phase, rt, batch_dims)
 
     xm = x_2d
     if motion_aggregation == "none":
         pass
     elif motion_aggregation == "diff":
-        xm -= xm_0.unsqueeze(0).clone()
+        xm = xm - xm_0.unsqueeze(batch_dims)
     elif motion_aggregation == "concat":
-        new = (xm.size(0),) + (1,) * xm_0.dim()
-        xm = cat([xm, xm_0.unsqueeze(0).repeat(new)], dim=1)
+        # expand is a view, cat allocates the output only once
+        xm_0_expanded = xm_0.unsqueeze(batch_dims).expand(
+            xm.size()[: batch_dims + 1] + xm_0.size()[batch_dims:]
+        )
+        xm = cat([xm, xm_0_expanded], dim=batch_dims + 1)
 
     return {
         "xm": xm,  # (n, s, d, h)
@@ -59,3 +53,21 @@ def optimize_output(
         "xp": xp,  # (n, c, d, h, w)
         "xp_0": xp_0,  # (c | 2 * c, d, h, w)
     }
+
+
+def quantize(x: Tensor, dtype: str) -> tuple[Tensor, float, float]:
+    # x = q * scale + offset, with q in [0, 1] (float16) or [0, 255] (uint8)
+    offset = float(x.min())
+    scale = float(x.max()) - offset
+    if scale == 0.0:
+        scale = 1.0
+    q = (x.double() - offset) / scale
+    if dtype == "float16":
+        return q.half(), scale, offset
+    if dtype == "uint8":
+        return (q * 255).round().to(uint8), scale / 255, offset
+    raise KeyError(f"unknown storage dtype {dtype}")
+
+
+def dequantize(q: Tensor, scale: float, offset: float) -> Tensor:
+    return q.float() * scale + offset
@@ -0,0 +1,80 @@
+import json
+import random
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+
+def build_manifest(
+    root: Path,
+    out: Path,
+    train_per_test: int,
+    val_ratio: float = 0.2,
+    threshold: float = 0.1,
+    seed: int = 0,
+) -> None:
+    # test split as in CT, val drawn from the remaining volumes once
+    data_root = root / "CT"
+    paths, is_test = [], []
+    for i, path in enumerate(sorted(data_root.glob("**/*"))):
+        if not path.is_file():
+            continue
+        paths.append(path)
+        is_test.append(i % (1 + train_per_test) == 0)
+    train = [i for i in range(len(paths)) if not is_test[i]]
+    val = set(random.Random(seed).sample(train, round(val_ratio * len(train))))
+
+    entries = []
+    for i, path in enumerate(tqdm(paths, desc="building manifest...")):
+        x = np.load(path)["arr_0"]
+        # thresholded after MinMaxNormalization, like BasicSliceIndexer
+        normalized = (x - x.min()) / (x.max() - x.min())
+        occupancy = (normalized > threshold).mean(axis=(0, 1, 2))
+        entries.append(
+            {
+                "path": path.relative_to(data_root).as_posix(),
+                "shape": list(x.shape),
+                "dtype": x.dtype.str,
+                "occupancy": [round(float(o), 4) for o in occupancy],
+                "split": "test" if is_test[i] else "val" if i in val else "train",
+            }
+        )
+
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({"threshold": threshold, "entries": entries}, f)
+
+
+def load_manifest(path: Path) -> list[dict]:
+    with open(path) as f:
+        return json.load(f)["entries"]
+
+
+def load_manifest_threshold(path: Path) -> float:
+    # the occupancy threshold the manifest was built with
+    with open(path) as f:
+        return json.load(f)["threshold"]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from .ct import CT
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", type=Path, default=Path("data"))
+    parser.add_argument("--out", type=Path, default=None)
+    parser.add_argument("--val_ratio", type=float, default=0.2)
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    build_manifest(
+        args.root,
+        args.out if args.out is not None else args.root / "CT_manifest.json",
+        CT.TRAIN_PER_TEST,
+        args.val_ratio,
+        args.threshold,
+        args.seed,
+    )
@@ -1,7 +1,6 @@
 from dataclasses import dataclass, field
-from random import randint
 
-from torch import Tensor, cat, gather, int64, tensor
+from torch import Tensor, int64, stack, tensor
 from torch.utils.data import Dataset
 from torchvision import datasets
 
@@ -17,6 +16,14 @@ class MovingMNISTDatasetOption(DatasetOption):
     content_phase: str = "all"
     motion_phase: str = "0"
     motion_aggregation: str = "concat"
+    # __getitems__ slices and assembles the phases of a whole batch at once,
+    # the transform still runs per sequence on every fetch
+    batched_assembly: bool = False
+
+
+def collate_batched(batch: dict[str, Tensor]) -> dict[str, Tensor]:
+    # MovingMNIST.__getitems__ already returns a whole batch
+    return batch
 
 
 class MovingMNIST(datasets.MovingMNIST):
@@ -27,63 +34,61 @@ class MovingMNIST(datasets.MovingMNIST):
         self.content_phase = kwargs.pop("content_phase", "all")
         self.motion_phase = kwargs.pop("motion_phase", "0")
         self.motion_aggregator = kwargs.pop("motion_aggregation", "concat")
+        self.batched_assembly = kwargs.pop("batched_assembly", False)
         super().__init__(*args, **kwargs)
 
-    def __getitem__(self, idx: int) -> dict[str, Tensor]:
-        # (n, h, w)
-        x_2d = super().__getitem__(idx).squeeze(1)
-
-        n, h, w = x_2d.size()
-        rt = randint(0, self.PERIOD - 1)
-
-        # (s,)
-        slice_idx = tensor(self.slice_index, dtype=int64)
-        # (n, h, s)
-        idx_expanded = slice_idx.unsqueeze(0).unsqueeze(1).repeat(n, h, 1)
-        # (n, h, s)
-        x_1d = gather(x_2d, -1, idx_expanded)
-        # (h, s)
-        x_1d_0 = x_1d[0]
-        x_1d_t = x_1d[self.PERIOD // 2]
-        x_1d_rt = x_1d[rt]
-        # (h, w)
-        x_2d_0 = x_2d[0]
-        x_2d_t = x_2d[self.PERIOD // 2]
-        x_2d_rt = x_2d[rt]
-
-        # (n, h, s) -> (n, s, h)
-        x_1d = x_1d.permute(0, 2, 1)
-        # (h, s) -> (s, h)
-        x_1d_0 = x_1d_0.permute(1, 0)
-        x_1d_t = x_1d_t.permute(1, 0)
-        x_1d_rt = x_1d_rt.permute(1, 0)
-        # (2 * s, h)
-        x_1d_all = cat([x_1d_0, x_1d_t], dim=0)
-        # (n, h, w) -> (n, c, h, w)
-        x_2d = x_2d.unsqueeze(1)
-        # (h, w) -> (c, h, w)
-        x_2d_0 = x_2d_0.unsqueeze(0)
-        x_2d_t = x_2d_t.unsqueeze(0)
-        x_2d_rt = x_2d_rt.unsqueeze(0)
-        # (2 * c, h, w)
-        x_2d_all = cat([x_2d_0, x_2d_t], dim=0)
+        if self.batched_assembly:
+            assert "random" not in (
+                self.content_phase,
+                self.motion_phase,
+            ), "random phases are drawn per sample and cannot be batched"
+
+    def _sequences(self, indices: list[int]) -> Tensor:
+        # the raw uint8 frames are kept, so a stochastic transform
+        # is drawn anew on every fetch
+        if self.transform is not None:
+            return stack([self.transform(self.data[i]) for i in indices])
+        return self.data[tensor(indices, dtype=int64)]
+
+    def _assemble(self, x_2d: Tensor, batch_dims: int) -> dict[str, Tensor]:
+        # (..., n, c, h, w) -> (..., n, h, w)
+        x_2d = x_2d.squeeze(-3)
+
+        # (..., n, h, s) -> (..., n, s, h)
+        x_1d = x_2d.index_select(-1, tensor(self.slice_index, dtype=int64))
+        x_1d = x_1d.transpose(-2, -1)
+        # (..., n, h, w) -> (..., n, c, h, w)
+        x_2d = x_2d.unsqueeze(-3)
 
         return optimize_output(
             x_1d,
-            x_1d_0,
-            x_1d_t,
-            x_1d_rt,
-            x_1d_all,
             x_2d,
-            x_2d_0,
-            x_2d_t,
-            x_2d_rt,
-            x_2d_all,
             self.content_phase,
             self.motion_phase,
             self.motion_aggregator,
+            batch_dims=batch_dims,
         )
 
+    def __getitems__(
+        self, indices: list[int]
+    ) -> dict[str, Tensor] | list[dict[str, Tensor]]:
+        if not self.batched_assembly:
+            return [self[i] for i in indices]
+        # a whole batch, to be used with collate_batched
+        return self._assemble(self._sequences(indices), batch_dims=1)
+
+    def has_frame(self, idx: int) -> bool:
+        # the frames are always in memory
+        return True
+
+    def get_frame(self, idx: int, frame: int) -> Tensor:
+        # (c, h, w), equal to self[idx]["xp"][frame]
+        # without the slicing and phase assembly
+        return self._sequences([idx])[0, frame]
+
+    def __getitem__(self, idx: int) -> dict[str, Tensor]:
+        return self._assemble(self._sequences([idx])[0], batch_dims=0)
+
 
 def create_moving_mnist_dataset(
     opt: MovingMNISTDatasetOption,
@@ -99,4 +104,5 @@ def create_moving_mnist_dataset(
         content_phase=opt.content_phase,
         motion_phase=opt.motion_phase,
         motion_aggregation=opt.motion_aggregation,
+        batched_assembly=opt.batched_assembly,
     )
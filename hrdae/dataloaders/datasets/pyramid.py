@@ -0,0 +1,47 @@
+from pathlib import Path
+
+import numpy as np
+from torch import from_numpy
+from torch.nn.functional import avg_pool3d
+from tqdm import tqdm
+
+PYRAMID_DIR = "CT_pyramid"
+
+
+def pyramid_level_name(pool_size: list[int]) -> str:
+    return "x".join(str(p) for p in pool_size)
+
+
+def pyramid_level_dir(root: Path, pool_size: list[int]) -> Path:
+    return root / PYRAMID_DIR / pyramid_level_name(pool_size)
+
+
+def build_pyramid(root: Path, levels: list[list[int]]) -> None:
+    # every level is pooled from the full resolution, exactly as Pool3d does
+    data_root = root / "CT"
+    paths = [path for path in sorted(data_root.glob("**/*")) if path.is_file()]
+    for path in tqdm(paths, desc="building pyramid..."):
+        x = from_numpy(np.load(path)["arr_0"])
+        for pool_size in levels:
+            out = pyramid_level_dir(root, pool_size) / path.relative_to(data_root)
+            out.parent.mkdir(parents=True, exist_ok=True)
+            np.savez(out, avg_pool3d(x, pool_size).numpy())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", type=Path, default=Path("data"))
+    parser.add_argument(
+        "--levels",
+        type=str,
+        nargs="+",
+        default=["1x2x2", "1x4x4", "2x4x4"],
+    )
+    args = parser.parse_args()
+
+    build_pyramid(
+        args.root,
+        [[int(p) for p in level.split("x")] for level in args.levels],
+    )
@@ -1,24 +1,56 @@
+from collections import OrderedDict
+from typing import Protocol, runtime_checkable
+
 from torch import Tensor
 from torch.utils.data import Dataset
 
 
+@runtime_checkable
+class FrameAccessible(Protocol):
+    # whether get_frame is served from memory, without loading the sequence
+    def has_frame(self, index: int) -> bool: ...
+
+    def get_frame(self, index: int, frame: int) -> Tensor: ...
+
+
 class SeqDivideWrapper(Dataset):
     def __init__(
         self,
         base: Dataset,
         period: int,
+        cache_size: int = 4,
     ) -> None:
         super().__init__()
 
         self.base = base
         self.period = period
+        # sequences not in memory, best with batches grouped by sequence.
+        # 0 when the base draws random transforms, which every frame redraws
+        self.cache_size = cache_size
+        self.cache: OrderedDict[int, Tensor] = OrderedDict()
 
     def __len__(self) -> int:
         return len(self.base) * self.period  # type: ignore
 
+    def _get_sequence(self, index: int) -> Tensor:
+        if self.cache_size == 0:
+            return self.base[index]["xp"]
+        if index in self.cache:
+            self.cache.move_to_end(index)
+            return self.cache[index]
+        x = self.base[index]["xp"]
+        self.cache[index] = x
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return x
+
     def __getitem__(self, index: int) -> dict[str, Tensor]:
-        x = self.base[index // self.period]["xp"]
+        seq_index, frame = divmod(index, self.period)
+        if isinstance(self.base, FrameAccessible) and self.base.has_frame(seq_index):
+            x = self.base.get_frame(seq_index, frame)
+        else:
+            x = self._get_sequence(seq_index)[frame]
         return {
-            "x": x[index % self.period],
-            "t": x[index % self.period],
+            "x": x,
+            "t": x,
         }
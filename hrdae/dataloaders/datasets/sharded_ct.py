@@ -0,0 +1,226 @@
+import copy
+import random
+from dataclasses import dataclass
+from math import ceil
+from pathlib import Path
+from typing import Callable, Iterator
+
+import torch.distributed as dist
+from omegaconf import MISSING
+from torch import Tensor, int64, tensor
+from torch.utils.data import Dataset, IterableDataset, get_worker_info
+
+from ..transforms import Transform
+from .ct import CT, BasicSliceIndexer, assemble_ct_output
+from .option import DatasetOption
+from .volume_store import INDEX_FILE, VolumeStore, build_volume_store
+
+
+@dataclass
+class ShardedCTDatasetOption(DatasetOption):
+    root: Path = MISSING
+    slice_index: list[int] = MISSING
+    threshold: float = 0.1
+    min_occupancy: float = 0.2
+    content_phase: str = "all"
+    motion_phase: str = "0"
+    motion_aggregation: str = "concat"
+    shard_dir: str = ""  # default: root / "CT_shards"
+    shuffle_buffer: int = 16
+    seed: int = 0
+
+
+def create_sharded_ct_dataset(
+    opt: ShardedCTDatasetOption, transform: Transform, is_train: bool
+) -> Dataset:
+    slice_indexer: Callable[[Tensor], Tensor]
+    if len(opt.slice_index) == 0:
+        slice_indexer = BasicSliceIndexer(opt.threshold, opt.min_occupancy)
+    else:
+
+        def slice_indexer(_: Tensor) -> Tensor:
+            return tensor(opt.slice_index, dtype=int64)
+
+    return ShardedCT(
+        root=opt.root,
+        slice_indexer=slice_indexer,
+        transform=transform,
+        is_train=is_train,
+        content_phase=opt.content_phase,
+        motion_phase=opt.motion_phase,
+        motion_aggregation=opt.motion_aggregation,
+        shard_dir=Path(opt.shard_dir) if opt.shard_dir != "" else None,
+        shuffle=is_train,
+        shuffle_buffer=opt.shuffle_buffer,
+        seed=opt.seed,
+    )
+
+
+def build_shards(root: Path, shard_dir: Path, shard_size: int) -> None:
+    # same listing and split as CT
+    data_root = root / "CT"
+    splits: dict[str, list[Path]] = {"train": [], "test": []}
+    for i, path in enumerate(sorted(data_root.glob("**/*"))):
+        if not path.is_file():
+            continue
+        if i % (1 + CT.TRAIN_PER_TEST) != 0:
+            splits["train"].append(path)
+        else:
+            splits["test"].append(path)
+
+    for split, paths in splits.items():
+        for i in range(0, len(paths), shard_size):
+            build_volume_store(
+                paths[i : i + shard_size],
+                data_root,
+                shard_dir / split / f"{i // shard_size:05d}",
+            )
+
+
+def _num_replicas() -> tuple[int, int]:
+    if dist.is_available() and dist.is_initialized():
+        return dist.get_rank(), dist.get_world_size()
+    return 0, 1
+
+
+class ShardedCT(IterableDataset):
+    PERIOD = 10
+
+    def __init__(
+        self,
+        root: Path,
+        slice_indexer: Callable[[Tensor], Tensor],
+        transform: Transform | None = None,
+        is_train: bool = True,
+        content_phase: str = "all",
+        motion_phase: str = "0",
+        motion_aggregation: str = "concat",
+        shard_dir: Path | None = None,
+        shuffle: bool = True,
+        shuffle_buffer: int = 16,
+        seed: int = 0,
+    ) -> None:
+        super().__init__()
+
+        if shard_dir is None:
+            shard_dir = root / "CT_shards"
+        split_dir = shard_dir / ("train" if is_train else "test")
+        self.shards = sorted(
+            path for path in split_dir.iterdir() if (path / INDEX_FILE).exists()
+        )
+        self.sizes = [len(VolumeStore(shard)) for shard in self.shards]
+
+        self.slice_indexer = slice_indexer
+        self.transform = transform
+        self.content_phase = content_phase
+        self.motion_phase = motion_phase
+        self.motion_aggregation = motion_aggregation
+        self.shuffle = shuffle
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.epoch = 0
+        # read here, the loader workers are not in the process group
+        self.rank, self.world_size = _num_replicas()
+
+    def __len__(self) -> int:
+        # per rank, padded like DistributedSampler
+        return ceil(sum(self.sizes) / self.world_size)
+
+    def set_epoch(self, epoch: int) -> None:
+        # workers copy the dataset when they start, so the epoch reaches them
+        # unless they are persistent
+        self.epoch = epoch
+
+    def split(self, ratio: float) -> tuple["ShardedCT", "ShardedCT"]:
+        # splits at shard granularity
+        assert len(self.shards) > 1, "split needs at least two shards"
+        num_shards = min(max(round(ratio * len(self.shards)), 1), len(self.shards) - 1)
+        first, second = copy.copy(self), copy.copy(self)
+        first.shards, first.sizes = self.shards[:num_shards], self.sizes[:num_shards]
+        second.shards, second.sizes = self.shards[num_shards:], self.sizes[num_shards:]
+        second.shuffle = False
+        return first, second
+
+    def _assigned_samples(self) -> list[tuple[int, int]]:
+        rank, world_size = self.rank, self.world_size
+        worker_id, num_workers = 0, 1
+        info = get_worker_info()
+        if info is not None:
+            worker_id, num_workers = info.id, info.num_workers
+
+        order = list(range(len(self.shards)))
+        if self.shuffle:
+            # every worker and rank must draw the same order
+            random.Random(self.seed + self.epoch).shuffle(order)
+        # shards go round robin over the ranks, then every rank truncates or
+        # wraps around its own samples to the same count
+        samples = [
+            (i, j) for i in order[rank::world_size] for j in range(self.sizes[i])
+        ]
+        if len(samples) == 0:
+            # more ranks than shards, nothing to wrap around
+            return []
+        num_samples = len(self)
+        samples = (samples * ceil(num_samples / len(samples)))[:num_samples]
+        # contiguous chunks per worker, so shards are still read sequentially
+        start = worker_id * num_samples // num_workers
+        end = (worker_id + 1) * num_samples // num_workers
+        return samples[start:end]
+
+    def _volumes(self) -> Iterator[Tensor]:
+        opened, store, keys = -1, None, []
+        for i, j in self._assigned_samples():
+            if i != opened:
+                opened, store = i, VolumeStore(self.shards[i])
+                keys = list(store.entries)
+            assert store is not None
+            # sequential reads, copied out of the mapping
+            yield store[keys[j]].clone()
+
+    def _assemble(self, x_3d: Tensor) -> dict[str, Tensor]:
+        if self.transform is not None:
+            x_3d = self.transform(x_3d)
+        x_3d = x_3d.float()
+        n = x_3d.size(0)
+        assert n == self.PERIOD, f"expected {self.PERIOD} but got {n}"
+
+        return assemble_ct_output(
+            x_3d,
+            self.slice_indexer(x_3d),
+            self.content_phase,
+            self.motion_phase,
+            self.motion_aggregation,
+        )
+
+    def __iter__(self) -> Iterator[dict[str, Tensor]]:
+        buffer: list[Tensor] = []
+        for x in self._volumes():
+            if not self.shuffle or self.shuffle_buffer <= 1:
+                yield self._assemble(x)
+                continue
+            buffer.append(x)
+            if len(buffer) >= self.shuffle_buffer:
+                i = random.randrange(len(buffer))
+                buffer[i], buffer[-1] = buffer[-1], buffer[i]
+                yield self._assemble(buffer.pop())
+
+        if self.shuffle:
+            random.shuffle(buffer)
+        for x in buffer:
+            yield self._assemble(x)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", type=Path, default=Path("data"))
+    parser.add_argument("--out", type=Path, default=None)
+    parser.add_argument("--shard_size", type=int, default=64)
+    args = parser.parse_args()
+
+    build_shards(
+        args.root,
+        args.out if args.out is not None else args.root / "CT_shards",
+        args.shard_size,
+    )
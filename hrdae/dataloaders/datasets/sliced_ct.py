@@ -1,3 +1,4 @@
+from collections import OrderedDict
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Callable
@@ -9,6 +10,7 @@ from torch.utils.data import Dataset
 from ..transforms import Transform
 from .ct import CT
 from .option import DatasetOption
+from .transform_cache import TransformCache
 
 
 @dataclass
@@ -21,10 +23,21 @@ class SlicedCTDatasetOption(DatasetOption):
     motion_aggregation: str = "concat"
     slice_axis: str = "y"  # y or z
     slice_range: list[int] = MISSING
+    volume_store: str = ""
+    volume_cache_gb: float = 0.0  # 0: disabled
+    preload_workers: int = 0
+    preload_executor: str = "thread"  # "thread" | "process"
+    storage_dtype: str = ""  # "" (as loaded) | "float16" | "uint8"
+    manifest: str = ""
+    use_pyramid: bool = False
 
 
 def create_sliced_ct_dataset(
-    opt: SlicedCTDatasetOption, transform: Transform, is_train: bool
+    opt: SlicedCTDatasetOption,
+    transform: Transform,
+    is_train: bool,
+    cache: TransformCache | None = None,
+    pyramid_level: Path | None = None,
 ) -> Dataset:
     def slice_indexer(_: Tensor) -> Tensor:
         return tensor(opt.slice_index, dtype=int64)
@@ -40,6 +53,14 @@ def create_sliced_ct_dataset(
         motion_phase=opt.motion_phase,
         motion_aggregation=opt.motion_aggregation,
         slice_axis=opt.slice_axis,
+        volume_store=Path(opt.volume_store) if opt.volume_store != "" else None,
+        cache=cache,
+        volume_cache_bytes=int(opt.volume_cache_gb * 1024**3),
+        preload_workers=opt.preload_workers,
+        preload_executor=opt.preload_executor,
+        storage_dtype=opt.storage_dtype,
+        manifest=Path(opt.manifest) if opt.manifest != "" else None,
+        pyramid_level=pyramid_level,
     )
 
 
@@ -59,7 +80,21 @@ class SlicedCT(CT):
         motion_phase: str = "0",
         motion_aggregation: str = "concat",  # "concat" | "sum"
         slice_axis: str = "y",
+        volume_store: Path | None = None,
+        cache: TransformCache | None = None,
+        volume_cache_bytes: int = 0,  # 0: disabled
+        preload_workers: int = 0,
+        preload_executor: str = "thread",  # "thread" | "process"
+        storage_dtype: str = "",  # "" (as loaded) | "float16" | "uint8"
+        manifest: Path | None = None,
+        pyramid_level: Path | None = None,
     ) -> None:
+        # each DataLoader worker holds its own copy. the cache holds volumes
+        # before self.transform, so its stochastic transforms still run on
+        # every fetch. set before CT loads anything
+        self.volume_cache_bytes = volume_cache_bytes
+        self.volume_cache: OrderedDict[int, Tensor] = OrderedDict()
+        self.volume_cache_size = 0
         super().__init__(
             root=root,
             slice_indexer=slice_indexer,
@@ -69,15 +104,61 @@ class SlicedCT(CT):
             content_phase=content_phase,
             motion_phase=motion_phase,
             motion_aggregation=motion_aggregation,
+            volume_store=volume_store,
+            cache=cache,
+            preload_workers=preload_workers,
+            preload_executor=preload_executor,
+            storage_dtype=storage_dtype,
+            manifest=manifest,
+            pyramid_level=pyramid_level,
         )
         self.slice_axis = slice_axis
         assert len(slice_range) == 2
         self.slice_range = slice_range
         self.slice_num = slice_range[1] - slice_range[0]
 
+    def _load_cached(self, index: int) -> Tensor:
+        # volumes in memory are loaded once anyway
+        if self.in_memory or self.volume_cache_bytes == 0:
+            return super()._load_cached(index)
+        if index in self.volume_cache:
+            self.volume_cache.move_to_end(index)
+            return self.volume_cache[index]
+
+        x = super()._load_cached(index)
+        size = x.nelement() * x.element_size()
+        if size > self.volume_cache_bytes:
+            return x
+        self.volume_cache[index] = x
+        self.volume_cache_size += size
+        while self.volume_cache_size > self.volume_cache_bytes:
+            _, evicted = self.volume_cache.popitem(last=False)
+            self.volume_cache_size -= evicted.nelement() * evicted.element_size()
+        return x
+
     def __len__(self) -> int:
         return len(self.paths) * self.slice_num
 
+    def split_indices(self, split: str) -> list[int]:
+        return [
+            i * self.slice_num + j
+            for i in super().split_indices(split)
+            for j in range(self.slice_num)
+        ]
+
+    def has_frame(self, index: int) -> bool:
+        return self.in_memory or index // self.slice_num in self.volume_cache
+
+    def get_frame(self, index: int, frame: int) -> Tensor:
+        # (c, d | h, w), equal to self[index]["xp"][frame]
+        x = super().get_frame(index // self.slice_num, frame)
+        slice_index = index % self.slice_num + self.slice_range[0]
+        if self.slice_axis == "y":
+            return x[:, :, slice_index]
+        elif self.slice_axis == "z":
+            return x[:, slice_index]
+        raise KeyError(f"unknown slice axis {self.slice_axis}")
+
     def __getitem__(self, index: int) -> dict[str, Tensor]:
         output = super().__getitem__(index // self.slice_num)
         assert "xm" in output  # (n, _, d, h)
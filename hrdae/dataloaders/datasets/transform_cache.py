@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from dataclasses import asdict
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+from torch import Tensor, from_numpy, int64, zeros
+
+from ..transforms import Transform, TransformOption
+
+
+def transform_config_key(opts: list[TransformOption]) -> str:
+    return json.dumps(
+        [{"name": opt.__class__.__name__, **asdict(opt)} for opt in opts],
+        sort_keys=True,
+        default=str,
+    )
+
+
+class TransformCache:
+    def __init__(
+        self,
+        cache_dir: Path,
+        transform: Transform,
+        config_key: str,
+        max_bytes: int = 0,  # 0: unlimited
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.transform = transform
+        self.config_key = config_key
+        self.max_bytes = max_bytes
+        # (hits, misses), shared with the DataLoader workers so that the main
+        # process sees the lookups they serve. unlocked, so concurrent
+        # workers may rarely lose a count
+        self._counts = zeros(2, dtype=int64).share_memory_()
+        # entry sizes in least-recently-used order, scanned from disk once
+        # per process. entries written by other workers are not counted
+        self._entries: OrderedDict[Path, int] | None = None
+        self._total_bytes = 0
+
+    @property
+    def hits(self) -> int:
+        return int(self._counts[0])
+
+    @property
+    def misses(self) -> int:
+        return int(self._counts[1])
+
+    def pop_stats(self) -> dict[str, int]:
+        # lookups since the last call
+        stats = {"hits": self.hits, "misses": self.misses}
+        self._counts.zero_()
+        return stats
+
+    def __call__(self, source: Path, load: Callable[[], Tensor]) -> Tensor:
+        path = self.cache_dir / f"{self._key(source)}.npy"
+        try:
+            x = np.load(path)
+        except (FileNotFoundError, ValueError, EOFError):
+            pass
+        else:
+            # touch the entry so that eviction is least-recently-used
+            os.utime(path)
+            if self._entries is not None and path in self._entries:
+                self._entries.move_to_end(path)
+            self._counts[0] += 1
+            return from_numpy(x)
+
+        self._counts[1] += 1
+        t = self.transform(load())
+        self._put(path, t)
+        return t
+
+    def _key(self, source: Path) -> str:
+        stat = source.stat()
+        fingerprint = (
+            f"{source.resolve()}:{stat.st_size}:{stat.st_mtime_ns}:{self.config_key}"
+        )
+        return hashlib.sha1(fingerprint.encode()).hexdigest()
+
+    def _put(self, path: Path, x: Tensor) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, x.numpy())
+        # atomic, so concurrent workers never read a partial entry
+        os.replace(tmp, path)
+        if self.max_bytes > 0:
+            self._account(path)
+            self._evict()
+
+    def _scan(self) -> OrderedDict[Path, int]:
+        entries = []
+        for path in self.cache_dir.glob("*.npy"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        self._total_bytes = sum(size for _, size, _ in entries)
+        return OrderedDict((path, size) for _, size, path in sorted(entries))
+
+    def _account(self, path: Path) -> None:
+        if self._entries is None:
+            # the scan already includes the new entry
+            self._entries = self._scan()
+            return
+        size = path.stat().st_size
+        self._total_bytes += size - self._entries.pop(path, 0)
+        self._entries[path] = size
+
+    def _evict(self) -> None:
+        assert self._entries is not None
+        while self._total_bytes > self.max_bytes and len(self._entries) > 0:
+            path, size = self._entries.popitem(last=False)
+            path.unlink(missing_ok=True)
+            self._total_bytes -= size
+
+
+def pop_cache_stats(caches: list[TransformCache]) -> dict[str, int]:
+    stats = {"hits": 0, "misses": 0}
+    for cache in caches:
+        for k, v in cache.pop_stats().items():
+            stats[k] += v
+    return stats
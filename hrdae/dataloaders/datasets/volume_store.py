@@ -0,0 +1,107 @@
+import json
+import warnings
+from math import prod
+from pathlib import Path
+
+import numpy as np
+from torch import Tensor, from_numpy
+from tqdm import tqdm
+
+INDEX_FILE = "index.json"
+DATA_FILE = "volumes.npy"
+
+
+def _read_npz_header(path: Path) -> tuple[tuple[int, ...], np.dtype]:
+    # only the .npy header of arr_0 is inflated, not the whole volume
+    with np.load(path) as npz, npz.zip.open("arr_0.npy") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+    return shape, dtype
+
+
+def build_volume_store(paths: list[Path], data_root: Path, store_dir: Path) -> None:
+    headers = [_read_npz_header(path) for path in paths]
+    dtype = np.result_type(*[dtype for _, dtype in headers])
+
+    entries = []
+    offset = 0
+    for path, (shape, _) in zip(paths, headers):
+        entries.append(
+            {
+                "path": path.relative_to(data_root).as_posix(),
+                "offset": offset,
+                "shape": list(shape),
+            }
+        )
+        offset += prod(shape)
+
+    store_dir.mkdir(parents=True, exist_ok=True)
+    data = np.lib.format.open_memmap(
+        store_dir / DATA_FILE, mode="w+", dtype=dtype, shape=(offset,)
+    )
+    for path, entry in tqdm(list(zip(paths, entries)), desc="building volume store..."):
+        size = prod(entry["shape"])
+        data[entry["offset"] : entry["offset"] + size] = np.load(path)["arr_0"].reshape(
+            -1
+        )
+    data.flush()
+    del data
+
+    with open(store_dir / INDEX_FILE, "w") as f:
+        json.dump({"dtype": dtype.str, "entries": entries}, f, indent=2)
+
+
+class VolumeStore:
+    def __init__(self, store_dir: Path) -> None:
+        with open(store_dir / INDEX_FILE) as f:
+            index = json.load(f)
+        self.store_dir = store_dir
+        self.entries: dict[str, tuple[int, tuple[int, ...]]] = {
+            e["path"]: (e["offset"], tuple(e["shape"])) for e in index["entries"]
+        }
+        self._data: np.ndarray | None = None
+
+    @property
+    def data(self) -> np.ndarray:
+        # opened lazily so that every DataLoader worker maps the file itself
+        if self._data is None:
+            self._data = np.load(self.store_dir / DATA_FILE, mmap_mode="r")
+        return self._data
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_data"] = None
+        return state
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __getitem__(self, key: str) -> Tensor:
+        offset, shape = self.entries[key]
+        x = self.data[offset : offset + prod(shape)].reshape(shape)
+        with warnings.catch_warnings():
+            # the mapping is read-only; transforms never write in place
+            warnings.simplefilter("ignore", UserWarning)
+            return from_numpy(x)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", type=Path, default=Path("data"))
+    parser.add_argument("--out", type=Path, default=None)
+    args = parser.parse_args()
+
+    data_root = args.root / "CT"
+    build_volume_store(
+        [path for path in sorted(data_root.glob("**/*")) if path.is_file()],
+        data_root,
+        args.out if args.out is not None else args.root / "CT_store",
+    )
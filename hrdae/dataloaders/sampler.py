@@ -0,0 +1,40 @@
+import random
+from typing import Iterator
+
+from torch.utils.data import Sampler
+
+
+class VolumeGroupedBatchSampler(Sampler[list[int]]):
+    def __init__(
+        self,
+        volume_indices: list[int],  # source volume of each dataset index
+        batch_size: int,
+        shuffle: bool = True,
+        drop_last: bool = False,
+    ) -> None:
+        self.groups: dict[int, list[int]] = {}
+        for index, volume_index in enumerate(volume_indices):
+            self.groups.setdefault(volume_index, []).append(index)
+        self.num_samples = len(volume_indices)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+
+    def __iter__(self) -> Iterator[list[int]]:
+        # volumes are visited in random order, the slices of one volume
+        # are consecutive so that a single decode serves all of them
+        groups = list(self.groups.values())
+        if self.shuffle:
+            groups = random.sample(groups, len(groups))
+            groups = [random.sample(g, len(g)) for g in groups]
+        indices = [index for group in groups for index in group]
+        for i in range(0, len(indices), self.batch_size):
+            batch = indices[i : i + self.batch_size]
+            if self.drop_last and len(batch) < self.batch_size:
+                break
+            yield batch
+
+    def __len__(self) -> int:
+        if self.drop_last:
+            return self.num_samples // self.batch_size
+        return (self.num_samples + self.batch_size - 1) // self.batch_size
@@ -3,11 +3,20 @@ from dataclasses import dataclass
 from omegaconf import MISSING
 from torchvision import transforms
 
+from .batch_random_shift import (
+    BatchRandomShift,
+    BatchRandomShift2dOption,
+    BatchRandomShift3dOption,
+    create_batch_random_shift2d,
+    create_batch_random_shift3d,
+)
 from .normalization import MinMaxNormalization, MinMaxNormalizationOption
 from .option import TransformOption
 from .pool import Pool2dOption, Pool3dOption, create_pool2d, create_pool3d
 from .random_shift import (
+    RandomShift2d,
     RandomShift2dOption,
+    RandomShift3d,
     RandomShift3dOption,
     create_random_shift2d,
     create_random_shift3d,
@@ -37,6 +46,34 @@ class Crop2dOption(TransformOption):
     crop_size: int = MISSING
 
 
+def is_deterministic(opt: TransformOption) -> bool:
+    return not isinstance(
+        opt,
+        (
+            Crop2dOption,
+            RandomShift2dOption,
+            RandomShift3dOption,
+            BatchRandomShift2dOption,
+            BatchRandomShift3dOption,
+        ),
+    )
+
+
+def is_stochastic(transform: Transform) -> bool:
+    # the counterpart of is_deterministic for built transforms
+    if isinstance(transform, transforms.Compose):
+        return any(is_stochastic(t) for t in transform.transforms)
+    return isinstance(
+        transform,
+        (
+            transforms.RandomCrop,
+            RandomShift2d,
+            RandomShift3d,
+            BatchRandomShift,
+        ),
+    )
+
+
 def create_transform(opt: TransformOption) -> Transform:
     if isinstance(opt, ToTensorOption) and type(opt) is ToTensorOption:
         return transforms.ToTensor()
@@ -55,6 +92,16 @@ def create_transform(opt: TransformOption) -> Transform:
         return create_random_shift2d(opt)
     if isinstance(opt, RandomShift3dOption) and type(opt) is RandomShift3dOption:
         return create_random_shift3d(opt)
+    if (
+        isinstance(opt, BatchRandomShift2dOption)
+        and type(opt) is BatchRandomShift2dOption
+    ):
+        return create_batch_random_shift2d(opt)
+    if (
+        isinstance(opt, BatchRandomShift3dOption)
+        and type(opt) is BatchRandomShift3dOption
+    ):
+        return create_batch_random_shift3d(opt)
     if isinstance(opt, UniformShape3dOption) and type(opt) is UniformShape3dOption:
         return create_uniform_shape3d(opt)
     if isinstance(opt, Pool2dOption) and type(opt) is Pool2dOption:
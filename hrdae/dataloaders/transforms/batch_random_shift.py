@@ -0,0 +1,84 @@
+from dataclasses import dataclass, field
+
+import torch
+from torch import Tensor
+
+from .option import TransformOption
+from .typing import Transform
+
+
+@dataclass
+class BatchRandomShift2dOption(TransformOption):
+    # (w, h), w stays unshifted in batches with motion slices
+    max_shifts: list[int] = field(default_factory=lambda: [10, 10])
+
+
+@dataclass
+class BatchRandomShift3dOption(TransformOption):
+    # (d, w, h), w stays unshifted in batches with motion slices
+    max_shifts: list[int] = field(default_factory=lambda: [5, 30, 30])
+
+
+def create_batch_random_shift2d(opt: BatchRandomShift2dOption) -> Transform:
+    dx, dy = opt.max_shifts
+    return BatchRandomShift([dy, dx])
+
+
+def create_batch_random_shift3d(opt: BatchRandomShift3dOption) -> Transform:
+    dz, dx, dy = opt.max_shifts
+    return BatchRandomShift([dz, dy, dx])
+
+
+def batch_shift(x: Tensor, shifts: Tensor, fill: Tensor) -> Tensor:
+    # x: (b, ..., *spatial), shifts: (b, k) for the last k dims, fill: (b,)
+    b, k = shifts.size()
+    spatial = x.size()[-k:]
+    # (b, ..., *spatial) -> (b, *spatial, m)
+    x_ = x.reshape(b, -1, *spatial).movedim(1, -1)
+
+    index: list[Tensor] = [torch.arange(b, device=x.device).view(-1, *(1,) * k)]
+    valid = torch.ones((b,) + (1,) * k, dtype=torch.bool, device=x.device)
+    for j, size in enumerate(spatial):
+        view = [b] + [1] * k
+        view[1 + j] = size
+        src = torch.arange(size, device=x.device) - shifts[:, j : j + 1]
+        valid = valid & ((src >= 0) & (src < size)).view(view)
+        index.append(src.clamp(0, size - 1).view(view))
+
+    # a single gather for all axes, then fill what was shifted in
+    y = x_[tuple(index)]
+    y = torch.where(valid.unsqueeze(-1), y, fill.view(-1, *(1,) * (k + 1)).to(y))
+    return y.movedim(-1, 1).reshape(x.size())
+
+
+class BatchRandomShift:
+    def __init__(self, ds: list[int]) -> None:
+        self.ds = ds
+        self.shifts: Tensor | None = None
+
+    def sample(self, batch_size: int, device: torch.device) -> Tensor:
+        max_shifts = torch.tensor(self.ds, device=device)
+        u = torch.rand(batch_size, len(self.ds), device=device)
+        return (u * (2 * max_shifts + 1)).floor().long() - max_shifts
+
+    def __call__(self, batch: dict[str, Tensor]) -> dict[str, Tensor]:
+        xp = batch["xp"]  # (b, n, c, *spatial)
+        k = len(self.ds)
+        self.shifts = self.sample(xp.size(0), xp.device)
+        if any(key.startswith("xm") for key in batch):
+            # the motion slices are fixed planes of the last axis. a shift
+            # along it would need planes that were never sliced, so the
+            # volume stays put there and xm remains the slice of the new xp
+            self.shifts[:, -1] = 0
+        fill = xp.flatten(1).amin(dim=1)
+
+        output = {}
+        for key, x in batch.items():
+            if key.startswith("xp"):
+                output[key] = batch_shift(x, self.shifts, fill)
+            elif key.startswith("xm"):
+                # motion slices lack the last (sliced) axis
+                output[key] = batch_shift(x, self.shifts[:, : k - 1], fill)
+            else:
+                output[key] = x
+        return output
@@ -0,0 +1,101 @@
+import os
+from contextlib import AbstractContextManager, nullcontext
+from typing import Any
+
+import torch
+import torch.distributed as dist
+from torch import Tensor, nn
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DataLoader, DistributedSampler
+
+
+def is_distributed() -> bool:
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank() -> int:
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size() -> int:
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process() -> bool:
+    return get_rank() == 0
+
+
+def init_process_group(rank: int, world_size: int, master_port: int) -> None:
+    os.environ.setdefault("MASTER_ADDR", "127.0.0.1")
+    os.environ["MASTER_PORT"] = str(master_port)
+    # nccl needs one gpu per process, otherwise fall back to gloo
+    if torch.cuda.is_available() and torch.cuda.device_count() >= world_size:
+        backend = "nccl"
+        torch.cuda.set_device(rank)
+    else:
+        backend = "gloo"
+    dist.init_process_group(backend, rank=rank, world_size=world_size)
+
+
+def destroy_process_group() -> None:
+    if is_distributed():
+        dist.destroy_process_group()
+
+
+def get_device() -> torch.device:
+    if not torch.cuda.is_available():
+        return torch.device("cpu")
+    if is_distributed() and dist.get_backend() == "nccl":
+        return torch.device(f"cuda:{get_rank()}")
+    return torch.device("cuda:0")
+
+
+def wrap_model(module: nn.Module, device: torch.device) -> nn.Module:
+    if is_distributed():
+        module = module.to(device)
+        return DistributedDataParallel(
+            module,
+            device_ids=[device.index] if device.type == "cuda" else None,
+        )
+    if device.type == "cuda":
+        return nn.DataParallel(module).to(device)
+    return module
+
+
+def unwrap_model(module: nn.Module) -> nn.Module:
+    if isinstance(module, (nn.DataParallel, DistributedDataParallel)):
+        return module.module
+    return module
+
+
+def sync_gradients(module: nn.Module, sync: bool) -> AbstractContextManager:
+    # skips the all-reduce on accumulation steps that do not update
+    if not sync and isinstance(module, DistributedDataParallel):
+        return module.no_sync()
+    return nullcontext()
+
+
+def all_reduce_mean(t: Tensor) -> Tensor:
+    if not is_distributed():
+        return t
+    t = t.clone()
+    dist.all_reduce(t)
+    return t / get_world_size()
+
+
+def all_gather_object(obj: Any) -> list[Any]:
+    # the obj of every rank, in rank order
+    if not is_distributed():
+        return [obj]
+    objs: list[Any] = [None] * get_world_size()
+    dist.all_gather_object(objs, obj)
+    return objs
+
+
+def set_epoch(loader: DataLoader, epoch: int) -> None:
+    # reshuffles DistributedSampler differently every epoch
+    if isinstance(loader.sampler, DistributedSampler):
+        loader.sampler.set_epoch(epoch)
+    # iterable datasets shuffle themselves, e.g. ShardedCT
+    if hasattr(loader.dataset, "set_epoch"):
+        loader.dataset.set_epoch(epoch)
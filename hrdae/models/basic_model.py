@@ -1,19 +1,23 @@
-import json
 from dataclasses import dataclass
+from math import ceil
 from pathlib import Path
+from typing import Any
 
 import torch
 from omegaconf import MISSING
-from torch import nn, tensor
+from torch import Tensor, nn
 from torch.optim.optimizer import Optimizer
 from torch.utils.data import DataLoader
 
-from .functions import save_model, save_reconstructed_images
+from ..distributed import get_device, unwrap_model, wrap_model
+from .functions import create_grad_scaler, save_model
 from .losses import LossMixer, LossOption, create_loss
+from .metrics import loss_terms
 from .networks import NetworkOption, create_network
 from .optimizers import OptimizerOption, create_optimizer
 from .option import ModelOption
 from .schedulers import LRScheduler, SchedulerOption, create_scheduler
+from .trainer import Hook, Stage, Trainer, TrainStep
 from .typing import Model
 
 
@@ -29,7 +33,7 @@ class BasicModelOption(ModelOption):
     serialize: bool = False
 
 
-class BasicModel(Model):
+class BasicModel(Model, TrainStep):
     def __init__(
         self,
         network: nn.Module,
@@ -38,6 +42,16 @@ class BasicModel(Model):
         scheduler: LRScheduler,
         criterion: nn.Module,
         serialize: bool = False,
+        amp: str = "none",
+        grad_accum_steps: int = 1,
+        micro_batch_size: int = 0,
+        resume_from: str = "",
+        keep_last_checkpoints: int = 3,
+        image_workers: int = 2,
+        save_raw_images: bool = False,
+        val_every_n_epochs: int = 1,
+        val_subset_size: int = 0,
+        early_stopping_patience: int = 0,
     ) -> None:
         self.network = network
         self.optimizer = optimizer
@@ -48,13 +62,37 @@ class BasicModel(Model):
         if network_weight != "":
             self.network.load_state_dict(torch.load(network_weight))
 
-        if torch.cuda.is_available():
+        self.device = get_device()
+        if self.device.type == "cuda":
             print("GPU is enabled")
-            self.device = torch.device("cuda:0")
-            self.network = nn.DataParallel(network).to(self.device)
         else:
             print("GPU is not enabled")
-            self.device = torch.device("cpu")
+        self.network = wrap_model(network, self.device)
+        self.scaler = create_grad_scaler(amp)
+
+        self.stages = [
+            Stage(
+                "loss",
+                self._loss,
+                [self.network],
+                self.optimizer,
+                self.scheduler,
+                self.scaler,
+            )
+        ]
+        self.trainer = Trainer(
+            self,
+            amp,
+            grad_accum_steps,
+            micro_batch_size,
+            resume_from,
+            keep_last_checkpoints,
+            image_workers,
+            save_raw_images,
+            val_every_n_epochs,
+            val_subset_size,
+            early_stopping_patience,
+        )
 
     def train(
         self,
@@ -63,135 +101,58 @@ class BasicModel(Model):
         n_epoch: int,
         result_dir: Path,
         debug: bool,
+        hooks: list[Hook] | None = None,
     ) -> float:
-        max_iter = None
-        if debug:
-            max_iter = 5
-
         self.network.to(self.device)
+        return self.trainer.fit(
+            train_loader, val_loader, n_epoch, result_dir, debug, hooks
+        )
 
-        least_val_loss = float("inf")
-        training_history: dict[str, list[dict[str, int | float]]] = {"history": []}
-
-        for epoch in range(n_epoch):
-            self.network.train()
-            running_loss = 0.0
-
-            for idx, data in enumerate(train_loader):
-                if max_iter and max_iter <= idx:
-                    break
-
-                x = data["xp"].to(self.device)
-                t = data["xp"].to(self.device)
-
-                b, n = x.size()[:2]
-
-                self.optimizer.zero_grad()
-                if self.serialize:
-                    x = x.reshape(b * n, *x.size()[2:])
-                y, z = self.network(x)
-                if self.serialize:
-                    y = y.reshape(b, n, *y.size()[1:])
-                    z = z.reshape(b, n, *z.size()[1:])
-
-                loss = self.criterion(y, t, latent=z)
-                loss.backward()
-                self.optimizer.step()
-
-                running_loss += loss.item()
-
-                if idx % 100 == 0:
-                    print(f"Epoch: {epoch+1}, Batch: {idx} Loss: {loss.item():.6f}")
-
-            running_loss /= len(train_loader)
-            print(f"Epoch: {epoch+1}, Average Loss: {running_loss:.6f}")
-
-            self.scheduler.step()
-
-            self.network.eval()
-            with torch.no_grad():
-                total_val_loss = 0.0
-                t = tensor([0.0], device=self.device)
-                y = tensor([0.0], device=self.device)
-                for idx, data in enumerate(val_loader):
-                    if max_iter and max_iter <= idx:
-                        break
-
-                    x = data["xp"].to(self.device)
-                    t = data["xp"].to(self.device)
-
-                    b, n = x.size()[:2]
-
-                    if self.serialize:
-                        x = x.reshape(b * n, *x.size()[2:])
-                    y, z = self.network(x)
-                    if self.serialize:
-                        y = y.reshape(b, n, *y.size()[1:])
-                        z = z.reshape(b, n, *z.size()[1:])
-
-                    loss = self.criterion(y, t, latent=z)
-                    total_val_loss += loss.item()
-
-                avg_val_loss = total_val_loss / len(val_loader)
-                print(f"Epoch: {epoch+1}, Val Loss: {avg_val_loss:.6f}")
-
-                if avg_val_loss < least_val_loss:
-                    least_val_loss = avg_val_loss
-                    save_reconstructed_images(
-                        t.data.cpu().clone().detach().numpy()[:10],
-                        y.data.cpu().clone().detach().numpy()[:10],
-                        "best",
-                        result_dir / "logs" / "reconstructed",
-                    )
-                    _save_model(
-                        self.network,
-                        result_dir / "weights",
-                        "best",
-                    )
-
-            training_history["history"].append(
-                {
-                    "epoch": int(epoch + 1),
-                    "train_loss": float(running_loss),
-                    "val_loss": float(avg_val_loss),
-                }
-            )
-
-            with open(result_dir / "training_history.json", "w") as f:
-                json.dump(training_history, f)
-
-            if epoch % 10 == 0:
-                data = next(iter(val_loader))
-
-                x = data["xp"].to(self.device)
-                t = data["xp"].to(self.device)
-
-                b, n = x.size()[:2]
-
-                if self.serialize:
-                    x = x.reshape(b * n, *x.size()[2:])
-                y, _ = self.network(x)
-                if self.serialize:
-                    y = y.reshape(b, n, *y.size()[1:])
-
-                save_reconstructed_images(
-                    t.data.cpu().clone().detach().numpy()[:10],
-                    y.data.cpu().clone().detach().numpy()[:10],
-                    f"epoch_{epoch}",
-                    result_dir / "logs" / "reconstructed",
-                )
-                _save_model(
-                    self.network,
-                    result_dir / "weights",
-                    f"epoch_{epoch}",
-                )
-
-        return least_val_loss
+    def _forward(
+        self, network: nn.Module, data: dict[str, Any]
+    ) -> tuple[Tensor, Tensor, Tensor]:
+        x = data["xp"].to(self.device)
+        t = data["xp"].to(self.device)
+
+        b, n = x.size()[:2]
+
+        if self.serialize:
+            x = x.reshape(b * n, *x.size()[2:])
+        y, z = network(x)
+        if self.serialize:
+            y = y.reshape(b, n, *y.size()[1:])
+            z = z.reshape(b, n, *z.size()[1:])
+        return t, y, z
+
+    def _loss(self, data: dict[str, Any]) -> dict[str, Tensor]:
+        return self.val_step(data)[0]
+
+    def val_step(
+        self, data: dict[str, Any]
+    ) -> tuple[dict[str, Tensor], Tensor, Tensor]:
+        t, y, z = self._forward(self.network, data)
+        loss = self.criterion(y, t, latent=z)
+        return {"loss": loss} | loss_terms(self.criterion, "loss"), t, y
+
+    def reconstruct(self, data: dict[str, Any]) -> tuple[Tensor, Tensor]:
+        # plain module, so rank 0 runs it without the other ranks
+        t, y, _ = self._forward(unwrap_model(self.network), data)
+        return t, y
+
+    def save_weights(self, result_dir: Path, name: str) -> None:
+        _save_model(self.network, result_dir / "weights", name)
+
+    def components(self) -> dict[str, Any]:
+        return {
+            "network": unwrap_model(self.network),
+            "optimizer": self.optimizer,
+            "scheduler": self.scheduler,
+            "scaler": self.scaler,
+        }
 
 
 def _save_model(module: nn.Module, save_dir: Path, name: str) -> None:
-    if isinstance(module, nn.DataParallel):
-        module = module.module
+    module = unwrap_model(module)
     if hasattr(module, "encoder"):
         save_model(
             module.encoder,
@@ -222,11 +183,26 @@ def create_basic_model(
         opt.scheduler,
         optimizer,
         n_epoch,
-        steps_per_epoch,
+        ceil(steps_per_epoch / opt.grad_accum_steps),
     )
     criterion = LossMixer(
         {k: create_loss(v) for k, v in opt.loss.items()}, opt.loss_coef
     )
     return BasicModel(
-        network, opt.network_weight, optimizer, scheduler, criterion, opt.serialize
+        network,
+        opt.network_weight,
+        optimizer,
+        scheduler,
+        criterion,
+        opt.serialize,
+        opt.amp,
+        opt.grad_accum_steps,
+        opt.micro_batch_size,
+        opt.resume_from,
+        opt.keep_last_checkpoints,
+        opt.image_workers,
+        opt.save_raw_images,
+        opt.val_every_n_epochs,
+        opt.val_subset_size,
+        opt.early_stopping_patience,
     )
@@ -0,0 +1,146 @@
+import os
+import random
+import shutil
+from pathlib import Path
+from queue import Queue
+from threading import Thread
+from typing import Any
+
+import numpy as np
+import torch
+from torch import Tensor
+
+from ..distributed import get_rank, is_main_process
+
+BEST_CHECKPOINT = "best.pt"
+
+
+def _snapshot(obj: Any) -> Any:
+    # copies every tensor to cpu, so training can keep mutating the originals
+    if isinstance(obj, Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: _snapshot(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_snapshot(v) for v in obj)
+    return obj
+
+
+def capture_rng_state() -> dict[str, Any]:
+    return {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+        "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else [],
+    }
+
+
+def restore_rng_state(state: dict[str, Any]) -> None:
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if torch.cuda.is_available() and len(state["cuda"]) > 0:
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+def training_state(
+    epoch: int,
+    components: dict[str, Any],
+    least_val_loss: float,
+    training_history: dict[str, Any],
+    rng_states: list[dict[str, Any]],
+) -> dict[str, Any]:
+    return {
+        "epoch": epoch,
+        "components": {k: v.state_dict() for k, v in components.items()},
+        # one per rank, from all_gather_object(capture_rng_state())
+        "rng": rng_states,
+        "least_val_loss": least_val_loss,
+        "training_history": training_history,
+    }
+
+
+def load_training_state(
+    path: Path,
+    components: dict[str, Any],
+) -> tuple[int, float, dict[str, Any]]:
+    # returns the epoch to start from, the best val loss and the history so far
+    state = torch.load(path, map_location="cpu", weights_only=False)
+    for k, v in components.items():
+        v.load_state_dict(state["components"][k])
+    # a run resumed on fewer or more ranks reuses the saved states in turn
+    restore_rng_state(state["rng"][get_rank() % len(state["rng"])])
+    if is_main_process():
+        print(f"resumed from {path} (epoch {state['epoch'] + 1})")
+    return (
+        state["epoch"] + 1,
+        state["least_val_loss"],
+        state["training_history"],
+    )
+
+
+class CheckpointWriter:
+    def __init__(self, save_dir: Path, keep_last: int = 3) -> None:
+        self.save_dir = save_dir
+        self.keep_last = keep_last
+        self.error: BaseException | None = None
+        self.queue: Queue[tuple[str, dict[str, Any], bool] | None] = Queue()
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def save(self, name: str, state: dict[str, Any], is_best: bool = False) -> None:
+        if self.error is not None:
+            raise self.error
+        # only the device -> cpu copy happens on the training thread
+        self.queue.put((name, _snapshot(state), is_best))
+
+    def flush(self) -> None:
+        self.queue.join()
+        if self.error is not None:
+            raise self.error
+
+    def close(self) -> None:
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                if self.error is None:
+                    self._write(*item)
+            except BaseException as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def _write(self, name: str, state: dict[str, Any], is_best: bool) -> None:
+        self.save_dir.mkdir(parents=True, exist_ok=True)
+        path = self.save_dir / name
+        _atomic_save(state, path)
+        if is_best:
+            tmp = path.with_name(f"{BEST_CHECKPOINT}.tmp")
+            shutil.copyfile(path, tmp)
+            os.replace(tmp, self.save_dir / BEST_CHECKPOINT)
+        self._prune()
+
+    def _prune(self) -> None:
+        if self.keep_last <= 0:
+            return
+        # names are zero-padded epochs, so they sort chronologically
+        paths = sorted(
+            p for p in self.save_dir.glob("*.pt") if p.name != BEST_CHECKPOINT
+        )
+        for path in paths[: -self.keep_last]:
+            path.unlink(missing_ok=True)
+
+
+def _atomic_save(state: dict[str, Any], path: Path) -> None:
+    tmp = path.with_name(f"{path.name}.tmp")
+    torch.save(state, tmp)
+    # a preempted write never leaves a truncated checkpoint behind
+    os.replace(tmp, path)
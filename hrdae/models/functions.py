@@ -1,67 +1,27 @@
+from contextlib import AbstractContextManager, nullcontext
+from math import ceil
 from pathlib import Path
+from typing import Any
 
-import matplotlib.pyplot as plt
 import numpy as np
 import torch
 from torch import Tensor, nn
 
+from ..distributed import unwrap_model
+from .image_writer import ImageWriter
 
-def _save_images(
+
+def save_reconstructed_images(
     original: np.ndarray,
     reconstructed: np.ndarray,
+    name: str,
     save_dir: Path,
-    basename: str,
-) -> None:
-    save_dir.mkdir(parents=True, exist_ok=True)
-
-    # single image
-    for i in range(10):
-        if i >= len(original):
-            break
-        for image, name in zip(
-            [original, reconstructed],
-            ["original", "reconstructed"],
-        ):
-            save_path = save_dir / f"{basename}_{name}_{i}.png"
-
-            plt.figure(figsize=(5, 5))
-            plt.imshow(np.squeeze(image[i]), cmap="gray")
-            plt.axis("off")
-            plt.savefig(save_path)
-            plt.close()
-
-    # concatenated image
-    # (b, 1, h, w)
-    plt.figure(figsize=(20, 4))
-
-    # Original Images
-    for i in range(10):
-        if i >= len(original):
-            break
-        plt.subplot(2, 10, i + 1)
-        plt.imshow(np.squeeze(original[i]), cmap="gray")
-        plt.title("Original")
-        plt.axis("off")
-
-    # Reconstructed Images
-    for i in range(10):
-        if i >= len(reconstructed):
-            break
-        plt.subplot(2, 10, i + 11)
-        plt.imshow(np.squeeze(reconstructed[i]), cmap="gray")
-        plt.title("Reconstructed")
-        plt.axis("off")
-
-    # 保存するファイル名を設定
-    plt.savefig(save_dir / f"{basename}.png")
-    plt.close()
-
-
-def save_reconstructed_images(
-    original: np.ndarray, reconstructed: np.ndarray, name: str, save_dir: Path
+    writer: ImageWriter | None = None,
 ):
+    if writer is None:
+        writer = ImageWriter(num_workers=0)
     if len(original.shape) == 4:
-        _save_images(
+        writer.submit(
             original,
             reconstructed,
             save_dir,
@@ -70,7 +30,7 @@ def save_reconstructed_images(
     elif len(original.shape) == 5:
         b, _, _, _, _ = original.shape
         for bi in range(b):
-            _save_images(
+            writer.submit(
                 original[bi],  # (t, 1, h, w)
                 reconstructed[bi],  # (t, 1, h, w)
                 save_dir,
@@ -79,19 +39,19 @@ def save_reconstructed_images(
     elif len(original.shape) == 6:
         b, _, _, d, h, w = original.shape
         for bi in range(b):
-            _save_images(
+            writer.submit(
                 original[bi, :, :, :, :, w // 2],  # (t, 1, d, h)
                 reconstructed[bi, :, :, :, :, w // 2],  # (t, 1, d, h)
                 save_dir,
                 f"{name}_batch_{bi}_axis_x",
             )
-            _save_images(
+            writer.submit(
                 original[bi, :, :, :, h // 2],  # (t, 1, d, w)
                 reconstructed[bi, :, :, :, h // 2],  # (t, 1, d, w)
                 save_dir,
                 f"{name}_batch_{bi}_axis_y",
             )
-            _save_images(
+            writer.submit(
                 original[bi, :, :, d // 2],  # (t, 1, h, w)
                 reconstructed[bi, :, :, d // 2],  # (t, 1, h, w)
                 save_dir,
@@ -103,8 +63,7 @@ def save_reconstructed_images(
 
 def save_model(model: nn.Module, filepath: Path):
     filepath.parent.mkdir(parents=True, exist_ok=True)
-    model_to_save = model.module if isinstance(model, nn.DataParallel) else model
-    torch.save(model_to_save.state_dict(), filepath)
+    torch.save(unwrap_model(model).state_dict(), filepath)
 
 
 def shuffled_indices(length: int) -> Tensor:
@@ -113,3 +72,38 @@ def shuffled_indices(length: int) -> Tensor:
         choices = torch.cat([torch.arange(0, i), torch.arange(i + 1, length)])
         indices[i] = choices[torch.randint(len(choices), (1,))]
     return indices
+
+
+def autocast(device: torch.device, amp: str) -> AbstractContextManager:
+    if amp == "none":
+        return nullcontext()
+    if amp == "bf16":
+        return torch.autocast(device.type, dtype=torch.bfloat16)
+    if amp == "fp16":
+        assert device.type == "cuda", "fp16 autocast requires cuda, use bf16 on cpu"
+        return torch.autocast(device.type, dtype=torch.float16)
+    raise KeyError(f"unknown amp mode: {amp}")
+
+
+def create_grad_scaler(amp: str) -> torch.cuda.amp.GradScaler:
+    # bf16 has the fp32 exponent range, so only fp16 needs loss scaling,
+    # and fp16 is cuda only
+    return torch.cuda.amp.GradScaler(enabled=amp == "fp16")
+
+
+def split_micro_batches(
+    data: dict[str, Any], micro_batch_size: int
+) -> list[dict[str, Any]]:
+    if micro_batch_size <= 0:
+        return [data]
+    batch_size = len(next(v for v in data.values() if isinstance(v, Tensor)))
+    if batch_size <= micro_batch_size:
+        return [data]
+    # near-equal chunks instead of a small remainder, since batch-level losses
+    # (contrastive, triplet) only see the samples of their own micro-batch
+    num_chunks = ceil(batch_size / micro_batch_size)
+    chunks = {
+        k: v.tensor_split(num_chunks) if isinstance(v, Tensor) else [v] * num_chunks
+        for k, v in data.items()
+    }
+    return [{k: v[i] for k, v in chunks.items()} for i in range(num_chunks)]
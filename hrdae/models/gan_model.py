@@ -1,19 +1,23 @@
-import json
 from dataclasses import dataclass
+from math import ceil
 from pathlib import Path
+from typing import Any
 
 import torch
 from omegaconf import MISSING
-from torch import nn
+from torch import Tensor, nn
 from torch.optim.optimizer import Optimizer
 from torch.utils.data import DataLoader
 
-from .functions import save_model, save_reconstructed_images, shuffled_indices
+from ..distributed import get_device, unwrap_model, wrap_model
+from .functions import create_grad_scaler, save_model, shuffled_indices
 from .losses import LossMixer, LossOption, create_loss
+from .metrics import loss_terms
 from .networks import NetworkOption, create_network
 from .optimizers import OptimizerOption, create_optimizer
 from .option import ModelOption
 from .schedulers import LRScheduler, SchedulerOption, create_scheduler
+from .trainer import Hook, Stage, Trainer, TrainStep
 from .typing import Model
 
 
@@ -30,9 +34,13 @@ class GANModelOption(ModelOption):
     loss_coef: dict[str, float] = MISSING
     loss_g: LossOption = MISSING
     loss_d: LossOption = MISSING
+    # score every frame pair of a video instead of one sampled pair
+    all_frame_pairs: bool = False
 
 
-class GANModel(Model):
+class GANModel(Model, TrainStep):
+    monitor = "loss_g"
+
     def __init__(
         self,
         generator: nn.Module,
@@ -45,6 +53,17 @@ class GANModel(Model):
         criterion: nn.Module,
         criterion_g: nn.Module,
         criterion_d: nn.Module,
+        amp: str = "none",
+        grad_accum_steps: int = 1,
+        micro_batch_size: int = 0,
+        resume_from: str = "",
+        keep_last_checkpoints: int = 3,
+        image_workers: int = 2,
+        save_raw_images: bool = False,
+        val_every_n_epochs: int = 1,
+        val_subset_size: int = 0,
+        early_stopping_patience: int = 0,
+        all_frame_pairs: bool = False,
     ) -> None:
         self.generator = generator
         self.discriminator = discriminator
@@ -55,18 +74,59 @@ class GANModel(Model):
         self.criterion = criterion
         self.criterion_g = criterion_g
         self.criterion_d = criterion_d
+        self.adv_ratio = 0.1
+        self.train_discriminator = 5
+        self.all_frame_pairs = all_frame_pairs
 
         if generator_weight != "":
             self.generator.load_state_dict(torch.load(generator_weight))
 
-        if torch.cuda.is_available():
+        self.device = get_device()
+        if self.device.type == "cuda":
             print("GPU is enabled")
-            self.device = torch.device("cuda:0")
-            self.generator = nn.DataParallel(generator).to(self.device)
-            self.discriminator = nn.DataParallel(discriminator).to(self.device)
         else:
             print("GPU is not enabled")
-            self.device = torch.device("cpu")
+        self.generator = wrap_model(generator, self.device)
+        self.discriminator = wrap_model(discriminator, self.device)
+        # separate scalers, since each optimizer steps on its own loss
+        self.scaler_g = create_grad_scaler(amp)
+        self.scaler_d = create_grad_scaler(amp)
+
+        self.stages = [
+            Stage(
+                "loss_g",
+                self._generator_loss,
+                [self.generator, self.discriminator],
+                self.optimizer_g,
+                self.scheduler_g,
+                self.scaler_g,
+            ),
+            # the discriminator steps every loader batch, accumulating only
+            # over its micro-batches
+            Stage(
+                "loss_d_adv",
+                self._discriminator_loss,
+                [self.discriminator],
+                self.optimizer_d,
+                self.scheduler_d,
+                self.scaler_d,
+                accumulate=False,
+                repeats=self.train_discriminator,
+            ),
+        ]
+        self.trainer = Trainer(
+            self,
+            amp,
+            grad_accum_steps,
+            micro_batch_size,
+            resume_from,
+            keep_last_checkpoints,
+            image_workers,
+            save_raw_images,
+            val_every_n_epochs,
+            val_subset_size,
+            early_stopping_patience,
+        )
 
     def train(
         self,
@@ -75,254 +135,165 @@ class GANModel(Model):
         n_epoch: int,
         result_dir: Path,
         debug: bool,
+        hooks: list[Hook] | None = None,
     ) -> float:
-        max_iter = None
-        if debug:
-            max_iter = 5
-        adv_ratio = 0.1
-        train_discriminator = 5
-
-        least_val_loss_g = float("inf")
-        training_history: dict[str, list[dict[str, int | float]]] = {"history": []}
-
-        for epoch in range(n_epoch):
-            self.generator.train()
-            self.discriminator.train()
-
-            running_loss_g = 0.0
-            running_loss_g_basic = 0.0
-            running_loss_g_adv = 0.0
-            running_loss_d_adv = 0.0
-
-            for idx, data in enumerate(train_loader):
-                if max_iter is not None and idx >= max_iter:
-                    break
-
-                xm = data["xm"].to(self.device)
-                xm_0 = data["xm_0"].to(self.device)
-                xp = data["xp"].to(self.device)
-                xp_0 = data["xp_0"].to(self.device)
-                batch_size, num_frames = xm.size()[:2]
-
-                # train generator
-                self.optimizer_g.zero_grad()
-                y, latent_c, latent_m, cycled_latent = self.generator(xm, xp_0, xm_0)
-
-                indices = torch.randint(0, num_frames, (batch_size, 2))
-                state1 = latent_m[torch.arange(batch_size), indices[:, 0]]
-                state2 = latent_m[torch.arange(batch_size), indices[:, 1]]
-
-                # same video, different frame
-                same = self.discriminator(torch.cat([state1, state2], dim=1))
-
-                loss_g_basic = self.criterion(
-                    y,
-                    xp,
-                    latent=latent_c,
-                    cycled_latent=cycled_latent,
-                )
-                loss_g_adv = self.criterion_g(
-                    same, torch.zeros_like(same)
-                )  # + self.criterion_g(diff, torch.ones_like(diff))
-
-                loss_g = loss_g_basic + adv_ratio * loss_g_adv
-                loss_g.backward()
-                self.optimizer_g.step()
-
-                running_loss_g_basic += loss_g_basic.item()
-                running_loss_g_adv += loss_g_adv.item()
-                running_loss_g += loss_g.item()
-
-                for _ in range(train_discriminator):
-                    self.optimizer_d.zero_grad()
-                    with torch.no_grad():
-                        y, latent_c, latent_m, cycled_latent = self.generator(xm, xp_0, xm_0)
-
-                    indices = torch.randint(0, num_frames, (batch_size, 2))
-                    state1 = latent_m[torch.arange(batch_size), indices[:, 0]]
-                    state2 = latent_m[torch.arange(batch_size), indices[:, 1]]
-                    mixed_state1 = state1[shuffled_indices(batch_size)]
-                    # same video, different frame
-                    same = self.discriminator(
-                        torch.cat([state1.detach(), state2.detach()], dim=1)
-                    )
-                    # different video
-                    diff = self.discriminator(
-                        torch.cat([state1.detach(), mixed_state1.detach()], dim=1)
-                    )
-                    # same == onesなら、同じビデオと見破ったことになるため、discriminatorのロスは最小となる
-                    loss_d_adv_same = self.criterion_d(same, torch.ones_like(same))
-                    # diff == zerosなら、異なるビデオと見破ったことになるため、discriminatorのロスは最小となる
-                    loss_d_adv_diff = self.criterion_d(diff, torch.zeros_like(diff))
-                    loss_d_adv = (loss_d_adv_same + loss_d_adv_diff) / 2
-                    loss_d_adv.backward()
-                    self.optimizer_d.step()
-
-                    running_loss_d_adv += loss_d_adv.item()
-
-                if idx % 100 == 0:
-                    print(
-                        f"Epoch: {epoch+1}, "
-                        f"Batch: {idx}, "
-                        f"Loss D Adv: {loss_d_adv.item():.6f}, "
-                        f"Loss D Adv (same): {loss_d_adv_same.item():.6f}, "
-                        f"Loss D Adv (diff): {loss_d_adv_diff.item():.6f}, "
-                        f"Loss G: {loss_g.item():.6f}, "
-                        f"Loss G Adv: {loss_g_adv.item():.6f}, "
-                        f"Loss G Basic: {loss_g_basic.item():.6f}, "
-                    )
-
-            running_loss_g /= len(train_loader)
-            running_loss_g_basic /= len(train_loader)
-            running_loss_g_adv /= len(train_loader)
-            running_loss_d_adv /= len(train_loader) * train_discriminator
-
-            self.scheduler_g.step()
-            self.scheduler_d.step()
-
-            self.generator.eval()
-            self.discriminator.eval()
-            with torch.no_grad():
-                total_val_loss_g = 0.0
-                total_val_loss_g_basic = 0.0
-                total_val_loss_g_adv = 0.0
-                total_val_loss_d_adv = 0.0
-                xp = torch.tensor([0.0], device=self.device)
-                y = torch.tensor([0.0], device=self.device)
-
-                for idx, data in enumerate(val_loader):
-                    if max_iter is not None and idx >= max_iter:
-                        break
-
-                    xm = data["xm"].to(self.device)
-                    xm_0 = data["xm_0"].to(self.device)
-                    xp = data["xp"].to(self.device)
-                    xp_0 = data["xp_0"].to(self.device)
-                    batch_size, num_frames = xm.size()[:2]
-                    y, latent_c, latent_m, cycled_latent = self.generator(
-                        xm, xp_0, xm_0
-                    )
-
-                    indices = torch.randint(0, num_frames, (batch_size, 2))
-                    state1 = latent_m[torch.arange(batch_size), indices[:, 0]]
-                    state2 = latent_m[torch.arange(batch_size), indices[:, 1]]
-                    mixed_state1 = state1[shuffled_indices(batch_size)]
-
-                    same = self.discriminator(torch.cat([state1, state2], dim=1))
-                    # diff = self.discriminator(torch.cat([state1, mixed_state1], dim=1))
-
-                    y = y.detach().clone()
-                    loss_g_basic = self.criterion(
-                        y,
-                        xp,
-                        latent=latent_c,
-                        cycled_latent=cycled_latent,
-                    )
-                    loss_g_adv = self.criterion_g(
-                        same, torch.zeros_like(same)
-                    )  # + self.criterion_g(diff, torch.ones_like(diff))
-
-                    loss_g = loss_g_basic + adv_ratio * loss_g_adv
-                    loss_d_adv_same = self.criterion_d(same, torch.ones_like(same))
-                    loss_d_adv_diff = self.criterion_d(diff, torch.zeros_like(diff))
-                    loss_d_adv = (loss_d_adv_same + loss_d_adv_diff) / 2
-
-                    total_val_loss_g += loss_g.item()
-                    total_val_loss_g_basic += loss_g_basic.item()
-                    total_val_loss_g_adv += loss_g_adv.item()
-                    total_val_loss_d_adv += loss_d_adv.item()
-
-                total_val_loss_g /= len(val_loader)
-                total_val_loss_g_basic /= len(val_loader)
-                total_val_loss_g_adv /= len(val_loader)
-                total_val_loss_d_adv /= len(val_loader)
-
-                print(
-                    f"Epoch: {epoch+1} "
-                    f"[train] "
-                    f"Loss D Adv: {running_loss_d_adv:.6f}, "
-                    f"Loss G: {running_loss_g:.6f}, "
-                    f"Loss G Adv: {running_loss_g_adv:.6f}, "
-                    f"Loss G Basic: {running_loss_g_basic:.6f}, "
-                    f"[val] "
-                    f"Loss D Adv: {total_val_loss_d_adv:.6f}, "
-                    f"Loss G: {total_val_loss_g:.6f}, "
-                    f"Loss G Adv: {total_val_loss_g_adv:.6f}, "
-                    f"Loss G Basic: {total_val_loss_g_basic:.6f}, "
-                )
-
-                if total_val_loss_g < least_val_loss_g:
-                    least_val_loss_g = total_val_loss_g
-                    torch.save(
-                        self.generator.state_dict(), result_dir / "generator.pth"
-                    )
-                    torch.save(
-                        self.discriminator.state_dict(),
-                        result_dir / "discriminator.pth",
-                    )
-                    save_reconstructed_images(
-                        xp.data.cpu().clone().detach().numpy()[:10],
-                        y.data.cpu().clone().detach().numpy()[:10],
-                        "best",
-                        result_dir / "logs" / "reconstructed",
-                    )
-                    _save_model(
-                        self.generator,
-                        self.discriminator,
-                        result_dir / "weights",
-                        "best",
-                    )
-
-            training_history["history"].append(
-                {
-                    "epoch": int(epoch + 1),
-                    "train_loss_g": float(running_loss_g),
-                    "train_loss_g_basic": float(running_loss_g_basic),
-                    "train_loss_g_adv": float(running_loss_g_adv),
-                    "train_loss_d_adv": float(running_loss_d_adv),
-                    "val_loss_g": float(total_val_loss_g),
-                    "val_loss_g_basic": float(total_val_loss_g_basic),
-                    "val_loss_g_adv": float(total_val_loss_g_adv),
-                    "val_loss_d_adv": float(total_val_loss_d_adv),
-                }
+        return self.trainer.fit(
+            train_loader, val_loader, n_epoch, result_dir, debug, hooks
+        )
+
+    def _generator_loss(self, data: dict[str, Any]) -> dict[str, Tensor]:
+        xm = data["xm"].to(self.device)
+        xm_0 = data["xm_0"].to(self.device)
+        xp = data["xp"].to(self.device)
+        xp_0 = data["xp_0"].to(self.device)
+        batch_size, num_frames = xm.size()[:2]
+
+        y, latent_c, latent_m, cycled_latent = self.generator(xm, xp_0, xm_0)
+
+        indices = torch.randint(0, num_frames, (batch_size, 2))
+        state1 = latent_m[torch.arange(batch_size), indices[:, 0]]
+        state2 = latent_m[torch.arange(batch_size), indices[:, 1]]
+
+        # same video, different frame
+        same = self.discriminator(torch.cat([state1, state2], dim=1))
+
+        loss_g_basic = self.criterion(
+            y,
+            xp,
+            latent=latent_c,
+            cycled_latent=cycled_latent,
+        )
+        loss_g_adv = self.criterion_g(
+            same, torch.zeros_like(same)
+        )  # + self.criterion_g(diff, torch.ones_like(diff))
+
+        loss_g = loss_g_basic + self.adv_ratio * loss_g_adv
+        # reused by every discriminator iteration on this micro-batch
+        data["latent_m"] = latent_m.detach()
+        return {
+            "loss_g": loss_g,
+            "loss_g_basic": loss_g_basic,
+            "loss_g_adv": loss_g_adv,
+        } | loss_terms(self.criterion, "loss_g_basic")
+
+    def _discriminator_loss(self, data: dict[str, Any]) -> dict[str, Tensor]:
+        # motion latents of the generator stage, so that the discriminator
+        # iterations only resample pairs and never rerun the generator
+        same, diff = self._score_pairs(data["latent_m"])
+        return self._discriminator_losses(same, diff)
+
+    def _score_pairs(self, latent_m: Tensor) -> tuple[Tensor, Tensor]:
+        batch_size, num_frames = latent_m.size()[:2]
+        if self.all_frame_pairs:
+            # every (i, j) combination, the expectation of the sampled loss
+            i, j = torch.cartesian_prod(
+                torch.arange(num_frames), torch.arange(num_frames)
+            ).unbind(1)
+            i, j = i.expand(batch_size, -1), j.expand(batch_size, -1)
+        else:
+            indices = torch.randint(0, num_frames, (batch_size, 2))
+            i, j = indices[:, :1], indices[:, 1:]
+        return self._score_frames(latent_m, i, j, shuffled_indices(batch_size))
+
+    def _score_frames(
+        self, latent_m: Tensor, i: Tensor, j: Tensor, others: Tensor
+    ) -> tuple[Tensor, Tensor]:
+        # frames i and j of the same video (b, k), frame i of the video others
+        videos = torch.arange(len(latent_m)).unsqueeze(1)
+        state1 = latent_m[videos, i].flatten(0, 1)
+        state2 = latent_m[videos, j].flatten(0, 1)
+        mixed = latent_m[others.unsqueeze(1), i].flatten(0, 1)
+        # same video, different frame / different video
+        # scored in one call, DDP allows one forward per backward
+        pairs = torch.cat(
+            [
+                torch.cat([state1, state2], dim=1),
+                torch.cat([state1, mixed], dim=1),
+            ]
+        )
+        same, diff = self.discriminator(pairs).chunk(2)
+        return same, diff
+
+    def _discriminator_losses(self, same: Tensor, diff: Tensor) -> dict[str, Tensor]:
+        # same == onesなら、同じビデオと見破ったことになるため、discriminatorのロスは最小となる
+        loss_d_adv_same = self.criterion_d(same, torch.ones_like(same))
+        # diff == zerosなら、異なるビデオと見破ったことになるため、discriminatorのロスは最小となる
+        loss_d_adv_diff = self.criterion_d(diff, torch.zeros_like(diff))
+        return {
+            "loss_d_adv": (loss_d_adv_same + loss_d_adv_diff) / 2,
+            "loss_d_adv_same": loss_d_adv_same,
+            "loss_d_adv_diff": loss_d_adv_diff,
+        }
+
+    def val_step(
+        self, data: dict[str, Any]
+    ) -> tuple[dict[str, Tensor], Tensor, Tensor]:
+        xm = data["xm"].to(self.device)
+        xm_0 = data["xm_0"].to(self.device)
+        xp = data["xp"].to(self.device)
+        xp_0 = data["xp_0"].to(self.device)
+        y, latent_c, latent_m, cycled_latent = self.generator(xm, xp_0, xm_0)
+        same, diff = self._score_pairs(latent_m)
+
+        loss_g_basic = self.criterion(
+            y,
+            xp,
+            latent=latent_c,
+            cycled_latent=cycled_latent,
+        )
+        terms = loss_terms(self.criterion, "loss_g_basic")
+        loss_g_adv = self.criterion_g(
+            same, torch.zeros_like(same)
+        )  # + self.criterion_g(diff, torch.ones_like(diff))
+        loss_g = loss_g_basic + self.adv_ratio * loss_g_adv
+        values = {
+            "loss_g": loss_g,
+            "loss_g_basic": loss_g_basic,
+            "loss_g_adv": loss_g_adv,
+        }
+        return values | terms | self._discriminator_losses(same, diff), xp, y
+
+    def reconstruct(self, data: dict[str, Any]) -> tuple[Tensor, Tensor]:
+        xm = data["xm"].to(self.device)
+        xm_0 = data["xm_0"].to(self.device)
+        xp = data["xp"].to(self.device)
+        xp_0 = data["xp_0"].to(self.device)
+        # plain module, so rank 0 runs it without the other ranks
+        y, _, _, _ = unwrap_model(self.generator)(xm, xp_0, xm_0)
+        return xp, y
+
+    def save_weights(self, result_dir: Path, name: str) -> None:
+        if name == "best":
+            torch.save(self.generator.state_dict(), result_dir / "generator.pth")
+            torch.save(
+                self.discriminator.state_dict(),
+                result_dir / "discriminator.pth",
             )
-
-            with open(result_dir / "training_history.json", "w") as f:
-                json.dump(training_history, f, indent=2)
-
-            if epoch % 10 == 0:
-                data = next(iter(val_loader))
-
-                xm = data["xm"].to(self.device)
-                xm_0 = data["xm_0"].to(self.device)
-                xp = data["xp"].to(self.device)
-                xp_0 = data["xp_0"].to(self.device)
-
-                y, _, _, _ = self.generator(xm, xp_0, xm_0)
-
-                save_reconstructed_images(
-                    xp.data.cpu().clone().detach().numpy()[:10],
-                    y.data.cpu().clone().detach().numpy()[:10],
-                    f"epoch_{epoch}",
-                    result_dir / "logs" / "reconstructed",
-                )
-                _save_model(
-                    self.generator,
-                    self.discriminator,
-                    result_dir / "weights",
-                    f"epoch_{epoch}",
-                )
-
-        return least_val_loss_g
+        _save_model(
+            self.generator,
+            self.discriminator,
+            result_dir / "weights",
+            name,
+        )
+
+    def components(self) -> dict[str, Any]:
+        return {
+            "generator": unwrap_model(self.generator),
+            "discriminator": unwrap_model(self.discriminator),
+            "optimizer_g": self.optimizer_g,
+            "optimizer_d": self.optimizer_d,
+            "scheduler_g": self.scheduler_g,
+            "scheduler_d": self.scheduler_d,
+            "scaler_g": self.scaler_g,
+            "scaler_d": self.scaler_d,
+        }
 
 
 def _save_model(
     generator: nn.Module, discriminator: nn.Module, save_dir: Path, name: str
 ) -> None:
-    if isinstance(generator, nn.DataParallel):
-        generator = generator.module
-    if isinstance(discriminator, nn.DataParallel):
-        discriminator = discriminator.module
+    generator = unwrap_model(generator)
+    discriminator = unwrap_model(discriminator)
     save_model(
         generator,
         save_dir / f"{name}_generator.pth",
@@ -352,7 +323,7 @@ def create_gan_model(
         opt.scheduler_g,
         optimizer_g,
         n_epoch,
-        steps_per_epoch,
+        ceil(steps_per_epoch / opt.grad_accum_steps),
     )
     scheduler_d = create_scheduler(
         opt.scheduler_d,
@@ -377,4 +348,15 @@ def create_gan_model(
         criterion,
         criterion_g,
         criterion_d,
+        opt.amp,
+        opt.grad_accum_steps,
+        opt.micro_batch_size,
+        opt.resume_from,
+        opt.keep_last_checkpoints,
+        opt.image_workers,
+        opt.save_raw_images,
+        opt.val_every_n_epochs,
+        opt.val_subset_size,
+        opt.early_stopping_patience,
+        opt.all_frame_pairs,
     )
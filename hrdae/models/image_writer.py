@@ -0,0 +1,119 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+# gap between montage tiles, in pixels
+PADDING = 2
+
+
+def _to_uint8(image: np.ndarray) -> np.ndarray:
+    # min-max scaled per image, like imshow with the default norm
+    image = np.squeeze(image).astype(np.float32)
+    low, high = image.min(), image.max()
+    if high > low:
+        image = (image - low) / (high - low)
+    else:
+        image = np.zeros_like(image)
+    return (image * 255).round().astype(np.uint8)
+
+
+def _tile(rows: list[list[np.ndarray]]) -> np.ndarray:
+    h = max(image.shape[0] for row in rows for image in row)
+    w = max(image.shape[1] for row in rows for image in row)
+    n = max(len(row) for row in rows)
+    montage = np.full(
+        (len(rows) * (h + PADDING) - PADDING, n * (w + PADDING) - PADDING),
+        255,
+        dtype=np.uint8,
+    )
+    for i, row in enumerate(rows):
+        for j, image in enumerate(row):
+            y, x = i * (h + PADDING), j * (w + PADDING)
+            montage[y : y + image.shape[0], x : x + image.shape[1]] = image
+    return montage
+
+
+def _save_png(image: np.ndarray, path: Path) -> None:
+    # low zlib level: visualization is written often and read rarely
+    Image.fromarray(image).save(path, compress_level=1)
+
+
+def write_images(
+    original: np.ndarray,
+    reconstructed: np.ndarray,
+    save_dir: Path,
+    basename: str,
+    save_raw: bool = False,
+) -> None:
+    save_dir.mkdir(parents=True, exist_ok=True)
+    if save_raw:
+        np.save(save_dir / f"{basename}.npy", np.stack([original, reconstructed]))
+
+    rows: list[list[np.ndarray]] = [[], []]
+    for i in range(min(10, len(original))):
+        for row, image, name in zip(
+            rows,
+            [original[i], reconstructed[i]],
+            ["original", "reconstructed"],
+        ):
+            frame = _to_uint8(image)
+            _save_png(frame, save_dir / f"{basename}_{name}_{i}.png")
+            row.append(frame)
+
+    # originals on the first row, reconstructions on the second
+    _save_png(_tile(rows), save_dir / f"{basename}.png")
+
+
+class ImageWriter:
+    def __init__(self, num_workers: int = 2, save_raw: bool = False) -> None:
+        self.save_raw = save_raw
+        self.pool: ProcessPoolExecutor | None = None
+        if num_workers > 0:
+            # spawned, so workers never inherit cuda state or held locks
+            self.pool = ProcessPoolExecutor(
+                num_workers, mp_context=get_context("spawn")
+            )
+        self.futures: list[Future] = []
+
+    def submit(
+        self,
+        original: np.ndarray,
+        reconstructed: np.ndarray,
+        save_dir: Path,
+        basename: str,
+    ) -> None:
+        if self.pool is None:
+            write_images(original, reconstructed, save_dir, basename, self.save_raw)
+            return
+        self._collect()
+        self.futures.append(
+            self.pool.submit(
+                write_images,
+                original,
+                reconstructed,
+                save_dir,
+                basename,
+                self.save_raw,
+            )
+        )
+
+    def close(self) -> None:
+        if self.pool is None:
+            return
+        for future in self.futures:
+            future.result()
+        self.futures = []
+        self.pool.shutdown()
+
+    def _collect(self) -> None:
+        # surfaces errors of finished writes without waiting for the rest
+        pending = []
+        for future in self.futures:
+            if future.done():
+                future.result()
+            else:
+                pending.append(future)
+        self.futures = pending
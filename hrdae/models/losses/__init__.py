@@ -60,14 +60,21 @@ class LossMixer(nn.Module):
         super().__init__()
 
         keys = sorted(list(loss.keys()))
+        self.keys = keys
         self.loss = nn.ModuleList([loss[key] for key in keys])
         self.loss_coef = [loss_coef[key] for key in keys]
+        # detached weighted terms of the last call, for logging
+        self.terms: dict[str, Tensor] = {}
 
     def forward(self, input: Tensor, target: Tensor, **kwargs) -> Tensor:
         loss = tensor(0, device=input.device, dtype=float32)
-        for f, coef in zip(self.loss, self.loss_coef):
+        terms = {}
+        for key, f, coef in zip(self.keys, self.loss, self.loss_coef):
             kw: dict[str, Any] = {}
             if hasattr(f, "required_kwargs"):
                 kw |= {k: kwargs[k] for k in f.required_kwargs}
-            loss += coef * f(input, target, **kw)
+            term = coef * f(input, target, **kw)
+            terms[key] = term.detach()
+            loss += term
+        self.terms = terms
         return loss
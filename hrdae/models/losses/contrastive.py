@@ -27,8 +27,9 @@ class MStdLoss(nn.Module):
     def forward(self, input: Tensor, target: Tensor, latent: list[Tensor]) -> Tensor:
         feature = latent[0]
         b, t = feature.size()[:2]
-        feature = feature.view(b * t, -1)
-        square_distances = torch.cdist(feature, feature, p=2)
+        feature = feature.view(b * t, -1).float()
+        with torch.autocast(feature.device.type, enabled=False):
+            square_distances = torch.cdist(feature, feature, p=2)
 
         labels = 1 - torch.eye(b * t).to(input.device)
         for i in range(b):
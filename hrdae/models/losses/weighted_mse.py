@@ -25,6 +25,8 @@ class WeightedMSELoss(nn.Module):
 
     def forward(self, input: Tensor, target: Tensor) -> Tensor:
         assert input.size() == target.size(), f"{input.size()} != {target.size()}"
+        # the frame differences lose too much precision in half precision
+        input, target = input.float(), target.float()
 
         loss_static = mse_loss(input, target)
 
@@ -0,0 +1,58 @@
+import torch
+from torch import Tensor, nn
+
+from ..distributed import all_gather_object, all_reduce_mean, get_device
+from .losses import LossMixer
+
+
+def loss_terms(criterion: nn.Module, prefix: str) -> dict[str, Tensor]:
+    # per-component values of the last LossMixer call, empty for plain losses
+    if not isinstance(criterion, LossMixer):
+        return {}
+    return {f"{prefix}_{k}": v for k, v in criterion.terms.items()}
+
+
+class MetricAggregator:
+    # running sums stay on the device, so updating never waits for the gpu
+    def __init__(self) -> None:
+        self.totals: dict[str, Tensor] = {}
+        self.counts: dict[str, float] = {}
+
+    def update(self, values: dict[str, Tensor], weight: float = 1.0) -> None:
+        for key, value in values.items():
+            value = value.detach().float() * weight
+            if key in self.totals:
+                self.totals[key] += value
+                self.counts[key] += weight
+            else:
+                self.totals[key] = value
+                self.counts[key] = weight
+
+    def compute(self) -> dict[str, float]:
+        # weighted means of this process, read back with a single sync
+        keys = sorted(self.totals)
+        if len(keys) == 0:
+            return {}
+        totals = torch.stack([self.totals[k] for k in keys]).tolist()
+        return {k: v / self.counts[k] for k, v in zip(keys, totals)}
+
+    def reduce(self) -> dict[str, float]:
+        # like compute, averaged over the processes that saw each key;
+        # every rank must call it, even one without any update
+        keys = sorted(set().union(*all_gather_object(sorted(self.totals))))
+        if len(keys) == 0:
+            return {}
+        device = get_device()
+        means = torch.stack(
+            [
+                (
+                    (self.totals[k] / self.counts[k]).to(device)
+                    if k in self.totals
+                    else torch.zeros((), device=device)
+                )
+                for k in keys
+            ]
+        )
+        seen = torch.tensor([float(k in self.totals) for k in keys], device=device)
+        means, seen = all_reduce_mean(torch.stack([means, seen])).unbind()
+        return dict(zip(keys, (means / seen).tolist()))
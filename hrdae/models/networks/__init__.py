@@ -10,6 +10,7 @@ from .autoencoder import (
     create_autoencoder2d,
     create_autoencoder3d,
 )
+from .checkpoint import apply_checkpointing
 from .discriminator import (
     Discriminator2dOption,
     Discriminator3dOption,
@@ -17,12 +18,18 @@ from .discriminator import (
     create_discriminator3d,
 )
 from .hr_dae import HRDAE2dOption, HRDAE3dOption, create_hrdae2d, create_hrdae3d
-from .option import NetworkOption
+from .option import CheckpointOption, NetworkOption
 from .r_ae import RAE2dOption, RAE3dOption, create_rae2d, create_rae3d
 from .r_dae import RDAE2dOption, RDAE3dOption, create_rdae2d, create_rdae3d
 
 
 def create_network(out_channels: int, opt: NetworkOption) -> nn.Module:
+    network = _create_network(out_channels, opt)
+    apply_checkpointing(network, opt.checkpoint)
+    return network
+
+
+def _create_network(out_channels: int, opt: NetworkOption) -> nn.Module:
     if isinstance(opt, Discriminator2dOption) and type(opt) is Discriminator2dOption:
         return create_discriminator2d(opt)
     if isinstance(opt, Discriminator3dOption) and type(opt) is Discriminator3dOption:
@@ -76,5 +83,6 @@ __all__ = [
     "RDAE2dOption",
     "RDAE3dOption",
     "NetworkOption",
+    "CheckpointOption",
     "create_network",
 ]
@@ -0,0 +1,16 @@
+from torch import nn
+
+from .hr_dae import HRDAE2d, HRDAE3d
+from .modules import ConvLSTM1d, ConvLSTM2d
+from .modules.conv_block import ConvModuleBase
+from .option import CheckpointOption
+
+
+def apply_checkpointing(network: nn.Module, opt: CheckpointOption) -> None:
+    for module in network.modules():
+        if isinstance(module, ConvModuleBase):
+            module.checkpoint_layers = opt.conv_layers
+        elif isinstance(module, (HRDAE2d, HRDAE3d)):
+            module.checkpoint_mgc = opt.mgc
+        elif isinstance(module, (ConvLSTM1d, ConvLSTM2d)):
+            module.checkpoint_steps = opt.rnn_steps
@@ -3,7 +3,8 @@
 
 from dataclasses import dataclass
 
-from torch import Tensor, nn
+from torch import Tensor, is_grad_enabled, nn
+from torch.utils.checkpoint import checkpoint
 
 from .functions import upsample_motion_tensor
 from .modules import (
@@ -290,15 +291,25 @@ class HRDAE2d(nn.Module):
                 )
             )
         self.activation = create_activation(activation)
+        # recompute each motion guided connection in backward
+        self.checkpoint_mgc = False
 
-    def forward(
+    def encode(
         self,
         x_1d: Tensor,
         x_2d_0: Tensor,
         x_1d_0: Tensor | None = None,
-    ) -> tuple[Tensor, list[Tensor], Tensor, list[Tensor]]:
+    ) -> tuple[list[Tensor], Tensor]:
+        # content and motion encodings, without running the decoder
         c, cs = self.content_encoder(x_2d_0)
         m = self.motion_encoder(x_1d, x_1d_0)
+        return [c] + cs, m
+
+    def decode(
+        self, cs: list[Tensor], m: Tensor
+    ) -> tuple[Tensor, list[Tensor], Tensor, list[Tensor]]:
+        # forward outputs from given encodings, e.g. with swapped motion
+        c, *cs = cs
         b, t, c_, h, w = m.size()
         m_reshaped = m.reshape(b * t, c_, h, w)
         c_exp = c.repeat(t, 1, 1, 1)
@@ -307,7 +318,11 @@ class HRDAE2d(nn.Module):
         assert len(self.mgc) == len(cs_exp)
         z = self.aggregator((c_exp, upsample_motion_tensor(m_reshaped, c_exp)))
         for i, mgc in enumerate(self.mgc):
-            cs_exp[i] = mgc((cs_exp[i], upsample_motion_tensor(m_reshaped, cs_exp[i])))
+            inputs = (cs_exp[i], upsample_motion_tensor(m_reshaped, cs_exp[i]))
+            if self.checkpoint_mgc and is_grad_enabled():
+                cs_exp[i] = checkpoint(mgc, inputs, use_reentrant=False)
+            else:
+                cs_exp[i] = mgc(inputs)
         y = self.decoder(z, cs_exp[::-1])
 
         _, c_, h, w = y.size()
@@ -316,15 +331,20 @@ class HRDAE2d(nn.Module):
             y = self.activation(y)
         return y, [c] + cs, m, []
 
-
-class CycleHRDAE2d(HRDAE2d):
     def forward(
         self,
         x_1d: Tensor,
         x_2d_0: Tensor,
         x_1d_0: Tensor | None = None,
     ) -> tuple[Tensor, list[Tensor], Tensor, list[Tensor]]:
-        y, cs, m, _ = super().forward(x_1d, x_2d_0, x_1d_0)
+        return self.decode(*self.encode(x_1d, x_2d_0, x_1d_0))
+
+
+class CycleHRDAE2d(HRDAE2d):
+    def decode(
+        self, cs: list[Tensor], m: Tensor
+    ) -> tuple[Tensor, list[Tensor], Tensor, list[Tensor]]:
+        y, cs, m, _ = super().decode(cs, m)
         b, t, c, h, w = y.size()
         y_seq = y.reshape(b * t, c, h, w)
         d, ds = self.content_encoder(y_seq)
@@ -393,15 +413,25 @@ class HRDAE3d(nn.Module):
                 )
             )
         self.activation = create_activation(activation)
+        # recompute each motion guided connection in backward
+        self.checkpoint_mgc = False
 
-    def forward(
+    def encode(
         self,
         x_2d: Tensor,
         x_3d_0: Tensor,
         x_2d_0: Tensor | None = None,
-    ) -> tuple[Tensor, list[Tensor], Tensor, list[Tensor]]:
+    ) -> tuple[list[Tensor], Tensor]:
+        # content and motion encodings, without running the decoder
         c, cs = self.content_encoder(x_3d_0)
         m = self.motion_encoder(x_2d, x_2d_0)
+        return [c] + cs, m
+
+    def decode(
+        self, cs: list[Tensor], m: Tensor
+    ) -> tuple[Tensor, list[Tensor], Tensor, list[Tensor]]:
+        # forward outputs from given encodings, e.g. with swapped motion
+        c, *cs = cs
         b, t, c_, d, h, w = m.size()
         m_reshaped = m.reshape(b * t, c_, d, h, w)
         c_exp = c.repeat(t, 1, 1, 1, 1)
@@ -410,7 +440,11 @@ class HRDAE3d(nn.Module):
         assert len(self.mgc) == len(cs_exp)
         z = self.aggregator((c_exp, upsample_motion_tensor(m_reshaped, c_exp)))
         for i, mgc in enumerate(self.mgc):
-            cs_exp[i] = mgc((cs_exp[i], upsample_motion_tensor(m_reshaped, cs_exp[i])))
+            inputs = (cs_exp[i], upsample_motion_tensor(m_reshaped, cs_exp[i]))
+            if self.checkpoint_mgc and is_grad_enabled():
+                cs_exp[i] = checkpoint(mgc, inputs, use_reentrant=False)
+            else:
+                cs_exp[i] = mgc(inputs)
         y = self.decoder(z, cs_exp[::-1])
 
         _, c_, d, h, w = y.size()
@@ -419,15 +453,20 @@ class HRDAE3d(nn.Module):
             y = self.activation(y)
         return y, [c] + cs, m, []
 
-
-class CycleHRDAE3d(HRDAE3d):
     def forward(
         self,
         x_2d: Tensor,
         x_3d_0: Tensor,
         x_2d_0: Tensor | None = None,
     ) -> tuple[Tensor, list[Tensor], Tensor, list[Tensor]]:
-        y, cs, m, _ = super().forward(x_2d, x_3d_0, x_2d_0)
+        return self.decode(*self.encode(x_2d, x_3d_0, x_2d_0))
+
+
+class CycleHRDAE3d(HRDAE3d):
+    def decode(
+        self, cs: list[Tensor], m: Tensor
+    ) -> tuple[Tensor, list[Tensor], Tensor, list[Tensor]]:
+        y, cs, m, _ = super().decode(cs, m)
         b, t, c, d_, h, w = y.size()
         y_seq = y.reshape(b * t, c, d_, h, w)
         d, ds = self.content_encoder(y_seq)
@@ -1,5 +1,6 @@
-from torch import Tensor, cat, nn
+from torch import Tensor, cat, is_grad_enabled, nn
 from torch.nn.functional import group_norm, leaky_relu
+from torch.utils.checkpoint import checkpoint
 
 IdenticalConvBlockConvParams = {
     "kernel_size": [3],
@@ -310,6 +311,8 @@ class ConvModuleBase(nn.Module):
     use_skip: bool
     debug_show_dim: bool
     aggregation: str
+    # recompute each layer in backward instead of storing its activations
+    checkpoint_layers: bool = False
 
     def _forward(
         self, x: Tensor, hs: list[Tensor] | None = None
@@ -330,7 +333,10 @@ class ConvModuleBase(nn.Module):
                     x = x + hs[i]
                 else:
                     raise ValueError(f"Invalid aggregation: {self.aggregation}")
-            x = layer(x)
+            if self.checkpoint_layers and is_grad_enabled():
+                x = checkpoint(layer, x, use_reentrant=False)
+            else:
+                x = layer(x)
             if self.debug_show_dim:
                 print(f"{self.__class__.__name__} Layer {i}", x.size())
             xs.append(x)
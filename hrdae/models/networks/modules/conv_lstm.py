@@ -1,4 +1,15 @@
-from torch import Tensor, cat, nn, sigmoid, split, stack, tanh, zeros
+from torch import (
+    Tensor,
+    cat,
+    is_grad_enabled,
+    nn,
+    sigmoid,
+    split,
+    stack,
+    tanh,
+    zeros,
+)
+from torch.utils.checkpoint import checkpoint
 
 
 class ConvLSTMCell1d(nn.Module):
@@ -111,6 +122,7 @@ class ConvLSTM1d(nn.Module):
             )
 
         self.cell_list = nn.ModuleList(cell_list)
+        self.checkpoint_steps = 0
 
     def forward(
         self,
@@ -135,19 +147,40 @@ class ConvLSTM1d(nn.Module):
 
             h, c = hidden_state[layer_idx]
             output_inner = []
-            for t in range(seq_len):
-                h, c = self.cell_list[layer_idx](
-                    input_tensor=cur_layer_input[:, t], cur_state=[h, c]
-                )
-                output_inner.append(h)
-
-            layer_output = stack(output_inner, dim=1)
+            # segments of checkpoint_steps timesteps are recomputed in backward,
+            # only their boundary states are kept
+            step = self.checkpoint_steps if self.checkpoint_steps > 0 else seq_len
+            for t in range(0, seq_len, step):
+                segment = cur_layer_input[:, t : t + step]
+                if self.checkpoint_steps > 0 and is_grad_enabled():
+                    y, h, c = checkpoint(
+                        self._forward_steps,
+                        layer_idx,
+                        segment,
+                        h,
+                        c,
+                        use_reentrant=False,
+                    )
+                else:
+                    y, h, c = self._forward_steps(layer_idx, segment, h, c)
+                output_inner.append(y)
+
+            layer_output = cat(output_inner, dim=1)
             cur_layer_input = layer_output
 
             last_state_list.append((h, c))
 
         return cur_layer_input, last_state_list
 
+    def _forward_steps(
+        self, layer_idx: int, x: Tensor, h: Tensor, c: Tensor
+    ) -> tuple[Tensor, Tensor, Tensor]:
+        output_inner = []
+        for t in range(x.size(1)):
+            h, c = self.cell_list[layer_idx](input_tensor=x[:, t], cur_state=[h, c])
+            output_inner.append(h)
+        return stack(output_inner, dim=1), h, c
+
     def _init_hidden(
         self, batch_size: int, image_size: int
     ) -> list[tuple[Tensor, Tensor]]:
@@ -282,6 +315,7 @@ class ConvLSTM2d(nn.Module):
             )
 
         self.cell_list = nn.ModuleList(cell_list)
+        self.checkpoint_steps = 0
 
     def forward(
         self,
@@ -306,19 +340,40 @@ class ConvLSTM2d(nn.Module):
 
             h, c = hidden_state[layer_idx]
             output_inner = []
-            for t in range(seq_len):
-                h, c = self.cell_list[layer_idx](
-                    input_tensor=cur_layer_input[:, t, :, :, :], cur_state=[h, c]
-                )
-                output_inner.append(h)
-
-            layer_output = stack(output_inner, dim=1)
+            # segments of checkpoint_steps timesteps are recomputed in backward,
+            # only their boundary states are kept
+            step = self.checkpoint_steps if self.checkpoint_steps > 0 else seq_len
+            for t in range(0, seq_len, step):
+                segment = cur_layer_input[:, t : t + step]
+                if self.checkpoint_steps > 0 and is_grad_enabled():
+                    y, h, c = checkpoint(
+                        self._forward_steps,
+                        layer_idx,
+                        segment,
+                        h,
+                        c,
+                        use_reentrant=False,
+                    )
+                else:
+                    y, h, c = self._forward_steps(layer_idx, segment, h, c)
+                output_inner.append(y)
+
+            layer_output = cat(output_inner, dim=1)
             cur_layer_input = layer_output
 
             last_state_list.append((h, c))
 
         return cur_layer_input, last_state_list
 
+    def _forward_steps(
+        self, layer_idx: int, x: Tensor, h: Tensor, c: Tensor
+    ) -> tuple[Tensor, Tensor, Tensor]:
+        output_inner = []
+        for t in range(x.size(1)):
+            h, c = self.cell_list[layer_idx](input_tensor=x[:, t], cur_state=[h, c])
+            output_inner.append(h)
+        return stack(output_inner, dim=1), h, c
+
     def _init_hidden(
         self, batch_size: int, image_size: tuple[int, int]
     ) -> list[tuple[Tensor, Tensor]]:
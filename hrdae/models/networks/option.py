@@ -1,6 +1,15 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+
+
+@dataclass
+class CheckpointOption:
+    # activations recomputed in backward instead of stored
+    conv_layers: bool = False  # every ConvModuleBase layer
+    mgc: bool = False  # every motion guided connection block
+    rnn_steps: int = 0  # ConvLSTM timesteps per segment, 0: off
 
 
 @dataclass
 class NetworkOption:
     activation: str = "sigmoid"  # "none" | "sigmoid" | "tanh" | "relu"
+    checkpoint: CheckpointOption = field(default_factory=CheckpointOption)
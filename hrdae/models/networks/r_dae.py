@@ -124,14 +124,22 @@ class RDAE2d(nn.Module):
         self.activation = create_activation(activation)
         self.aggregator = create_aggregator2d(aggregator, latent_dim, latent_dim)
 
-    def forward(
+    def encode(
         self,
         x_1d: Tensor,
         x_2d_0: Tensor,
         x_1d_0: Tensor | None = None,
-    ) -> tuple[Tensor, list[Tensor], Tensor, list[Tensor]]:
+    ) -> tuple[list[Tensor], Tensor]:
+        # content and motion encodings, without running the decoder
         c, _ = self.content_encoder(x_2d_0)
         m = self.motion_encoder(x_1d, x_1d_0)
+        return [c], m
+
+    def decode(
+        self, cs: list[Tensor], m: Tensor
+    ) -> tuple[Tensor, list[Tensor], Tensor, list[Tensor]]:
+        # forward outputs from given encodings, e.g. with swapped motion
+        (c,) = cs
         b, t, c_, h_, w = m.size()
         m_reshaped = m.reshape(b * t, c_, h_, w)
         c_exp = c.repeat(t, 1, 1, 1)
@@ -144,15 +152,20 @@ class RDAE2d(nn.Module):
             y = self.activation(y)
         return y, [c], m, []
 
-
-class CycleRDAE2d(RDAE2d):
     def forward(
         self,
         x_1d: Tensor,
         x_2d_0: Tensor,
         x_1d_0: Tensor | None = None,
     ) -> tuple[Tensor, list[Tensor], Tensor, list[Tensor]]:
-        y, cs, m, _ = super().forward(x_1d, x_2d_0, x_1d_0)
+        return self.decode(*self.encode(x_1d, x_2d_0, x_1d_0))
+
+
+class CycleRDAE2d(RDAE2d):
+    def decode(
+        self, cs: list[Tensor], m: Tensor
+    ) -> tuple[Tensor, list[Tensor], Tensor, list[Tensor]]:
+        y, cs, m, _ = super().decode(cs, m)
         b, t, c, h, w = y.size()
         y_seq = y.reshape(b * t, c, h, w)
         d, _ = self.content_encoder(y_seq)
@@ -197,14 +210,22 @@ class RDAE3d(nn.Module):
         self.activation = create_activation(activation)
         self.aggregator = create_aggregator3d(aggregator, latent_dim, latent_dim)
 
-    def forward(
+    def encode(
         self,
         x_2d: Tensor,
         x_3d_0: Tensor,
         x_2d_0: Tensor | None = None,
-    ) -> tuple[Tensor, list[Tensor], Tensor, list[Tensor]]:
+    ) -> tuple[list[Tensor], Tensor]:
+        # content and motion encodings, without running the decoder
         c, _ = self.content_encoder(x_3d_0)
         m = self.motion_encoder(x_2d, x_2d_0)
+        return [c], m
+
+    def decode(
+        self, cs: list[Tensor], m: Tensor
+    ) -> tuple[Tensor, list[Tensor], Tensor, list[Tensor]]:
+        # forward outputs from given encodings, e.g. with swapped motion
+        (c,) = cs
         b, t, c_, d, h_, w = m.size()
         m_reshaped = m.reshape(b * t, c_, d, h_, w)
         c_exp = c.repeat(t, 1, 1, 1, 1)
@@ -217,15 +238,20 @@ class RDAE3d(nn.Module):
             y = self.activation(y)
         return y, [c], m, []
 
-
-class CycleRDAE3d(RDAE3d):
     def forward(
         self,
         x_2d: Tensor,
         x_3d_0: Tensor,
         x_2d_0: Tensor | None = None,
     ) -> tuple[Tensor, list[Tensor], Tensor, list[Tensor]]:
-        y, cs, m, _ = super().forward(x_2d, x_3d_0, x_2d_0)
+        return self.decode(*self.encode(x_2d, x_3d_0, x_2d_0))
+
+
+class CycleRDAE3d(RDAE3d):
+    def decode(
+        self, cs: list[Tensor], m: Tensor
+    ) -> tuple[Tensor, list[Tensor], Tensor, list[Tensor]]:
+        y, cs, m, _ = super().decode(cs, m)
         b, t, c, d_, h, w = y.size()
         y_seq = y.reshape(b * t, c, d_, h, w)
         d, _ = self.content_encoder(y_seq)
@@ -3,4 +3,16 @@ from dataclasses import dataclass
 
 @dataclass
 class ModelOption:
-    pass
+    amp: str = "none"  # "none" | "bf16" | "fp16"
+    # optimizer steps once every grad_accum_steps loader batches
+    grad_accum_steps: int = 1
+    micro_batch_size: int = 0  # 0: forward the whole loader batch at once
+    resume_from: str = ""  # training state checkpoint to continue from
+    keep_last_checkpoints: int = 3  # 0: keep all
+    image_workers: int = 2  # 0: write images on the training thread
+    save_raw_images: bool = False  # also write .npy stacks next to the pngs
+    val_every_n_epochs: int = 1  # the last epoch is always validated
+    # 0: full val set every time. otherwise intermediate validations score a
+    # fixed, evenly spaced (not stratified) subset of this size
+    val_subset_size: int = 0
+    early_stopping_patience: int = 0  # validations without improvement, 0: never
@@ -0,0 +1,508 @@
+import json
+import time
+from abc import ABCMeta, abstractmethod
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+import torch
+from torch import Tensor, nn
+from torch.optim.optimizer import Optimizer
+from torch.utils.data import DataLoader, DistributedSampler, IterableDataset, Subset
+
+from ..distributed import (
+    all_gather_object,
+    is_distributed,
+    is_main_process,
+    set_epoch,
+    sync_gradients,
+)
+from .checkpoint import (
+    CheckpointWriter,
+    capture_rng_state,
+    load_training_state,
+    training_state,
+)
+from .functions import autocast, save_reconstructed_images, split_micro_batches
+from .image_writer import ImageWriter
+from .metrics import MetricAggregator
+from .schedulers import LRScheduler
+
+
+@dataclass
+class Stage:
+    # metric key of the loss that is backpropagated
+    name: str
+    # micro-batch -> metrics, including the loss under `name`
+    loss: Callable[[dict[str, Any]], dict[str, Tensor]]
+    # modules whose gradient all-reduce waits for the updating micro-batch
+    modules: list[nn.Module]
+    optimizer: Optimizer
+    scheduler: LRScheduler
+    scaler: torch.cuda.amp.GradScaler
+    # False: steps on every loader batch, ignoring grad_accum_steps
+    accumulate: bool = True
+    repeats: int = 1
+
+
+class TrainStep(metaclass=ABCMeta):
+    device: torch.device
+    stages: list[Stage]
+    # val metric that picks the best epoch
+    monitor: str = "loss"
+
+    @abstractmethod
+    def val_step(
+        self, data: dict[str, Any]
+    ) -> tuple[dict[str, Tensor], Tensor, Tensor]:
+        # metrics, target and reconstruction of one val batch
+        pass
+
+    @abstractmethod
+    def reconstruct(self, data: dict[str, Any]) -> tuple[Tensor, Tensor]:
+        # target and reconstruction for visualization, run on rank 0 only
+        pass
+
+    @abstractmethod
+    def save_weights(self, result_dir: Path, name: str) -> None:
+        pass
+
+    @abstractmethod
+    def components(self) -> dict[str, Any]:
+        # everything with a state_dict that a resumed run needs back
+        pass
+
+    def modules(self) -> list[nn.Module]:
+        modules: list[nn.Module] = []
+        for stage in self.stages:
+            modules += [m for m in stage.modules if all(m is not n for n in modules)]
+        return modules
+
+
+class Hook:
+    def on_step(
+        self, trainer: "Trainer", epoch: int, idx: int, metrics: MetricAggregator
+    ) -> None:
+        pass
+
+    def on_val(
+        self,
+        trainer: "Trainer",
+        epoch: int,
+        train_result: dict[str, float],
+        val_result: dict[str, float],
+    ) -> None:
+        pass
+
+    def on_checkpoint(self, trainer: "Trainer", epoch: int, path: Path) -> None:
+        pass
+
+    def on_epoch_end(self, trainer: "Trainer", epoch: int) -> None:
+        pass
+
+
+class ProgressHook(Hook):
+    def __init__(self, interval: int = 100) -> None:
+        self.interval = interval
+
+    def on_step(
+        self, trainer: "Trainer", epoch: int, idx: int, metrics: MetricAggregator
+    ) -> None:
+        if idx % self.interval != 0 or not is_main_process():
+            return
+        # running means so far, synced only at the logging interval
+        print(f"Epoch: {epoch+1}, Batch: {idx}, {_format(metrics.compute())}")
+
+
+class ReportHook(Hook):
+    def __init__(self, name: str, report: Callable[[], dict[str, int]]) -> None:
+        # e.g. counters of the data pipeline, reset by each report
+        self.name = name
+        self.report = report
+
+    def on_epoch_end(self, trainer: "Trainer", epoch: int) -> None:
+        values = self.report()
+        if is_main_process():
+            print(
+                f"Epoch: {epoch+1}, [{self.name}] "
+                + ", ".join(f"{k}: {v}" for k, v in values.items())
+            )
+
+
+class EarlyStoppingHook(Hook):
+    def __init__(self, patience: int) -> None:
+        # validations without improvement before training stops
+        self.patience = patience
+        self.least = float("inf")
+        self.num_bad = 0
+
+    def on_val(
+        self,
+        trainer: "Trainer",
+        epoch: int,
+        train_result: dict[str, float],
+        val_result: dict[str, float],
+    ) -> None:
+        # every rank sees the same reduced result, so they all stop together
+        value = val_result[trainer.step.monitor]
+        if value < self.least:
+            self.least = value
+            self.num_bad = 0
+            return
+        self.num_bad += 1
+        if self.num_bad >= self.patience:
+            if is_main_process():
+                print(
+                    f"Epoch: {epoch+1}, no improvement in {self.patience} validations"
+                )
+            trainer.should_stop = True
+
+    def state_dict(self) -> dict[str, Any]:
+        return {"least": self.least, "num_bad": self.num_bad}
+
+    def load_state_dict(self, state: dict[str, Any]) -> None:
+        self.least = state["least"]
+        self.num_bad = state["num_bad"]
+
+
+class Trainer:
+    def __init__(
+        self,
+        step: TrainStep,
+        amp: str = "none",
+        grad_accum_steps: int = 1,
+        micro_batch_size: int = 0,
+        resume_from: str = "",
+        keep_last_checkpoints: int = 3,
+        image_workers: int = 2,
+        save_raw_images: bool = False,
+        val_every_n_epochs: int = 1,
+        val_subset_size: int = 0,
+        early_stopping_patience: int = 0,
+        hooks: list[Hook] | None = None,
+    ) -> None:
+        self.step = step
+        self.amp = amp
+        self.grad_accum_steps = grad_accum_steps
+        self.micro_batch_size = micro_batch_size
+        self.resume_from = resume_from
+        self.keep_last_checkpoints = keep_last_checkpoints
+        self.image_workers = image_workers
+        self.save_raw_images = save_raw_images
+        self.val_every_n_epochs = val_every_n_epochs
+        self.val_subset_size = val_subset_size
+        self.hooks: list[Hook] = [ProgressHook()] if hooks is None else hooks
+        if early_stopping_patience > 0:
+            self.hooks.append(EarlyStoppingHook(early_stopping_patience))
+        self.should_stop = False
+
+    def fit(
+        self,
+        train_loader: DataLoader,
+        val_loader: DataLoader,
+        n_epoch: int,
+        result_dir: Path,
+        debug: bool,
+        hooks: list[Hook] | None = None,
+    ) -> float:
+        # hooks of this run only, after the trainer's own
+        hooks = self.hooks + (hooks if hooks is not None else [])
+        max_iter = None
+        if debug:
+            max_iter = 5
+
+        least_val_loss = float("inf")
+        training_history: dict[str, list[dict[str, int | float]]] = {"history": []}
+
+        # hooks with a state_dict, like the early stopping counters, are
+        # resumed with the rest
+        components = self.step.components() | {
+            f"hook_{type(hook).__name__}": hook
+            for hook in hooks
+            if hasattr(hook, "state_dict")
+        }
+        start_epoch = 0
+        if self.resume_from != "":
+            start_epoch, least_val_loss, training_history = load_training_state(
+                Path(self.resume_from), components
+            )
+        writer = None
+        image_writer = None
+        if is_main_process():
+            writer = CheckpointWriter(
+                result_dir / "checkpoints", self.keep_last_checkpoints
+            )
+            image_writer = ImageWriter(self.image_workers, self.save_raw_images)
+
+        # intermediate validations score a fixed subset, which the hooks
+        # compare among themselves. the best epoch is decided on the full
+        # val set only
+        val_subset_loader = _subset_loader(val_loader, self.val_subset_size)
+        has_subset = val_subset_loader is not val_loader
+        least_subset_loss = float("inf")
+        vis_batch = None
+        self.should_stop = False
+
+        for epoch in range(start_epoch, n_epoch):
+            train_result = self._train_epoch(train_loader, epoch, max_iter, hooks)
+
+            subset_result: dict[str, float] = {}
+            val_result: dict[str, float] = {}
+            last = epoch == n_epoch - 1
+            validate = last or (epoch + 1) % self.val_every_n_epochs == 0
+            full = validate and (last or not has_subset)
+            if validate and not full:
+                subset_result, target, output = self._validate(
+                    val_subset_loader, max_iter
+                )
+                for hook in hooks:
+                    hook.on_val(self, epoch, train_result, subset_result)
+                # a new best on the subset is rescored on the full set, and
+                # an early stop still ends with a full validation
+                subset_loss = subset_result[self.step.monitor]
+                full = subset_loss < least_subset_loss or self.should_stop
+                least_subset_loss = min(least_subset_loss, subset_loss)
+            if full:
+                val_result, target, output = self._validate(val_loader, max_iter)
+                if not has_subset:
+                    for hook in hooks:
+                        hook.on_val(self, epoch, train_result, val_result)
+            improved = full and val_result[self.step.monitor] < least_val_loss
+            if is_main_process():
+                print(
+                    f"Epoch: {epoch+1}, "
+                    f"[train] {_format(train_result)}, "
+                    f"[val] {_format(val_result)}"
+                    + (f", [val subset] {_format(subset_result)}" if has_subset else "")
+                )
+
+            if improved:
+                least_val_loss = val_result[self.step.monitor]
+                if is_main_process():
+                    _save_images(target, output, "best", result_dir, image_writer)
+                    self.step.save_weights(result_dir, "best")
+
+            training_history["history"].append(
+                {"epoch": int(epoch + 1)}
+                | {f"train_{k}": v for k, v in train_result.items()}
+                | {f"val_{k}": v for k, v in val_result.items()}
+                | {f"val_subset_{k}": v for k, v in subset_result.items()}
+            )
+
+            # every rank draws its own random stream, all of them are resumed
+            rng_states = all_gather_object(capture_rng_state())
+            if is_main_process():
+                with open(result_dir / "training_history.json", "w") as f:
+                    json.dump(training_history, f)
+
+                assert writer is not None
+                name = f"epoch_{epoch:04d}.pt"
+                writer.save(
+                    name,
+                    training_state(
+                        epoch,
+                        components,
+                        least_val_loss,
+                        training_history,
+                        rng_states,
+                    ),
+                    is_best=improved,
+                )
+                for hook in hooks:
+                    hook.on_checkpoint(self, epoch, writer.save_dir / name)
+
+                if epoch % 10 == 0:
+                    if vis_batch is None:
+                        # kept on the device, so no loader iterator is respawned
+                        vis_batch = _to_device(next(iter(val_loader)), self.step.device)
+                    with _evaluating(self.step.modules()):
+                        target, output = self.step.reconstruct(vis_batch)
+                    _save_images(
+                        target, output, f"epoch_{epoch}", result_dir, image_writer
+                    )
+                    self.step.save_weights(result_dir, f"epoch_{epoch}")
+
+            for hook in hooks:
+                hook.on_epoch_end(self, epoch)
+
+            if self.should_stop:
+                break
+
+        if writer is not None:
+            writer.close()
+        if image_writer is not None:
+            image_writer.close()
+        return least_val_loss
+
+    def _train_epoch(
+        self,
+        loader: DataLoader,
+        epoch: int,
+        max_iter: int | None,
+        hooks: list[Hook],
+    ) -> dict[str, float]:
+        for module in self.step.modules():
+            module.train()
+        set_epoch(loader, epoch)
+        metrics = MetricAggregator()
+        num_samples = 0
+        start = time.perf_counter()
+        # the debug cut ends the epoch early, its last group still steps
+        num_batches = len(loader)
+        if max_iter is not None:
+            num_batches = min(num_batches, max_iter)
+
+        for idx, data in enumerate(loader):
+            if idx >= num_batches:
+                break
+
+            batch_size = len(data["xp"])
+            # shared by all stages, so a stage can leave detached tensors for
+            # the stages after it
+            micro_batches = split_micro_batches(data, self.micro_batch_size)
+            for stage in self.step.stages:
+                accum_steps = self.grad_accum_steps if stage.accumulate else 1
+                zero_grad = idx % accum_steps == 0
+                update = (idx + 1) % accum_steps == 0
+                update |= idx + 1 == num_batches
+                # a trailing partial group has fewer loader batches
+                group_start = idx - idx % accum_steps
+                group_size = min(accum_steps, num_batches - group_start)
+                for _ in range(stage.repeats):
+                    self._optimize(
+                        stage,
+                        micro_batches,
+                        batch_size,
+                        group_size,
+                        zero_grad,
+                        update,
+                        metrics,
+                    )
+            num_samples += batch_size
+
+            for hook in hooks:
+                hook.on_step(self, epoch, idx, metrics)
+
+        if is_main_process():
+            print(
+                f"Epoch: {epoch+1}, "
+                f"Throughput ({self.amp}): "
+                f"{num_samples / (time.perf_counter() - start):.1f} samples/s"
+            )
+
+        for stage in self.step.stages:
+            stage.scheduler.step()
+
+        return metrics.reduce()
+
+    def _optimize(
+        self,
+        stage: Stage,
+        micro_batches: list[dict[str, Any]],
+        batch_size: int,
+        group_size: int,
+        zero_grad: bool,
+        update: bool,
+        metrics: MetricAggregator,
+    ) -> None:
+        if zero_grad:
+            stage.optimizer.zero_grad()
+        for micro_idx, micro_batch in enumerate(micro_batches):
+            sync = update and micro_idx == len(micro_batches) - 1
+            with ExitStack() as stack:
+                for module in stage.modules:
+                    stack.enter_context(sync_gradients(module, sync))
+                with autocast(self.step.device, self.amp):
+                    values = stage.loss(micro_batch)
+                # weighted so that the gradient is the mean over the
+                # effective batch of group_size loader batches
+                weight = len(micro_batch["xp"]) / batch_size
+                stage.scaler.scale(values[stage.name] * weight / group_size).backward()
+            metrics.update(values, weight)
+
+        if update:
+            stage.scaler.step(stage.optimizer)
+            stage.scaler.update()
+
+    def _validate(
+        self, loader: DataLoader, max_iter: int | None
+    ) -> tuple[dict[str, float], Tensor, Tensor]:
+        for module in self.step.modules():
+            module.eval()
+        metrics = MetricAggregator()
+        target = torch.tensor([0.0], device=self.step.device)
+        output = torch.tensor([0.0], device=self.step.device)
+        with torch.no_grad(), autocast(self.step.device, self.amp):
+            for idx, data in enumerate(loader):
+                if max_iter is not None and idx >= max_iter:
+                    break
+                values, target, output = self.step.val_step(data)
+                metrics.update(values)
+        return metrics.reduce(), target, output
+
+
+@contextmanager
+def _evaluating(modules: list[nn.Module]) -> Iterator[None]:
+    # validation may have been skipped, so the modules can still be training
+    modes = [module.training for module in modules]
+    for module in modules:
+        module.eval()
+    try:
+        with torch.no_grad():
+            yield
+    finally:
+        for module, mode in zip(modules, modes):
+            module.train(mode)
+
+
+def _subset_loader(loader: DataLoader, size: int) -> DataLoader:
+    dataset = loader.dataset
+    if size <= 0 or isinstance(dataset, IterableDataset):
+        return loader
+    num_samples = len(dataset)  # type: ignore
+    if num_samples <= size:
+        return loader
+    # evenly spaced over the val set order, not stratified by volume or split
+    indices = torch.linspace(0, num_samples - 1, size).round().long()
+    subset = Subset(dataset, indices.tolist())
+    kwargs: dict[str, Any] = {
+        "batch_size": loader.batch_size or getattr(loader.batch_sampler, "batch_size"),
+        "num_workers": loader.num_workers,
+        "collate_fn": loader.collate_fn,
+        "pin_memory": loader.pin_memory,
+        "worker_init_fn": loader.worker_init_fn,
+    }
+    if loader.num_workers > 0:
+        kwargs["multiprocessing_context"] = loader.multiprocessing_context
+        kwargs["persistent_workers"] = loader.persistent_workers
+        kwargs["prefetch_factor"] = loader.prefetch_factor
+    if hasattr(loader, "batch_transform"):
+        kwargs["batch_transform"] = loader.batch_transform
+    if is_distributed():
+        kwargs["sampler"] = DistributedSampler(subset, shuffle=False)
+    return type(loader)(subset, **kwargs)
+
+
+def _to_device(data: dict[str, Any], device: torch.device) -> dict[str, Any]:
+    return {k: v.to(device) if isinstance(v, Tensor) else v for k, v in data.items()}
+
+
+def _format(result: dict[str, float]) -> str:
+    return ", ".join(f"{k}: {v:.6f}" for k, v in result.items())
+
+
+def _save_images(
+    target: Tensor,
+    output: Tensor,
+    name: str,
+    result_dir: Path,
+    writer: ImageWriter | None,
+) -> None:
+    save_reconstructed_images(
+        target.detach().float().cpu().numpy()[:10],
+        output.detach().float().cpu().numpy()[:10],
+        name,
+        result_dir / "logs" / "reconstructed",
+        writer,
+    )
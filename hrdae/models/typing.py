@@ -3,6 +3,8 @@ from pathlib import Path
 
 from torch.utils.data import DataLoader
 
+from .trainer import Hook
+
 
 class Model(metaclass=ABCMeta):
     @abstractmethod
@@ -13,5 +15,6 @@ class Model(metaclass=ABCMeta):
         n_epoch: int,
         result_dir: Path,
         debug: bool,
+        hooks: list[Hook] | None = None,
     ) -> float:
         pass
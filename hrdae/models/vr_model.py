@@ -1,19 +1,23 @@
-import json
 from dataclasses import dataclass
+from math import ceil
 from pathlib import Path
+from typing import Any
 
 import torch
 from omegaconf import MISSING
-from torch import nn, tensor
+from torch import Tensor, nn
 from torch.optim.optimizer import Optimizer
 from torch.utils.data import DataLoader
 
-from .functions import save_model, save_reconstructed_images, shuffled_indices
+from ..distributed import get_device, unwrap_model, wrap_model
+from .functions import create_grad_scaler, save_model, shuffled_indices
 from .losses import LossMixer, LossOption, create_loss
+from .metrics import loss_terms
 from .networks import NetworkOption, create_network
 from .optimizers import OptimizerOption, create_optimizer
 from .option import ModelOption
 from .schedulers import LRScheduler, SchedulerOption, create_scheduler
+from .trainer import Hook, Stage, Trainer, TrainStep
 from .typing import Model
 
 
@@ -28,7 +32,7 @@ class VRModelOption(ModelOption):
     use_triplet: bool = False
 
 
-class VRModel(Model):
+class VRModel(Model, TrainStep):
     def __init__(
         self,
         network: nn.Module,
@@ -37,6 +41,16 @@ class VRModel(Model):
         scheduler: LRScheduler,
         criterion: nn.Module,
         use_triplet: bool,
+        amp: str = "none",
+        grad_accum_steps: int = 1,
+        micro_batch_size: int = 0,
+        resume_from: str = "",
+        keep_last_checkpoints: int = 3,
+        image_workers: int = 2,
+        save_raw_images: bool = False,
+        val_every_n_epochs: int = 1,
+        val_subset_size: int = 0,
+        early_stopping_patience: int = 0,
     ) -> None:
         self.network = network
         self.optimizer = optimizer
@@ -47,13 +61,37 @@ class VRModel(Model):
         if network_weight != "":
             self.network.load_state_dict(torch.load(network_weight))
 
-        if torch.cuda.is_available():
+        self.device = get_device()
+        if self.device.type == "cuda":
             print("GPU is enabled")
-            self.device = torch.device("cuda:0")
-            self.network = nn.DataParallel(network).to(self.device)
         else:
             print("GPU is not enabled")
-            self.device = torch.device("cpu")
+        self.network = wrap_model(network, self.device)
+        self.scaler = create_grad_scaler(amp)
+
+        self.stages = [
+            Stage(
+                "loss",
+                self._loss,
+                [self.network],
+                self.optimizer,
+                self.scheduler,
+                self.scaler,
+            )
+        ]
+        self.trainer = Trainer(
+            self,
+            amp,
+            grad_accum_steps,
+            micro_batch_size,
+            resume_from,
+            keep_last_checkpoints,
+            image_workers,
+            save_raw_images,
+            val_every_n_epochs,
+            val_subset_size,
+            early_stopping_patience,
+        )
 
     def train(
         self,
@@ -62,139 +100,90 @@ class VRModel(Model):
         n_epoch: int,
         result_dir: Path,
         debug: bool,
+        hooks: list[Hook] | None = None,
     ) -> float:
-        max_iter = None
-        if debug:
-            max_iter = 5
-
-        least_val_loss = float("inf")
-        training_history: dict[str, list[dict[str, int | float]]] = {"history": []}
-
-        for epoch in range(n_epoch):
-            self.network.train()
-            running_loss = 0.0
-
-            for idx, data in enumerate(train_loader):
-                if max_iter and max_iter <= idx:
-                    break
-
-                xm = data["xm"].to(self.device)
-                xm_0 = data["xm_0"].to(self.device)
-                xp = data["xp"].to(self.device)
-                xp_0 = data["xp_0"].to(self.device)
-
-                self.optimizer.zero_grad()
-                y, latent_c, latent_m, cycled_latent = self.network(xm, xp_0, xm_0)
-                # triplet
-                indices = shuffled_indices(len(xp))
-                positive = tensor(0.0)
-                negative = tensor(0.0)
-                if self.use_triplet:
-                    _, _, positive = self.network(xm[indices], xp_0, xm_0[indices])
-                    _, _, negative = self.network(xm, xp_0[indices], xm_0)
-
-                loss = self.criterion(
-                    y,
-                    xp,
-                    latent=latent_c,
-                    cycled_latent=cycled_latent,
-                    positive=positive,
-                    negative=negative,
-                )
-                loss.backward()
-                self.optimizer.step()
-
-                running_loss += loss.item()
-
-                if idx % 100 == 0:
-                    print(f"Epoch: {epoch+1}, Batch: {idx} Loss: {loss.item():.6f}")
-
-            running_loss /= len(train_loader)
-            print(f"Epoch: {epoch+1}, Average Loss: {running_loss:.6f}")
-
-            self.scheduler.step()
-
-            self.network.eval()
-            with torch.no_grad():
-                total_val_loss = 0.0
-                xp = tensor([0.0], device=self.device)
-                y = tensor([0.0], device=self.device)
-
-                for idx, data in enumerate(val_loader):
-                    if max_iter and max_iter <= idx:
-                        break
-
-                    xm = data["xm"].to(self.device)
-                    xm_0 = data["xm_0"].to(self.device)
-                    xp = data["xp"].to(self.device)
-                    xp_0 = data["xp_0"].to(self.device)
-                    y, latent_c, latent_m, cycled_latent = self.network(xm, xp_0, xm_0)
-                    # triplet
-                    indices = shuffled_indices(len(xp))
-                    positive = tensor(0.0)
-                    negative = tensor(0.0)
-                    if self.use_triplet:
-                        _, positive, _ = self.network(xm[indices], xp_0, xm_0[indices])
-                        _, negative, _ = self.network(xm, xp_0[indices], xm_0)
-
-                    loss = self.criterion(
-                        y,
-                        xp,
-                        latent=latent_c,
-                        cycled_latent=cycled_latent,
-                        positive=positive,
-                        negative=negative,
-                    )
-                    total_val_loss += loss.item()
-
-                avg_val_loss = total_val_loss / len(val_loader)
-                print(f"Epoch: {epoch+1}, Val Loss: {avg_val_loss:.6f}")
-
-                if avg_val_loss < least_val_loss:
-                    least_val_loss = avg_val_loss
-                    save_reconstructed_images(
-                        xp.data.cpu().clone().detach().numpy(),
-                        y.data.cpu().clone().detach().numpy(),
-                        "best",
-                        result_dir / "logs" / "reconstructed",
-                    )
-                    save_model(
-                        self.network,
-                        result_dir / "weights" / "best_model.pth",
-                    )
-
-            training_history["history"].append(
-                {
-                    "epoch": int(epoch + 1),
-                    "train_loss": float(running_loss),
-                    "val_loss": float(avg_val_loss),
-                }
-            )
-            with open(result_dir / "training_history.json", "w") as f:
-                json.dump(training_history, f)
-
-            if epoch % 10 == 0:
-                data = next(iter(val_loader))
-
-                xm = data["xm"].to(self.device)
-                xm_0 = data["xm_0"].to(self.device)
-                xp = data["xp"].to(self.device)
-                xp_0 = data["xp_0"].to(self.device)
-
-                y, _, _, _ = self.network(xm, xp_0, xm_0)
-
-                save_reconstructed_images(
-                    xp.data.cpu().clone().detach().numpy(),
-                    y.data.cpu().clone().detach().numpy(),
-                    f"epoch_{epoch}",
-                    result_dir / "logs" / "reconstructed",
-                )
-                save_model(
-                    self.network,
-                    result_dir / "weights" / f"model_{epoch}.pth",
-                )
-
-        return least_val_loss
+        return self.trainer.fit(
+            train_loader, val_loader, n_epoch, result_dir, debug, hooks
+        )
+
+    def _loss(self, data: dict[str, Any]) -> dict[str, Tensor]:
+        xm = data["xm"].to(self.device)
+        xm_0 = data["xm_0"].to(self.device)
+        xp = data["xp"].to(self.device)
+        xp_0 = data["xp_0"].to(self.device)
+
+        y, latent_c, latent_m, cycled_latent = self.network(xm, xp_0, xm_0)
+        positive, negative = self._triplet(latent_c, latent_m)
+
+        loss = self.criterion(
+            y,
+            xp,
+            latent=latent_c,
+            cycled_latent=cycled_latent,
+            positive=positive,
+            negative=negative,
+        )
+        return {"loss": loss} | loss_terms(self.criterion, "loss")
+
+    def _triplet(
+        self, latent_c: list[Tensor], latent_m: Tensor
+    ) -> tuple[list[Tensor], list[Tensor]]:
+        # cycled latents of the motion swapped (positive) and the content
+        # swapped (negative) inputs, sampled within the micro-batch. the
+        # encoders are per sample, so the swapped encodings are permutations
+        # of the ones of the reconstruction and only the decoder is re-run
+        if not self.use_triplet:
+            return [], []
+        # DDP allows one forward per backward, the extra passes reach the
+        # same parameters and share its reduction
+        network = unwrap_model(self.network)
+        # cycle networks return the contents with a frame axis
+        cs = [c[:, 0] for c in latent_c]
+        indices = shuffled_indices(len(latent_m))
+        positive = network.decode(cs, latent_m[indices])[3]  # type: ignore
+        negative = network.decode([c[indices] for c in cs], latent_m)[3]  # type: ignore
+        assert len(positive) > 0, "use_triplet requires a cycle network"
+        return positive, negative
+
+    def val_step(
+        self, data: dict[str, Any]
+    ) -> tuple[dict[str, Tensor], Tensor, Tensor]:
+        xm = data["xm"].to(self.device)
+        xm_0 = data["xm_0"].to(self.device)
+        xp = data["xp"].to(self.device)
+        xp_0 = data["xp_0"].to(self.device)
+        y, latent_c, latent_m, cycled_latent = self.network(xm, xp_0, xm_0)
+        positive, negative = self._triplet(latent_c, latent_m)
+
+        loss = self.criterion(
+            y,
+            xp,
+            latent=latent_c,
+            cycled_latent=cycled_latent,
+            positive=positive,
+            negative=negative,
+        )
+        return {"loss": loss} | loss_terms(self.criterion, "loss"), xp, y
+
+    def reconstruct(self, data: dict[str, Any]) -> tuple[Tensor, Tensor]:
+        xm = data["xm"].to(self.device)
+        xm_0 = data["xm_0"].to(self.device)
+        xp = data["xp"].to(self.device)
+        xp_0 = data["xp_0"].to(self.device)
+        # plain module, so rank 0 runs it without the other ranks
+        y, _, _, _ = unwrap_model(self.network)(xm, xp_0, xm_0)
+        return xp, y
+
+    def save_weights(self, result_dir: Path, name: str) -> None:
+        save_model(self.network, result_dir / "weights" / f"{name}_model.pth")
+
+    def components(self) -> dict[str, Any]:
+        return {
+            "network": unwrap_model(self.network),
+            "optimizer": self.optimizer,
+            "scheduler": self.scheduler,
+            "scaler": self.scaler,
+        }
 
 
 def create_vr_model(
@@ -211,7 +200,7 @@ def create_vr_model(
         opt.scheduler,
         optimizer,
         n_epoch,
-        steps_per_epoch,
+        ceil(steps_per_epoch / opt.grad_accum_steps),
     )
     criterion = LossMixer(
         {k: create_loss(v) for k, v in opt.loss.items()}, opt.loss_coef
@@ -223,4 +212,14 @@ def create_vr_model(
         scheduler,
         criterion,
         opt.use_triplet,
+        opt.amp,
+        opt.grad_accum_steps,
+        opt.micro_batch_size,
+        opt.resume_from,
+        opt.keep_last_checkpoints,
+        opt.image_workers,
+        opt.save_raw_images,
+        opt.val_every_n_epochs,
+        opt.val_subset_size,
+        opt.early_stopping_patience,
     )
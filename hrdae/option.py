@@ -19,6 +19,9 @@ class ExpOption:
 @dataclass
 class TrainExpOption(ExpOption):
     n_epoch: int = 50
+    # >1 spawns one DistributedDataParallel process per rank
+    world_size: int = 1
+    master_port: int = 29500
 
 
 @dataclass
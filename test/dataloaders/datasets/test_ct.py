@@ -2,9 +2,13 @@ from pathlib import Path
 from tempfile import TemporaryDirectory
 
 import numpy as np
+import torch
+from torch.utils.data import Subset
 from torchvision import transforms
 
+from hrdae.dataloaders import memory_footprint
 from hrdae.dataloaders.datasets.ct import CT, BasicSliceIndexer
+from hrdae.dataloaders.datasets.seq_divide_wrapper import SeqDivideWrapper
 from hrdae.dataloaders.transforms import (
     MinMaxNormalizationOption,
     Pool3dOption,
@@ -53,3 +57,68 @@ def test_CT():
         assert data["xm_0"].shape == (1, 16, 16)
         assert data["xp"].shape == (10, 1, 16, 16, 16)
         assert data["xp_0"].shape == (2, 16, 16, 16)
+
+
+def test_BasicSliceIndexer():
+    indexer = BasicSliceIndexer(threshold=0.5, min_occupancy=0.2)
+    x = torch.zeros(10, 4, 8, 16)
+    x[:, :, :, [3, 7]] = 1.0
+    assert indexer.index(x).tolist() == [3, 7]
+    assert indexer(x).item() in (3, 7)
+
+    y = torch.zeros(10, 4, 8, 16)
+    y[:, 0, 0, 5] = 1.0  # below min_occupancy, falls back to argmax
+    assert indexer(y).tolist() == [5]
+
+
+def test_CT__parallel_preload():
+    with TemporaryDirectory() as root:
+        data_root = Path(root) / "CT"
+        data_root.mkdir(parents=True, exist_ok=True)
+        for i in range(10):
+            np.savez(data_root / f"sample{i}.npz", np.random.randn(10, 4, 8, 8))
+
+        datasets = [
+            CT(
+                root=Path(root),
+                slice_indexer=BasicSliceIndexer(),
+                transform=create_transform(MinMaxNormalizationOption()),
+                in_memory=True,
+                is_train=True,
+                preload_workers=workers,
+                preload_executor=executor,
+            )
+            for workers, executor in [(0, "thread"), (2, "thread"), (2, "process")]
+        ]
+        for dataset in datasets:
+            assert isinstance(dataset.data, torch.Tensor)
+            assert dataset.data.shape == (8, 10, 4, 8, 8)
+            assert torch.equal(dataset.data, datasets[0].data)
+
+
+def test_CT__storage_dtype():
+    with TemporaryDirectory() as root:
+        data_root = Path(root) / "CT"
+        data_root.mkdir(parents=True, exist_ok=True)
+        x = np.random.randn(10, 4, 8, 8)
+        np.savez(data_root / "sample0.npz", x)
+
+        for storage_dtype, dtype, atol in [
+            ("float16", torch.float16, 1e-2),
+            ("uint8", torch.uint8, 5e-2),
+        ]:
+            dataset = CT(
+                root=Path(root),
+                slice_indexer=BasicSliceIndexer(),
+                in_memory=True,
+                is_train=False,
+                storage_dtype=storage_dtype,
+            )
+            assert dataset.data[0].dtype == dtype
+            assert dataset.memory_footprint() == x.size * dataset.data[0].element_size()
+            # reported once from the entry point, through the wrappers
+            wrapped = Subset(SeqDivideWrapper(dataset, CT.PERIOD), [0])
+            assert memory_footprint(wrapped) == dataset.memory_footprint()
+            data = dataset[0]
+            assert data["xp"].dtype == torch.float32
+            assert np.allclose(data["xp"][:, 0].numpy(), x, atol=atol)
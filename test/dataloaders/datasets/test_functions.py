@@ -0,0 +1,20 @@
+import torch
+
+from hrdae.dataloaders.datasets.functions import optimize_output
+
+
+def test_optimize_output():
+    n, s, c, d, h, w = 10, 2, 1, 4, 8, 8
+    x_3d = torch.randn(n, c, d, h, w)
+    x_2d = torch.randn(n, s, d, h)
+
+    for phase, k in [("0", 1), ("t", 1), ("random", 1), ("all", 2)]:
+        output = optimize_output(x_2d, x_3d, phase, phase, "concat")
+        assert output["xm"].shape == (n, s + k * s, d, h)
+        assert output["xm_0"].shape == (k * s, d, h)
+        assert output["xp"].shape == (n, c, d, h, w)
+        assert output["xp_0"].shape == (k * c, d, h, w)
+        assert torch.equal(output["xm"][3, s:], output["xm_0"])
+
+    output = optimize_output(x_2d, x_3d, "t", "t", "diff")
+    assert torch.allclose(output["xm"], x_2d - x_2d[n // 2])
@@ -0,0 +1,108 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import pytest
+import torch
+from torchvision import transforms
+
+from hrdae.dataloaders.basic import BasicDataLoaderOption, create_basic_dataloader
+from hrdae.dataloaders.datasets import SlicedCTDatasetOption
+from hrdae.dataloaders.datasets.ct import CT, BasicSliceIndexer
+from hrdae.dataloaders.datasets.manifest import build_manifest, load_manifest
+from hrdae.dataloaders.transforms import (
+    MinMaxNormalizationOption,
+    Pool3dOption,
+    create_transform,
+)
+
+
+def test_manifest():
+    with TemporaryDirectory() as root:
+        data_root = Path(root) / "CT"
+        data_root.mkdir(parents=True, exist_ok=True)
+        for i in range(10):
+            np.savez(data_root / f"sample{i}.npz", np.random.randn(10, 4, 8, 8))
+        build_manifest(Path(root), Path(root) / "CT_manifest.json", 4, val_ratio=0.25)
+
+        entries = load_manifest(Path(root) / "CT_manifest.json")
+        assert [e["split"] for e in entries].count("test") == 2
+        assert [e["split"] for e in entries].count("val") == 2
+        assert len(entries[0]["occupancy"]) == 8
+
+        opt = BasicDataLoaderOption(
+            batch_size=4,
+            dataset=SlicedCTDatasetOption(
+                root=Path(root),
+                slice_index=[3],
+                slice_range=[2, 6],
+                sequential=True,
+                manifest=str(Path(root) / "CT_manifest.json"),
+            ),
+            transform={"min_max_normalization": MinMaxNormalizationOption()},
+            transform_order_train=["min_max_normalization"],
+            transform_order_val=["min_max_normalization"],
+        )
+        train_loader, val_loader = create_basic_dataloader(opt, is_train=True)
+        assert val_loader is not None
+        assert len(train_loader.dataset) == 4 * 6  # type: ignore
+        assert len(val_loader.dataset) == 4 * 2  # type: ignore
+
+
+def test_manifest__slice_choices():
+    with TemporaryDirectory() as root:
+        data_root = Path(root) / "CT"
+        data_root.mkdir(parents=True, exist_ok=True)
+        for i in range(5):
+            np.savez(data_root / f"sample{i}.npz", np.random.randn(10, 4, 8, 8))
+        build_manifest(Path(root), Path(root) / "CT_manifest.json", 4, threshold=0.5)
+
+        slice_indexer = BasicSliceIndexer(threshold=0.5)
+        ct = CT(
+            root=Path(root),
+            slice_indexer=slice_indexer,
+            transform=create_transform(MinMaxNormalizationOption()),
+            in_memory=True,
+            manifest=Path(root) / "CT_manifest.json",
+        )
+        # the manifest occupancy is in the normalized space the indexer sees
+        for i in range(len(ct)):
+            assert torch.equal(
+                ct.slice_choices[i], slice_indexer.index(ct._get_volume(i))
+            )
+
+
+def test_manifest__transformed_volumes():
+    with TemporaryDirectory() as root:
+        data_root = Path(root) / "CT"
+        data_root.mkdir(parents=True, exist_ok=True)
+        for i in range(5):
+            np.savez(data_root / f"sample{i}.npz", np.random.randn(10, 4, 8, 8))
+        build_manifest(Path(root), Path(root) / "CT_manifest.json", 4)
+
+        slice_indexer = BasicSliceIndexer()
+        ct = CT(
+            root=Path(root),
+            slice_indexer=slice_indexer,
+            transform=transforms.Compose(
+                [
+                    create_transform(MinMaxNormalizationOption()),
+                    create_transform(Pool3dOption(pool_size=[1, 2, 2])),
+                ]
+            ),
+            in_memory=True,
+            manifest=Path(root) / "CT_manifest.json",
+        )
+        # pooled to a different width, recomputed from the volume
+        for i in range(len(ct)):
+            assert torch.equal(
+                ct.slice_choices[i], slice_indexer.index(ct._get_volume(i))
+            )
+
+        with pytest.raises(ValueError):
+            CT(
+                root=Path(root),
+                slice_indexer=BasicSliceIndexer(threshold=0.5),
+                in_memory=True,
+                manifest=Path(root) / "CT_manifest.json",
+            )
@@ -2,8 +2,10 @@ from pathlib import Path
 from tempfile import TemporaryDirectory
 
 import numpy as np
+import torch
 
 from hrdae.dataloaders.datasets.moving_mnist import MovingMNIST
+from hrdae.dataloaders.transforms.normalization import MinMaxNormalization
 
 
 def test_MovingMNIST():
@@ -29,3 +31,59 @@ def test_MovingMNIST():
         assert data["xm_0"].shape == (2, 64)
         assert data["xp"].shape == (10, 1, 64, 64)
         assert data["xp_0"].shape == (2, 64, 64)
+        # served without batched_assembly, too
+        assert dataset.has_frame(0)
+        assert torch.equal(dataset.get_frame(0, 3), data["xp"][3])
+
+
+def test_MovingMNIST__batched_assembly():
+    with TemporaryDirectory() as root:
+        data_root = Path(root) / "MovingMNIST"
+        data_root.mkdir(parents=True, exist_ok=True)
+        np.save(
+            str(data_root / "mnist_test_seq.npy"),
+            np.random.randint(0, 256, (20, 4, 64, 64), dtype=np.uint8),
+        )
+        kwargs = {
+            "root": root,
+            "slice_index": [16, 32],
+            "split": "test",
+            "download": False,
+            "transform": MinMaxNormalization(),
+            "content_phase": "all",
+            "motion_phase": "0",
+            "motion_aggregation": "concat",
+        }
+        dataset = MovingMNIST(**kwargs)
+        batched = MovingMNIST(batched_assembly=True, **kwargs)
+
+        batch = batched.__getitems__([1, 3])
+        assert isinstance(batch, dict)
+        for i, idx in enumerate([1, 3]):
+            data = dataset[idx]
+            for key in data:
+                assert torch.allclose(batched[idx][key], data[key])
+                assert torch.allclose(batch[key][i], data[key])
+
+
+def test_MovingMNIST__batched_assembly_stochastic_transform():
+    with TemporaryDirectory() as root:
+        data_root = Path(root) / "MovingMNIST"
+        data_root.mkdir(parents=True, exist_ok=True)
+        np.save(
+            str(data_root / "mnist_test_seq.npy"),
+            np.random.randint(0, 256, (20, 4, 64, 64), dtype=np.uint8),
+        )
+        dataset = MovingMNIST(
+            root=root,
+            slice_index=[32],
+            split="test",
+            download=False,
+            transform=lambda x: x.float() + torch.rand(1),
+            batched_assembly=True,
+        )
+        assert dataset.data.dtype == torch.uint8
+        first = dataset.__getitems__([0, 1])
+        second = dataset.__getitems__([0, 1])
+        assert isinstance(first, dict) and isinstance(second, dict)
+        assert not torch.allclose(first["xp"], second["xp"])
@@ -0,0 +1,38 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import torch
+
+from hrdae.dataloaders.basic import BasicDataLoaderOption, create_basic_dataloader
+from hrdae.dataloaders.datasets import CTDatasetOption
+from hrdae.dataloaders.datasets.pyramid import build_pyramid, pyramid_level_dir
+from hrdae.dataloaders.transforms import Pool3dOption
+
+
+def test_pyramid():
+    with TemporaryDirectory() as root:
+        data_root = Path(root) / "CT"
+        data_root.mkdir(parents=True, exist_ok=True)
+        np.savez(data_root / "sample0.npz", np.random.randn(10, 4, 8, 8))
+        build_pyramid(Path(root), [[1, 2, 2]])
+        assert (pyramid_level_dir(Path(root), [1, 2, 2]) / "sample0.npz").exists()
+
+        outputs = []
+        for use_pyramid in [False, True]:
+            opt = BasicDataLoaderOption(
+                batch_size=1,
+                dataset=CTDatasetOption(
+                    root=Path(root),
+                    slice_index=[2],
+                    sequential=True,
+                    use_pyramid=use_pyramid,
+                ),
+                transform={"pool3d": Pool3dOption(pool_size=[1, 2, 2])},
+                transform_order_train=["pool3d"],
+                transform_order_val=["pool3d"],
+            )
+            loader, _ = create_basic_dataloader(opt, is_train=False)
+            outputs.append(next(iter(loader))["xp"])
+        assert outputs[0].shape == (1, 10, 1, 4, 4, 4)
+        assert torch.allclose(outputs[0], outputs[1])
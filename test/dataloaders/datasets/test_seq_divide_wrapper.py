@@ -0,0 +1,104 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import torch
+from torch import Tensor
+from torch.utils.data import Dataset
+from torchvision import transforms
+
+from hrdae.dataloaders.datasets import create_dataset
+from hrdae.dataloaders.datasets.ct import CT, BasicSliceIndexer, CTDatasetOption
+from hrdae.dataloaders.datasets.seq_divide_wrapper import SeqDivideWrapper
+from hrdae.dataloaders.datasets.sliced_ct import SlicedCT
+from hrdae.dataloaders.transforms import RandomShift3dOption, create_transform
+
+
+class Sequences(Dataset):
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def __len__(self) -> int:
+        return 2
+
+    def __getitem__(self, index: int) -> dict[str, Tensor]:
+        self.calls += 1
+        return {"xp": torch.arange(10).float().view(10, 1) + 10 * index}
+
+
+def test_SeqDivideWrapper():
+    base = Sequences()
+    dataset = SeqDivideWrapper(base, 10)
+    frames = [dataset[i]["x"].item() for i in range(len(dataset))]
+    assert frames == list(range(20))
+    assert base.calls == 2
+
+
+def test_SeqDivideWrapper__get_frame():
+    with TemporaryDirectory() as root:
+        data_root = Path(root) / "CT"
+        data_root.mkdir(parents=True, exist_ok=True)
+        np.savez(data_root / "sample1.npz", np.random.randn(10, 8, 12, 16))
+
+        ct = CT(
+            root=Path(root),
+            slice_indexer=BasicSliceIndexer(),
+            in_memory=True,
+            is_train=False,
+        )
+        sliced_ct = SlicedCT(
+            root=Path(root),
+            slice_indexer=lambda _: torch.tensor([4]),
+            slice_range=[2, 6],
+            in_memory=True,
+            is_train=False,
+            slice_axis="y",
+        )
+        for base in [ct, sliced_ct]:
+            dataset = SeqDivideWrapper(base, 10)
+            for i in [0, 3, len(dataset) - 1]:
+                x = base[i // 10]["xp"][i % 10]
+                assert torch.equal(dataset[i]["x"], x)
+
+
+def test_SeqDivideWrapper__not_in_memory():
+    with TemporaryDirectory() as root:
+        data_root = Path(root) / "CT"
+        data_root.mkdir(parents=True, exist_ok=True)
+        np.savez(data_root / "sample1.npz", np.random.randn(10, 8, 12, 16))
+
+        ct = CT(
+            root=Path(root),
+            slice_indexer=BasicSliceIndexer(),
+            in_memory=False,
+            is_train=False,
+        )
+        assert not ct.has_frame(0)
+        dataset = SeqDivideWrapper(ct, 10)
+        for i in range(len(dataset)):
+            assert torch.equal(dataset[i]["x"], ct[0]["xp"][i])
+        # the volume is loaded once, not once per frame
+        assert list(dataset.cache.keys()) == [0]
+
+
+def test_SeqDivideWrapper__stochastic_transform():
+    with TemporaryDirectory() as root:
+        data_root = Path(root) / "CT"
+        data_root.mkdir(parents=True, exist_ok=True)
+        np.savez(data_root / "sample1.npz", np.random.randn(10, 8, 12, 16))
+
+        opt = CTDatasetOption(root=Path(root), slice_index=[4], in_memory=False)
+        transform = transforms.Compose(
+            [create_transform(RandomShift3dOption(max_shifts=[1, 2, 2]))]
+        )
+        dataset = create_dataset(opt, transform, is_train=False)
+        assert isinstance(dataset, SeqDivideWrapper)
+        for i in range(len(dataset)):
+            dataset[i]
+        # every frame draws its own shift, nothing is cached
+        assert len(dataset.cache) == 0
+
+        dataset = create_dataset(opt, transforms.Compose([]), is_train=False)
+        assert isinstance(dataset, SeqDivideWrapper)
+        dataset[0]
+        assert list(dataset.cache.keys()) == [0]
@@ -0,0 +1,93 @@
+from pathlib import Path
+from socket import socket
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import pytest
+import torch.multiprocessing as mp
+from torch.utils.data import DataLoader
+
+from hrdae.dataloaders.datasets.ct import BasicSliceIndexer
+from hrdae.dataloaders.datasets.sharded_ct import ShardedCT, build_shards
+from hrdae.distributed import destroy_process_group, init_process_group, set_epoch
+
+
+def _build(root: str, num_volumes: int, shard_size: int) -> None:
+    data_root = Path(root) / "CT"
+    data_root.mkdir(parents=True, exist_ok=True)
+    for i in range(num_volumes):
+        np.savez(data_root / f"sample{i:02d}.npz", np.random.randn(10, 4, 8, 8))
+    build_shards(Path(root), Path(root) / "CT_shards", shard_size=shard_size)
+
+
+def test_ShardedCT():
+    with TemporaryDirectory() as root:
+        _build(root, 10, 3)
+
+        dataset = ShardedCT(
+            root=Path(root),
+            slice_indexer=BasicSliceIndexer(),
+            is_train=True,
+            shuffle_buffer=4,
+        )
+        assert len(dataset) == 8  # TRAIN_PER_TEST = 4
+        assert len(dataset.shards) == 3
+
+        loader = DataLoader(dataset, batch_size=2, num_workers=2)
+        batches = list(loader)
+        assert sum(len(batch["xm"]) for batch in batches) == 8
+        assert batches[0]["xm"].shape == (2, 10, 2, 4, 8)
+        assert batches[0]["xp"].shape == (2, 10, 1, 4, 8, 8)
+
+        train, val = dataset.split(0.8)
+        assert len(train) + len(val) == 8
+        assert len(val.shards) == 1
+
+        # the epoch loop reshuffles the shards
+        set_epoch(loader, 1)
+        assert dataset.epoch == 1
+
+
+def test_ShardedCT__split_single_shard():
+    with TemporaryDirectory() as root:
+        _build(root, 5, 8)
+        dataset = ShardedCT(root=Path(root), slice_indexer=BasicSliceIndexer())
+        assert len(dataset.shards) == 1
+        with pytest.raises(AssertionError):
+            dataset.split(0.8)
+
+
+def test_ShardedCT__more_ranks_than_shards():
+    with TemporaryDirectory() as root:
+        _build(root, 5, 8)
+        dataset = ShardedCT(root=Path(root), slice_indexer=BasicSliceIndexer())
+        # a single shard, the second rank has nothing to read
+        dataset.rank, dataset.world_size = 1, 2
+        assert list(dataset) == []
+
+
+def _worker(rank: int, world_size: int, port: int, root: str) -> None:
+    init_process_group(rank, world_size, port)
+    try:
+        dataset = ShardedCT(
+            root=Path(root),
+            slice_indexer=BasicSliceIndexer(),
+            shuffle_buffer=1,
+        )
+        # 8 samples in shards of 3, 3 and 2
+        assert len(dataset) == 3
+        loader = DataLoader(dataset, batch_size=1, num_workers=2)
+        for epoch in range(2):
+            set_epoch(loader, epoch)
+            assert len(list(loader)) == 3
+    finally:
+        destroy_process_group()
+
+
+def test_ShardedCT__equal_per_rank():
+    with socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    with TemporaryDirectory() as root:
+        _build(root, 10, 3)
+        mp.spawn(_worker, args=(3, port, root), nprocs=3)
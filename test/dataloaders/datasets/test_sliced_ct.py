@@ -2,6 +2,7 @@ from pathlib import Path
 from tempfile import TemporaryDirectory
 
 import numpy as np
+import torch
 from torchvision import transforms
 
 from hrdae.dataloaders.datasets.sliced_ct import (
@@ -63,3 +64,54 @@ def test_SlicedCT():
         assert data["xm_0"].shape == (2, 16)
         assert data["xp"].shape == (10, 1, 16, 16)
         assert data["xp_0"].shape == (1, 16, 16)
+
+
+def test_SlicedCT__volume_cache():
+    with TemporaryDirectory() as root:
+        data_root = Path(root) / "CT"
+        data_root.mkdir(parents=True, exist_ok=True)
+        for i in range(6):
+            np.savez(data_root / f"sample{i}.npz", np.random.randn(10, 10, 16, 16))
+        opt = SlicedCTDatasetOption(
+            root=Path(root),
+            slice_index=[6, 10],
+            in_memory=False,
+            content_phase="0",
+            motion_phase="0",
+            motion_aggregation="none",
+            slice_axis="z",
+            slice_range=[2, 8],
+            volume_cache_gb=1e-3,
+        )
+        dataset = create_sliced_ct_dataset(
+            opt, create_transform(MinMaxNormalizationOption()), is_train=False
+        )
+        for i in range(len(dataset)):  # type: ignore
+            data = dataset[i]
+            assert data["xm"].shape == (10, 2, 16)
+        assert list(dataset.volume_cache.keys()) == [0, 1]  # type: ignore
+
+
+def test_SlicedCT__volume_cache_reapplies_random_transforms():
+    with TemporaryDirectory() as root:
+        data_root = Path(root) / "CT"
+        data_root.mkdir(parents=True, exist_ok=True)
+        np.savez(data_root / "sample0.npz", np.random.rand(10, 10, 16, 16))
+        opt = SlicedCTDatasetOption(
+            root=Path(root),
+            slice_index=[6, 10],
+            in_memory=False,
+            content_phase="0",
+            motion_phase="0",
+            motion_aggregation="none",
+            slice_axis="z",
+            slice_range=[2, 8],
+            volume_cache_gb=1e-3,
+        )
+        dataset = create_sliced_ct_dataset(
+            opt, lambda x: x + torch.rand(1), is_train=False
+        )
+        first, second = dataset[0]["xp"], dataset[0]["xp"]
+        assert list(dataset.volume_cache.keys()) == [0]  # type: ignore
+        # the cached volume is transformed anew on each fetch
+        assert not torch.equal(first, second)
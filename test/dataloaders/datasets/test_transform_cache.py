@@ -0,0 +1,81 @@
+import multiprocessing
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from torch import from_numpy
+
+from hrdae.dataloaders.datasets.transform_cache import (
+    TransformCache,
+    pop_cache_stats,
+    transform_config_key,
+)
+from hrdae.dataloaders.transforms import MinMaxNormalizationOption, create_transform
+
+
+def test_TransformCache():
+    with TemporaryDirectory() as root:
+        x = np.random.randn(10, 4, 8, 8).astype(np.float32)
+        np.savez(Path(root) / "sample.npz", x)
+
+        opts = [MinMaxNormalizationOption()]
+        cache = TransformCache(
+            Path(root) / "cache",
+            create_transform(opts[0]),
+            transform_config_key(opts),
+        )
+        load = lambda: from_numpy(np.load(Path(root) / "sample.npz")["arr_0"])  # noqa
+        t1 = cache(Path(root) / "sample.npz", load)
+        t2 = cache(Path(root) / "sample.npz", load)
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert np.allclose(t1.numpy(), t2.numpy())
+
+
+def test_TransformCache__eviction():
+    with TemporaryDirectory() as root:
+        paths = []
+        for i in range(3):
+            paths.append(Path(root) / f"sample{i}.npz")
+            np.savez(paths[-1], np.random.randn(10, 4, 8, 8).astype(np.float32))
+
+        cache = TransformCache(
+            Path(root) / "cache",
+            lambda x: x,
+            "",
+            max_bytes=2 * 10 * 4 * 8 * 8 * 4 + 1024,
+        )
+        for path in paths:
+            cache(path, lambda: from_numpy(np.load(path)["arr_0"]))
+            time.sleep(0.01)
+        assert len(list((Path(root) / "cache").glob("*.npy"))) == 2
+        cache(paths[0], lambda: from_numpy(np.load(paths[0])["arr_0"]))
+        assert cache.misses == 4
+
+
+def _lookup(cache: TransformCache, path: Path) -> None:
+    cache(path, lambda: from_numpy(np.load(path)["arr_0"]))
+
+
+def test_TransformCache__stats_from_workers():
+    with TemporaryDirectory() as root:
+        path = Path(root) / "sample.npz"
+        np.savez(path, np.random.randn(10, 4, 8, 8).astype(np.float32))
+        opts = [MinMaxNormalizationOption()]
+        cache = TransformCache(
+            Path(root) / "cache",
+            create_transform(opts[0]),
+            transform_config_key(opts),
+        )
+        _lookup(cache, path)
+
+        # e.g. a DataLoader worker
+        worker = multiprocessing.get_context("spawn").Process(
+            target=_lookup, args=(cache, path)
+        )
+        worker.start()
+        worker.join()
+        assert worker.exitcode == 0
+
+        assert pop_cache_stats([cache]) == {"hits": 1, "misses": 1}
+        assert (cache.hits, cache.misses) == (0, 0)
@@ -0,0 +1,48 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+
+from hrdae.dataloaders.datasets.ct import CT, BasicSliceIndexer
+from hrdae.dataloaders.datasets.volume_store import VolumeStore, build_volume_store
+
+
+def test_VolumeStore():
+    with TemporaryDirectory() as root:
+        data_root = Path(root) / "CT"
+        (data_root / "sub").mkdir(parents=True, exist_ok=True)
+        x1 = np.random.randn(10, 4, 8, 8)
+        x2 = np.random.randn(10, 6, 8, 8).astype(np.float32)
+        np.savez(data_root / "sample1.npz", x1)
+        np.savez_compressed(data_root / "sub" / "sample2.npz", x2)
+
+        build_volume_store(
+            [data_root / "sample1.npz", data_root / "sub" / "sample2.npz"],
+            data_root,
+            Path(root) / "CT_store",
+        )
+        store = VolumeStore(Path(root) / "CT_store")
+        assert len(store) == 2
+        assert np.allclose(store["sample1.npz"].numpy(), x1)
+        assert np.allclose(store["sub/sample2.npz"].numpy(), x2)
+
+
+def test_CT_volume_store():
+    with TemporaryDirectory() as root:
+        data_root = Path(root) / "CT"
+        data_root.mkdir(parents=True, exist_ok=True)
+        np.savez(data_root / "sample1.npz", np.random.randn(10, 10, 16, 16))
+        build_volume_store(
+            [data_root / "sample1.npz"], data_root, Path(root) / "CT_store"
+        )
+
+        dataset = CT(
+            root=Path(root),
+            slice_indexer=BasicSliceIndexer(),
+            in_memory=False,
+            is_train=False,
+            volume_store=Path(root) / "CT_store",
+        )
+        data = dataset[0]
+        assert data["xm"].shape == (10, 2, 10, 16)
+        assert data["xp"].shape == (10, 1, 10, 16, 16)
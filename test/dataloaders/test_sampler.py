@@ -0,0 +1,14 @@
+from hrdae.dataloaders.sampler import VolumeGroupedBatchSampler
+
+
+def test_VolumeGroupedBatchSampler():
+    sampler = VolumeGroupedBatchSampler(
+        [i // 6 for i in range(24)],
+        batch_size=3,
+        shuffle=True,
+    )
+    batches = list(sampler)
+    assert len(batches) == len(sampler) == 8
+    assert sorted(i for b in batches for i in b) == list(range(24))
+    for batch in batches:
+        assert len({i // 6 for i in batch}) == 1
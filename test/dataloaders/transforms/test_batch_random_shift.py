@@ -0,0 +1,92 @@
+import torch
+from torch import Tensor
+
+from hrdae.dataloaders.transforms import (
+    BatchRandomShift2dOption,
+    BatchRandomShift3dOption,
+    create_transform,
+)
+from hrdae.dataloaders.transforms.batch_random_shift import batch_shift
+
+
+def _reference_shift(x: Tensor, shifts: list[int], fill: float) -> Tensor:
+    # one sample, rolled along the last len(shifts) dims, then filled
+    k = len(shifts)
+    y = x.clone()
+    for j, s in enumerate(shifts):
+        dim = x.dim() - k + j
+        y = y.roll(s, dims=dim)
+        if s > 0:
+            y.narrow(dim, 0, s).fill_(fill)
+        elif s < 0:
+            y.narrow(dim, y.size(dim) + s, -s).fill_(fill)
+    return y
+
+
+def test_batch_shift():
+    x = torch.randn(3, 2, 1, 5, 6, 7)
+    shifts = torch.tensor([[1, -2, 3], [0, 0, 0], [-1, 5, -6]])
+    fill = torch.tensor([-1.0, -2.0, -3.0])
+    y = batch_shift(x, shifts, fill)
+    for i in range(3):
+        expected = _reference_shift(x[i], shifts[i].tolist(), float(fill[i]))
+        assert torch.equal(y[i], expected)
+
+
+def test_BatchRandomShift3d():
+    b, n, d, h, w = 4, 10, 8, 12, 16
+    xp = torch.randn(b, n, 1, d, h, w)
+    # slice plane at w = 5
+    xm = xp[:, :, :, :, :, 5]
+    batch = {"xm": xm, "xm_0": xm[:, 0], "xp": xp, "xp_0": xp[:, 0]}
+
+    transform = create_transform(BatchRandomShift3dOption(max_shifts=[2, 3, 3]))
+    output = transform(batch)
+    for key in batch:
+        assert output[key].shape == batch[key].shape
+
+    shifts = transform.shifts  # type: ignore
+    fill = xp.flatten(1).amin(dim=1)
+    for i in range(b):
+        dz, dy, dx = shifts[i].tolist()
+        assert abs(dz) <= 2 and abs(dy) <= 3 and dx == 0
+        expected = _reference_shift(xp[i], [dz, dy, dx], float(fill[i]))
+        assert torch.equal(output["xp"][i], expected)
+        assert torch.equal(output["xp_0"][i], expected[0])
+        # xm stays the slice of the shifted volume at the same plane
+        assert torch.equal(output["xm"][i], output["xp"][i, :, :, :, :, 5])
+        assert torch.equal(output["xm_0"][i], output["xm"][i, 0])
+
+
+def test_BatchRandomShift3d__volume_only():
+    xp = torch.randn(64, 2, 1, 4, 5, 6)
+    transform = create_transform(BatchRandomShift3dOption(max_shifts=[1, 2, 2]))
+    output = transform({"xp": xp})
+    shifts = transform.shifts  # type: ignore
+    # without motion slices every axis is shifted
+    assert shifts[:, -1].abs().max() > 0
+    fill = xp.flatten(1).amin(dim=1)
+    for i in range(len(xp)):
+        expected = _reference_shift(xp[i], shifts[i].tolist(), float(fill[i]))
+        assert torch.equal(output["xp"][i], expected)
+
+
+def test_BatchRandomShift2d():
+    b, n, h, w = 4, 10, 12, 16
+    xp = torch.randn(b, n, 1, h, w)
+    # columns w = 3 and w = 7 as two slices
+    xm = xp[:, :, 0, :, [3, 7]].transpose(-2, -1)
+    batch = {"xm": xm, "xp": xp}
+
+    transform = create_transform(BatchRandomShift2dOption(max_shifts=[3, 3]))
+    output = transform(batch)
+    shifts = transform.shifts  # type: ignore
+    fill = xp.flatten(1).amin(dim=1)
+    for i in range(b):
+        dy, dx = shifts[i].tolist()
+        assert abs(dy) <= 3 and dx == 0
+        expected = _reference_shift(xp[i], [dy, dx], float(fill[i]))
+        assert torch.equal(output["xp"][i], expected)
+        assert torch.equal(
+            output["xm"][i], output["xp"][i, :, 0, :, [3, 7]].transpose(-2, -1)
+        )
@@ -1,4 +1,4 @@
-from torch import randn
+from torch import allclose, randn
 
 from hrdae.models.networks.modules.conv_lstm import ConvLSTM1d, ConvLSTM2d
 
@@ -23,3 +23,20 @@ def test_conv_lstm2d():
     assert y.size() == (b, n, latent, d, h)
     assert len(last_states) == layer
     assert last_states[0][0].size() == (b, latent, d, h)
+
+
+def test_conv_lstm2d__checkpoint_steps():
+    b, n, c, d, h = 2, 10, 4, 4, 4
+    latent, k, layer = 8, 3, 2
+    x = randn((b, n, c, d, h))
+    convlstm = ConvLSTM2d(c, latent, (k, k), layer, True, True)
+    y, _ = convlstm(x)
+    y.mean().backward()
+    grad = convlstm.cell_list[0].conv.weight.grad.clone()
+    convlstm.zero_grad()
+
+    convlstm.checkpoint_steps = 3
+    y_ckpt, _ = convlstm(x)
+    y_ckpt.mean().backward()
+    assert allclose(y, y_ckpt, atol=1e-6)
+    assert allclose(grad, convlstm.cell_list[0].conv.weight.grad, atol=1e-6)
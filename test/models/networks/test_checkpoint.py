@@ -0,0 +1,81 @@
+import torch
+from torch import Tensor, allclose, nn, randn
+
+from hrdae.models.networks import CheckpointOption, HRDAE3dOption, create_network
+from hrdae.models.networks.checkpoint import apply_checkpointing
+from hrdae.models.networks.motion_encoder import MotionNormalEncoder2dOption
+
+
+def _saved_bytes(net: nn.Module, inputs: tuple[Tensor, ...]) -> int:
+    # bytes kept for backward by one forward pass
+    saved = 0
+
+    def pack(t: Tensor) -> Tensor:
+        nonlocal saved
+        saved += t.numel() * t.element_size()
+        return t
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda t: t):
+        net(*inputs)
+    return saved
+
+
+def test_checkpointing():
+    b, n, s, d, h, w = 2, 4, 3, 16, 16, 16
+    hidden = 8
+    latent = 4
+
+    opt = HRDAE3dOption(
+        in_channels=2,
+        hidden_channels=hidden,
+        latent_dim=latent,
+        conv_params=[
+            {
+                "kernel_size": [3],
+                "stride": [2],
+                "padding": [1],
+            }
+        ]
+        * 2,
+        motion_encoder=MotionNormalEncoder2dOption(
+            in_channels=s,
+            hidden_channels=hidden,
+            latent_dim=latent,
+            conv_params=[
+                {
+                    "kernel_size": [3],
+                    "stride": [2],
+                    "padding": [1],
+                }
+            ]
+            * 2,
+            deconv_params=[
+                {
+                    "kernel_size": [3],
+                    "stride": [1, 1, 2],
+                    "padding": [1],
+                    "output_padding": [0, 0, 1],
+                }
+            ]
+            * 2,
+        ),
+        aggregator="addition",
+        activation="sigmoid",
+    )
+    net = create_network(1, opt)
+    inputs = (randn((b, n, s, d, h)), randn((b, 2, d, h, w)))
+
+    y, _, _, _ = net(*inputs)
+    y.mean().backward()
+    grad = net.decoder.cnn.layers[0][0].conv.weight.grad.clone()
+    net.zero_grad()
+
+    apply_checkpointing(net, CheckpointOption(conv_layers=True, mgc=True))
+    y_ckpt, _, _, _ = net(*inputs)
+    y_ckpt.mean().backward()
+    assert allclose(y, y_ckpt, atol=1e-6)
+    assert allclose(grad, net.decoder.cnn.layers[0][0].conv.weight.grad, atol=1e-6)
+
+    checkpointed = _saved_bytes(net, inputs)
+    apply_checkpointing(net, CheckpointOption())
+    assert checkpointed < _saved_bytes(net, inputs)
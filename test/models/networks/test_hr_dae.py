@@ -190,6 +190,14 @@ def test_hrdae2d():
     assert m.size() == (b, n, latent, h // 4, w // 4)
     assert len(ds) == 0
 
+    cs, m = net.encode(
+        randn((b, n, s, h)),
+        randn((b, 2, h, w)),
+    )
+    assert len(cs) == 3
+    assert cs[1].size() == (b, hidden, h // 2, w // 2)
+    assert m.size() == (b, n, latent, h // 4, w // 4)
+
 
 def test_hrdae2d__concatenation():
     b, n, s, h, w = 8, 10, 3, 16, 16
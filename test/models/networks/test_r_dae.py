@@ -59,6 +59,14 @@ def test_rdae2d():
     assert m.size() == (b, n, latent, h // 4, 1)
     assert len(ds) == 0
 
+    cs, m = net.encode(
+        randn((b, n, s, h)),
+        randn((b, 2, h, w)),
+    )
+    assert len(cs) == 1
+    assert cs[0].size() == (b, latent, h // 4, w // 4)
+    assert m.size() == (b, n, latent, h // 4, 1)
+
 
 def test_cycle_rdae2d():
     b, n, c, s, h, w = 8, 10, 1, 3, 16, 16
@@ -1,8 +1,9 @@
 from pathlib import Path
 from tempfile import TemporaryDirectory
 
+import torch
 from torch import Tensor, nn, rand
-from torch.optim import Adam
+from torch.optim import SGD, Adam
 from torch.optim.lr_scheduler import StepLR
 from torch.utils.data import DataLoader, Dataset
 
@@ -65,3 +66,110 @@ def test_basic_model():
             Path(tempdir),
             False,
         )
+
+
+def test_basic_model_bf16():
+    network = FakeNetwork()
+    optimizer = Adam(network.parameters())
+    scheduler = StepLR(optimizer, step_size=1)
+    criterion = LossMixer(
+        {"mse": nn.MSELoss()},
+        {"mse": 1},
+    )
+    dataloader = DataLoader(FakeDataset(), batch_size=4)
+
+    model = BasicModel(network, "", optimizer, scheduler, criterion, amp="bf16")
+    with TemporaryDirectory() as tempdir:
+        loss = model.train(
+            dataloader,
+            dataloader,
+            1,
+            Path(tempdir),
+            False,
+        )
+    assert loss < float("inf")
+
+
+def test_basic_model_grad_accum():
+    data = [{"xp": rand((1, 32, 32))} for _ in range(4)]
+    initial = FakeNetwork().state_dict()
+
+    weights = []
+    # (batch_size, grad_accum_steps, micro_batch_size) with the same effective batch
+    for batch_size, grad_accum_steps, micro_batch_size in [
+        (4, 1, 0),
+        (4, 1, 2),
+        (2, 2, 0),
+    ]:
+        network = FakeNetwork()
+        network.load_state_dict(initial)
+        optimizer = SGD(network.parameters(), lr=0.1)
+        scheduler = StepLR(optimizer, step_size=1)
+        criterion = LossMixer(
+            {"mse": nn.MSELoss()},
+            {"mse": 1},
+        )
+        model = BasicModel(
+            network,
+            "",
+            optimizer,
+            scheduler,
+            criterion,
+            grad_accum_steps=grad_accum_steps,
+            micro_batch_size=micro_batch_size,
+        )
+        with TemporaryDirectory() as tempdir:
+            model.train(
+                DataLoader(data, batch_size=batch_size),
+                DataLoader(data, batch_size=batch_size),
+                1,
+                Path(tempdir),
+                False,
+            )
+        weights.append(network.conv[0].weight.detach().clone())
+
+    assert torch.allclose(weights[0], weights[1], atol=1e-6)
+    assert torch.allclose(weights[0], weights[2], atol=1e-6)
+
+
+def _train_weights(data, initial, batch_size, grad_accum_steps, debug=False):
+    network = FakeNetwork()
+    network.load_state_dict(initial)
+    optimizer = SGD(network.parameters(), lr=0.1)
+    scheduler = StepLR(optimizer, step_size=1)
+    criterion = LossMixer({"mse": nn.MSELoss()}, {"mse": 1})
+    model = BasicModel(
+        network,
+        "",
+        optimizer,
+        scheduler,
+        criterion,
+        grad_accum_steps=grad_accum_steps,
+    )
+    with TemporaryDirectory() as tempdir:
+        model.train(
+            DataLoader(data, batch_size=batch_size),
+            DataLoader(data, batch_size=batch_size),
+            1,
+            Path(tempdir),
+            debug,
+        )
+    return network.conv[0].weight.detach().clone()
+
+
+def test_basic_model_grad_accum__partial_group():
+    data = [{"xp": rand((1, 32, 32))} for _ in range(10)]
+    initial = FakeNetwork().state_dict()
+
+    # groups of 4 + 2 samples, the trailing group is the mean of its batch
+    assert torch.allclose(
+        _train_weights(data[:6], initial, 2, 2),
+        _train_weights(data[:6], initial, 4, 1),
+        atol=1e-6,
+    )
+    # the debug cut after 5 batches still steps on its last group
+    assert torch.allclose(
+        _train_weights(data, initial, 1, 2, debug=True),
+        _train_weights(data[:5], initial, 1, 2),
+        atol=1e-6,
+    )
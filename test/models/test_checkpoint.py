@@ -0,0 +1,68 @@
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import cast
+
+import torch
+from torch import nn
+from torch.optim import Adam
+from torch.optim.lr_scheduler import StepLR
+from torch.utils.data import DataLoader
+
+from hrdae.models.basic_model import BasicModel
+from hrdae.models.checkpoint import CheckpointWriter
+from hrdae.models.losses import LossMixer
+from hrdae.models.schedulers.typing import LRScheduler
+
+from .test_basic_model import FakeDataset, FakeNetwork
+
+
+def test_CheckpointWriter():
+    with TemporaryDirectory() as tempdir:
+        writer = CheckpointWriter(Path(tempdir), keep_last=2)
+        weight = torch.zeros(3)
+        for epoch in range(4):
+            writer.save(f"epoch_{epoch:04d}.pt", {"weight": weight}, is_best=epoch == 1)
+            # mutated right after saving, the snapshot must not see it
+            weight += 1
+        writer.close()
+
+        names = sorted(p.name for p in Path(tempdir).iterdir())
+        assert names == ["best.pt", "epoch_0002.pt", "epoch_0003.pt"]
+        assert torch.equal(
+            torch.load(Path(tempdir) / "best.pt")["weight"], torch.ones(3)
+        )
+        assert torch.equal(
+            torch.load(Path(tempdir) / "epoch_0003.pt")["weight"], torch.full((3,), 3.0)
+        )
+
+
+def _create_model(resume_from: str = "") -> BasicModel:
+    network = FakeNetwork()
+    optimizer = Adam(network.parameters())
+    # StepLR satisfies the LRScheduler protocol only at runtime
+    scheduler = cast(LRScheduler, StepLR(optimizer, step_size=1))
+    criterion = LossMixer(
+        {"mse": nn.MSELoss()},
+        {"mse": 1},
+    )
+    return BasicModel(
+        network, "", optimizer, scheduler, criterion, resume_from=resume_from
+    )
+
+
+def test_basic_model_resume():
+    dataloader = DataLoader(FakeDataset(), batch_size=4)
+    with TemporaryDirectory() as tempdir:
+        model = _create_model()
+        model.train(dataloader, dataloader, 1, Path(tempdir), False)
+        checkpoint = Path(tempdir) / "checkpoints" / "epoch_0000.pt"
+        assert checkpoint.exists()
+
+        resumed = _create_model(str(checkpoint))
+        resumed.train(dataloader, dataloader, 2, Path(tempdir), False)
+        assert resumed.scheduler.last_epoch == 2
+
+        with open(Path(tempdir) / "training_history.json") as f:
+            history = json.load(f)["history"]
+        assert [h["epoch"] for h in history] == [1, 2]
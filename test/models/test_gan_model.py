@@ -1,11 +1,14 @@
 from pathlib import Path
 from tempfile import TemporaryDirectory
 
+import torch
 from torch import Tensor, nn, rand
 from torch.optim import Adam
 from torch.optim.lr_scheduler import StepLR
+from torch.testing import assert_close
 from torch.utils.data import DataLoader, Dataset
 
+from hrdae.models.functions import shuffled_indices
 from hrdae.models.gan_model import GANModel
 from hrdae.models.losses import (
     BCEWithLogitsLossOption,
@@ -158,3 +161,199 @@ def test_basic_model():
             Path(tempdir),
             False,
         )
+
+
+def test_basic_model_bf16():
+
+    generator = FakeGenerator(1, "all", "all", "concat")
+    discriminator = FakeDiscriminator()
+    optimizer_g = Adam(generator.parameters())
+    optimizer_d = Adam(discriminator.parameters())
+    scheduler_g = StepLR(optimizer_g, step_size=1)
+    scheduler_d = StepLR(optimizer_d, step_size=1)
+    criterion = LossMixer(
+        {
+            "mse": create_loss(MSELossOption()),
+            "contrastive": create_loss(ContrastiveLossOption()),
+        },
+        {
+            "mse": 0.5,
+            "contrastive": 0.5,
+        },
+    )
+    criterion_g = create_loss(BCEWithLogitsLossOption())
+    criterion_d = create_loss(BCEWithLogitsLossOption())
+    dataloader = DataLoader(FakeDataset(), batch_size=4)
+
+    model = GANModel(
+        generator,
+        "",
+        discriminator,
+        optimizer_g,
+        optimizer_d,
+        scheduler_g,
+        scheduler_d,
+        criterion,
+        criterion_g,
+        criterion_d,
+        amp="bf16",
+    )
+    with TemporaryDirectory() as tempdir:
+        model.train(
+            dataloader,
+            dataloader,
+            1,
+            Path(tempdir),
+            False,
+        )
+
+
+def test_basic_model_grad_accum():
+
+    generator = FakeGenerator(1, "all", "all", "concat")
+    discriminator = FakeDiscriminator()
+    optimizer_g = Adam(generator.parameters())
+    optimizer_d = Adam(discriminator.parameters())
+    scheduler_g = StepLR(optimizer_g, step_size=1)
+    scheduler_d = StepLR(optimizer_d, step_size=1)
+    criterion = LossMixer(
+        {
+            "mse": create_loss(MSELossOption()),
+            "contrastive": create_loss(ContrastiveLossOption()),
+        },
+        {
+            "mse": 0.5,
+            "contrastive": 0.5,
+        },
+    )
+    criterion_g = create_loss(BCEWithLogitsLossOption())
+    criterion_d = create_loss(BCEWithLogitsLossOption())
+    dataloader = DataLoader(FakeDataset(), batch_size=4)
+
+    model = GANModel(
+        generator,
+        "",
+        discriminator,
+        optimizer_g,
+        optimizer_d,
+        scheduler_g,
+        scheduler_d,
+        criterion,
+        criterion_g,
+        criterion_d,
+        grad_accum_steps=2,
+        micro_batch_size=2,
+    )
+    with TemporaryDirectory() as tempdir:
+        model.train(
+            dataloader,
+            dataloader,
+            1,
+            Path(tempdir),
+            False,
+        )
+
+
+class CountingGenerator(FakeGenerator):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.num_forwards = 0
+
+    def forward(
+        self,
+        xm: Tensor,
+        xp_0: Tensor,
+        xm_0: Tensor,
+    ) -> tuple[Tensor, list[Tensor], Tensor, list[Tensor]]:
+        self.num_forwards += 1
+        return super().forward(xm, xp_0, xm_0)
+
+
+def test_basic_model_all_frame_pairs():
+
+    generator = CountingGenerator(1, "all", "all", "concat")
+    discriminator = FakeDiscriminator()
+    optimizer_g = Adam(generator.parameters())
+    optimizer_d = Adam(discriminator.parameters())
+    scheduler_g = StepLR(optimizer_g, step_size=1)
+    scheduler_d = StepLR(optimizer_d, step_size=1)
+    criterion = LossMixer(
+        {
+            "mse": create_loss(MSELossOption()),
+            "contrastive": create_loss(ContrastiveLossOption()),
+        },
+        {
+            "mse": 0.5,
+            "contrastive": 0.5,
+        },
+    )
+    criterion_g = create_loss(BCEWithLogitsLossOption())
+    criterion_d = create_loss(BCEWithLogitsLossOption())
+    dataloader = DataLoader(FakeDataset(), batch_size=4)
+
+    model = GANModel(
+        generator,
+        "",
+        discriminator,
+        optimizer_g,
+        optimizer_d,
+        scheduler_g,
+        scheduler_d,
+        criterion,
+        criterion_g,
+        criterion_d,
+        all_frame_pairs=True,
+    )
+    with TemporaryDirectory() as tempdir:
+        model.train(
+            dataloader,
+            dataloader,
+            1,
+            Path(tempdir),
+            False,
+        )
+    # one forward per train batch, the discriminator iterations reuse it,
+    # plus the val batches and the visualization batch
+    assert generator.num_forwards == 3 + 3 + 1
+
+
+def test_gan_model__all_frame_pairs_loss():
+    generator = FakeGenerator(1, "all", "all", "concat")
+    discriminator = FakeDiscriminator()
+    optimizer_g = Adam(generator.parameters())
+    optimizer_d = Adam(discriminator.parameters())
+    model = GANModel(
+        generator,
+        "",
+        discriminator,
+        optimizer_g,
+        optimizer_d,
+        StepLR(optimizer_g, step_size=1),
+        StepLR(optimizer_d, step_size=1),
+        LossMixer({"mse": create_loss(MSELossOption())}, {"mse": 1.0}),
+        create_loss(BCEWithLogitsLossOption()),
+        create_loss(BCEWithLogitsLossOption()),
+        all_frame_pairs=True,
+    )
+    # (b, n, c, h, w)
+    latent_m = rand((4, 3, 4, 8, 8))
+
+    torch.manual_seed(0)
+    losses = model._discriminator_losses(*model._score_pairs(latent_m))
+    # mean of the sampled loss over every frame pair (i, j)
+    torch.manual_seed(0)
+    others = shuffled_indices(4)
+    sampled = [
+        model._discriminator_losses(
+            *model._score_frames(
+                latent_m,
+                torch.full((4, 1), i),
+                torch.full((4, 1), j),
+                others,
+            )
+        )
+        for i in range(3)
+        for j in range(3)
+    ]
+    for key, value in losses.items():
+        assert_close(value, torch.stack([s[key] for s in sampled]).mean())
@@ -0,0 +1,36 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from PIL import Image
+
+from hrdae.models.image_writer import PADDING, ImageWriter, write_images
+
+
+def test_write_images():
+    original = np.random.rand(12, 1, 16, 24).astype(np.float32)
+    reconstructed = np.random.rand(12, 1, 16, 24).astype(np.float32)
+    with TemporaryDirectory() as tempdir:
+        save_dir = Path(tempdir) / "reconstructed"
+        write_images(original, reconstructed, save_dir, "epoch_0", save_raw=True)
+
+        # at most 10 frames per row
+        assert len(list(save_dir.glob("epoch_0_original_*.png"))) == 10
+        assert len(list(save_dir.glob("epoch_0_reconstructed_*.png"))) == 10
+        montage = np.asarray(Image.open(save_dir / "epoch_0.png"))
+        assert montage.shape == (2 * 16 + PADDING, 10 * 24 + 9 * PADDING)
+        assert montage.dtype == np.uint8
+        raw = np.load(save_dir / "epoch_0.npy")
+        np.testing.assert_array_equal(raw, np.stack([original, reconstructed]))
+
+
+def test_image_writer__async():
+    original = np.random.rand(4, 1, 8, 8).astype(np.float32)
+    with TemporaryDirectory() as tempdir:
+        writer = ImageWriter(num_workers=1)
+        for i in range(3):
+            writer.submit(original, original, Path(tempdir), f"epoch_{i}")
+        writer.close()
+        for i in range(3):
+            assert (Path(tempdir) / f"epoch_{i}.png").exists()
+        assert not (Path(tempdir) / "epoch_0.npy").exists()
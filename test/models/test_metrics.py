@@ -0,0 +1,58 @@
+from socket import socket
+
+import torch.multiprocessing as mp
+from pytest import approx
+from torch import nn, ones, tensor, zeros
+
+from hrdae.distributed import destroy_process_group, init_process_group
+from hrdae.models.losses import LossMixer
+from hrdae.models.metrics import MetricAggregator, loss_terms
+
+
+def test_metric_aggregator():
+    metrics = MetricAggregator()
+    # two half batches, then a whole one
+    metrics.update({"loss": tensor(1.0)}, 0.5)
+    metrics.update({"loss": tensor(3.0)}, 0.5)
+    metrics.update({"loss": tensor(5.0), "other": tensor(2.0)})
+
+    assert metrics.compute() == approx({"loss": 3.5, "other": 2.0})
+    assert metrics.reduce() == approx({"loss": 3.5, "other": 2.0})
+    assert MetricAggregator().compute() == {}
+    assert MetricAggregator().reduce() == {}
+
+
+def _reduce_worker(rank: int, world_size: int, port: int) -> None:
+    init_process_group(rank, world_size, port)
+    try:
+        metrics = MetricAggregator()
+        # the last rank saw no batch at all, but still joins the reduction
+        if rank == 0:
+            metrics.update({"loss": tensor(1.0)})
+        elif rank == 1:
+            metrics.update({"loss": tensor(3.0), "other": tensor(2.0)})
+        assert metrics.reduce() == approx({"loss": 2.0, "other": 2.0})
+    finally:
+        destroy_process_group()
+
+
+def test_metric_aggregator__reduce_empty_rank():
+    with socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    mp.spawn(_reduce_worker, args=(3, port), nprocs=3)
+
+
+def test_loss_terms():
+    criterion = LossMixer(
+        {"mse": nn.MSELoss(), "l1": nn.L1Loss()},
+        {"mse": 2.0, "l1": 1.0},
+    )
+    loss = criterion(ones(2, 3), zeros(2, 3))
+    terms = loss_terms(criterion, "loss")
+
+    assert loss.item() == approx(3.0)
+    assert {k: v.item() for k, v in terms.items()} == approx(
+        {"loss_mse": 2.0, "loss_l1": 1.0}
+    )
+    assert loss_terms(nn.MSELoss(), "loss") == {}
@@ -0,0 +1,188 @@
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import cast
+
+from torch import nn
+from torch.optim import Adam
+from torch.optim.lr_scheduler import StepLR
+from torch.utils.data import DataLoader
+
+from hrdae.models.basic_model import BasicModel
+from hrdae.models.losses import LossMixer
+from hrdae.models.metrics import MetricAggregator
+from hrdae.models.schedulers.typing import LRScheduler
+from hrdae.models.trainer import EarlyStoppingHook, Hook, Trainer, _subset_loader
+
+from .test_basic_model import FakeDataset, FakeNetwork
+
+
+class RecordingHook(Hook):
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, int]] = []
+
+    def on_step(
+        self, trainer: Trainer, epoch: int, idx: int, metrics: MetricAggregator
+    ) -> None:
+        self.calls.append(("step", epoch))
+
+    def on_val(
+        self,
+        trainer: Trainer,
+        epoch: int,
+        train_result: dict[str, float],
+        val_result: dict[str, float],
+    ) -> None:
+        assert set(val_result) == {"loss", "loss_mse"}
+        self.calls.append(("val", epoch))
+
+    def on_checkpoint(self, trainer: Trainer, epoch: int, path: Path) -> None:
+        self.calls.append(("checkpoint", epoch))
+
+    def on_epoch_end(self, trainer: Trainer, epoch: int) -> None:
+        self.calls.append(("epoch_end", epoch))
+
+
+def test_trainer_hooks():
+    network = FakeNetwork()
+    optimizer = Adam(network.parameters())
+    scheduler = StepLR(optimizer, step_size=1)
+    criterion = LossMixer(
+        {"mse": nn.MSELoss()},
+        {"mse": 1},
+    )
+    dataloader = DataLoader(FakeDataset(), batch_size=4)
+
+    model = BasicModel(network, "", optimizer, scheduler, criterion)
+    hook = RecordingHook()
+    with TemporaryDirectory() as tempdir:
+        model.train(dataloader, dataloader, 2, Path(tempdir), False, hooks=[hook])
+
+    # 3 batches per epoch
+    expected = [("step", 0)] * 3 + [("val", 0), ("checkpoint", 0), ("epoch_end", 0)]
+    expected += [("step", 1)] * 3 + [("val", 1), ("checkpoint", 1), ("epoch_end", 1)]
+    assert hook.calls == expected
+    # hooks passed to train are kept to that run
+    assert all(h is not hook for h in model.trainer.hooks)
+
+
+def _create_model(**kwargs) -> BasicModel:
+    network = FakeNetwork()
+    optimizer = Adam(network.parameters())
+    # StepLR satisfies the LRScheduler protocol only at runtime
+    scheduler = cast(LRScheduler, StepLR(optimizer, step_size=1))
+    criterion = LossMixer(
+        {"mse": nn.MSELoss()},
+        {"mse": 1},
+    )
+    return BasicModel(network, "", optimizer, scheduler, criterion, **kwargs)
+
+
+def test_trainer__val_every_n_epochs():
+    dataloader = DataLoader(FakeDataset(), batch_size=4)
+    model = _create_model(val_every_n_epochs=2, val_subset_size=4)
+    with TemporaryDirectory() as tempdir:
+        model.train(dataloader, dataloader, 3, Path(tempdir), False)
+        with open(Path(tempdir) / "training_history.json") as f:
+            history = json.load(f)["history"]
+
+    # epoch 2 on the subset, rescored on the full val set as its first best,
+    # the last epoch always on the full val set
+    assert ["val_subset_loss" in h for h in history] == [False, True, False]
+    assert ["val_loss" in h for h in history] == [False, True, True]
+
+
+class StoppingHook(Hook):
+    def on_val(
+        self,
+        trainer: Trainer,
+        epoch: int,
+        train_result: dict[str, float],
+        val_result: dict[str, float],
+    ) -> None:
+        trainer.should_stop = epoch == 1
+
+
+def test_trainer__early_stop_validates_full():
+    network = FakeNetwork()
+    # a constant val loss, so only the stop asks for a full validation
+    optimizer = Adam(network.parameters(), lr=0.0)
+    scheduler = cast(LRScheduler, StepLR(optimizer, step_size=1))
+    criterion = LossMixer({"mse": nn.MSELoss()}, {"mse": 1})
+    model = BasicModel(network, "", optimizer, scheduler, criterion, val_subset_size=4)
+    model.trainer.hooks.append(StoppingHook())
+    dataloader = DataLoader(FakeDataset(), batch_size=4)
+    with TemporaryDirectory() as tempdir:
+        model.train(dataloader, dataloader, 5, Path(tempdir), False)
+        with open(Path(tempdir) / "training_history.json") as f:
+            history = json.load(f)["history"]
+
+    assert ["val_subset_loss" in h for h in history] == [True, True]
+    assert ["val_loss" in h for h in history] == [True, True]
+
+
+class ModeHook(Hook):
+    def __init__(self, network: nn.Module) -> None:
+        self.network = network
+        self.modes: list[bool] = []
+
+    def on_epoch_end(self, trainer: Trainer, epoch: int) -> None:
+        self.modes.append(self.network.training)
+
+
+def test_trainer__reconstruct_in_eval_mode():
+    dataloader = DataLoader(FakeDataset(), batch_size=4)
+    model = _create_model(val_every_n_epochs=2)
+    reconstruct = model.reconstruct
+    modes: list[bool] = []
+
+    def recording_reconstruct(data):
+        modes.append(model.network.training)
+        return reconstruct(data)
+
+    model.reconstruct = recording_reconstruct  # type: ignore
+    hook = ModeHook(model.network)
+    with TemporaryDirectory() as tempdir:
+        # the first epoch saves images without a validation before them
+        model.train(dataloader, dataloader, 2, Path(tempdir), False, hooks=[hook])
+
+    assert modes == [False]
+    # back to training afterwards, the last epoch ends validated
+    assert hook.modes == [True, False]
+
+
+def test_trainer__resume_early_stopping():
+    dataloader = DataLoader(FakeDataset(), batch_size=4)
+    with TemporaryDirectory() as tempdir:
+        model = _create_model(early_stopping_patience=5)
+        model.train(dataloader, dataloader, 2, Path(tempdir), False)
+
+        checkpoint = Path(tempdir) / "checkpoints" / "epoch_0001.pt"
+        resumed = _create_model(early_stopping_patience=5, resume_from=str(checkpoint))
+        # nothing left to train, only the state is loaded
+        resumed.train(dataloader, dataloader, 2, Path(tempdir), False)
+
+    hook = model.trainer.hooks[-1]
+    resumed_hook = resumed.trainer.hooks[-1]
+    assert isinstance(hook, EarlyStoppingHook)
+    assert isinstance(resumed_hook, EarlyStoppingHook)
+    assert resumed_hook.state_dict() == hook.state_dict()
+    assert hook.least < float("inf")
+
+
+def test_EarlyStoppingHook():
+    model = _create_model()
+    hook = EarlyStoppingHook(patience=2)
+    for epoch, loss in enumerate([1.0, 0.5, 0.6]):
+        hook.on_val(model.trainer, epoch, {}, {"loss": loss})
+        assert not model.trainer.should_stop
+    hook.on_val(model.trainer, 3, {}, {"loss": 0.7})
+    assert model.trainer.should_stop
+
+
+def test_subset_loader():
+    dataloader = DataLoader(FakeDataset(), batch_size=4)
+    subset = _subset_loader(dataloader, 4)
+    assert list(subset.dataset.indices) == [0, 3, 6, 9]
+    assert subset.batch_size == 4
+    assert _subset_loader(dataloader, 0) is dataloader
@@ -1,12 +1,15 @@
 from pathlib import Path
 from tempfile import TemporaryDirectory
 
-from torch import Tensor, nn, rand
+from torch import Tensor, manual_seed, nn, rand
 from torch.optim import Adam
 from torch.optim.lr_scheduler import StepLR
+from torch.testing import assert_close
 from torch.utils.data import DataLoader, Dataset
 
-from hrdae.models.losses import LossMixer
+from hrdae.models.functions import shuffled_indices
+from hrdae.models.losses import LossMixer, TripletLossOption, create_loss
+from hrdae.models.losses.triplet import TripletLoss
 from hrdae.models.vr_model import VRModel
 
 
@@ -122,3 +125,91 @@ def test_vr_model():
             Path(tempdir),
             False,
         )
+
+
+class FakeCycleNetwork(FakeNetwork):
+    def encode(
+        self,
+        xm: Tensor,
+        xp_0: Tensor,
+        xm_0: Tensor,
+    ) -> tuple[list[Tensor], Tensor]:
+        b, n, s, h = xm.size()
+        # m (4, 10, 4, 4, 1)
+        m = self.conv1d(xm.reshape(b * n, s, h)).reshape(b, n, 4, h // 8, 1)
+        # c (4, 4, 4, 4)
+        return [self.conv2d(xp_0)], m
+
+    def decode(
+        self, cs: list[Tensor], m: Tensor
+    ) -> tuple[Tensor, list[Tensor], Tensor, list[Tensor]]:
+        (c,) = cs
+        b, n = m.size()[:2]
+        x = self.deconv2d((m + c.unsqueeze(1)).flatten(0, 1))
+        # d (4, 10, 4, 4, 4), content of the reconstructed frames
+        d = self.conv2d(x.repeat(1, 2, 1, 1))
+        x = x.reshape(b, n, *x.size()[1:])
+        return x, [c.unsqueeze(1)], m, [d.reshape(b, n, *d.size()[1:])]
+
+    def forward(
+        self,
+        xm: Tensor,
+        xp_0: Tensor,
+        xm_0: Tensor,
+    ) -> tuple[Tensor, list[Tensor], Tensor, list[Tensor]]:
+        return self.decode(*self.encode(xm, xp_0, xm_0))
+
+
+def test_vr_model__triplet():
+    network = FakeCycleNetwork(1, "all", "all", "concat")
+    optimizer = Adam(network.parameters())
+    scheduler = StepLR(optimizer, step_size=1)
+    criterion = LossMixer(
+        {"mse": nn.MSELoss(), "triplet": create_loss(TripletLossOption())},
+        {"mse": 1.0, "triplet": 0.1},
+    )
+    dataloader = DataLoader(FakeDataset(), batch_size=4)
+
+    model = VRModel(
+        network,
+        "",
+        optimizer,
+        scheduler,
+        criterion,
+        True,
+    )
+    with TemporaryDirectory() as tempdir:
+        model.train(
+            dataloader,
+            dataloader,
+            1,
+            Path(tempdir),
+            False,
+        )
+
+
+def test_vr_model__triplet_matches_swapped_forwards():
+    network = FakeCycleNetwork(1, "all", "all", "concat")
+    optimizer = Adam(network.parameters())
+    scheduler = StepLR(optimizer, step_size=1)
+    criterion = LossMixer({"mse": nn.MSELoss()}, {"mse": 1.0})
+    model = VRModel(network, "", optimizer, scheduler, criterion, True)
+    xm = rand((4, 10, 3, 32))
+    xm_0 = rand((4, 2, 32))
+    xp_0 = rand((4, 2, 32, 32))
+
+    _, latent_c, latent_m, _ = network(xm, xp_0, xm_0)
+    manual_seed(0)
+    positive, negative = model._triplet(latent_c, latent_m)
+    # the two extra forwards the triplet used to run
+    manual_seed(0)
+    indices = shuffled_indices(4)
+    _, _, _, expected_positive = network(xm[indices], xp_0, xm_0[indices])
+    _, _, _, expected_negative = network(xm, xp_0[indices], xm_0)
+
+    triplet = TripletLoss()
+    x = rand((4, 10, 1, 32, 32))
+    assert_close(
+        triplet(x, x, latent_c, positive, negative),
+        triplet(x, x, latent_c, expected_positive, expected_negative),
+    )
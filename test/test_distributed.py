@@ -0,0 +1,80 @@
+import json
+from pathlib import Path
+from socket import socket
+from tempfile import TemporaryDirectory
+from typing import cast
+
+import torch
+import torch.multiprocessing as mp
+from torch import Tensor, nn, rand
+from torch.optim import Adam
+from torch.optim.lr_scheduler import StepLR
+from torch.utils.data import Dataset
+
+from hrdae.dataloaders.basic import BasicDataLoaderOption, create_basic_loader
+from hrdae.distributed import (
+    destroy_process_group,
+    get_world_size,
+    init_process_group,
+)
+from hrdae.models.basic_model import BasicModel
+from hrdae.models.losses import LossMixer
+from hrdae.models.schedulers.typing import LRScheduler
+
+
+class FakeDataset(Dataset):
+    def __getitem__(self, idx: int) -> dict[str, Tensor]:
+        return {
+            "xp": rand((1, 16, 16)),
+        }
+
+    def __len__(self) -> int:
+        return 8
+
+
+class FakeNetwork(nn.Module):
+    def __init__(self) -> None:
+        super().__init__()
+        self.conv = nn.Conv2d(1, 1, 3, 1, 1)
+
+    def forward(self, x: Tensor) -> tuple[Tensor, Tensor]:
+        latent = self.conv(x)
+        return latent.sigmoid(), latent
+
+
+def _worker(rank: int, world_size: int, port: int, result_dir: str) -> None:
+    init_process_group(rank, world_size, port)
+    try:
+        assert get_world_size() == world_size
+        network = FakeNetwork()
+        optimizer = Adam(network.parameters())
+        # StepLR satisfies the LRScheduler protocol only at runtime
+        scheduler = cast(LRScheduler, StepLR(optimizer, step_size=1))
+        criterion = LossMixer({"mse": nn.MSELoss()}, {"mse": 1})
+        loader = create_basic_loader(
+            BasicDataLoaderOption(batch_size=2), FakeDataset(), shuffle=True
+        )
+        # each rank sees its own half of the dataset
+        assert len(loader) == 2
+
+        model = BasicModel(network, "", optimizer, scheduler, criterion)
+        model.train(loader, loader, 1, Path(result_dir), False)
+    finally:
+        destroy_process_group()
+
+
+def test_distributed_training():
+    with socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    with TemporaryDirectory() as tempdir:
+        mp.spawn(_worker, args=(2, port, tempdir), nprocs=2)
+        with open(Path(tempdir) / "training_history.json") as f:
+            history = json.load(f)["history"]
+        assert len(history) == 1
+        assert (Path(tempdir) / "weights" / "best_model.pth").exists()
+        # the random state of every rank, to resume each of them
+        state = torch.load(
+            Path(tempdir) / "checkpoints" / "epoch_0000.pt", weights_only=False
+        )
+        assert len(state["rng"]) == 2
@@ -10,8 +10,14 @@ from hrdae.dataloaders.transforms import (
     Pool3dOption,
 )
 from hrdae.dataloaders.datasets import CTDatasetOption
-from hrdae.dataloaders import create_dataloader, BasicDataLoaderOption
+from hrdae.dataloaders import (
+    create_dataloader,
+    BasicDataLoaderOption,
+    pop_cache_stats,
+    transform_caches,
+)
 from hrdae.models import create_model, VRModelOption
+from hrdae.models.trainer import Hook, ReportHook
 from hrdae.models.losses import WeightedMSELossOption
 from hrdae.models.optimizers import AdamOptimizerOption
 from hrdae.models.schedulers import OneCycleLRSchedulerOption
@@ -62,11 +68,25 @@ def objective(trial):
         threshold=0.1,
         min_occupancy=0.2,
         in_memory=False,
+        use_pyramid=args.use_pyramid,
     )
 
+    # (d, w, h) in voxels of the original volume
+    max_shifts = [2, 4, 4]
+    transform_order_train = ["random_shift3d", "pool3d"]
+    if args.use_pyramid or args.transform_cache_dir != "":
+        # a stored pyramid level can only replace a leading pool3d, and only
+        # a leading pool3d is cached. the shifts then act on the pooled
+        # volume and are scaled to the same strength
+        max_shifts = [
+            round(s / p)
+            for s, p in zip(max_shifts, [pool_size[0], pool_size[2], pool_size[1]])
+        ]
+        transform_order_train = ["pool3d", "random_shift3d"]
+
     transform_option = {
         "random_shift3d": RandomShift3dOption(
-            max_shifts=[2, 4, 4],
+            max_shifts=max_shifts,
         ),
         "pool3d": Pool3dOption(
             pool_size=pool_size,
@@ -84,9 +104,10 @@ def objective(trial):
         batch_size=args.batch_size,
         train_val_ratio=0.8,
         dataset=dataset_option,
-        transform_order_train=["random_shift3d", "pool3d"],
+        transform_order_train=transform_order_train,
         transform_order_val=["pool3d"],
         transform=transform_option,
+        transform_cache_dir=args.transform_cache_dir,
     )
 
     loss_option = {
@@ -310,12 +331,17 @@ def objective(trial):
         n_epoch=train_option.n_epoch,
         steps_per_epoch=len(train_loader),
     )
+    hooks: list[Hook] = []
+    caches = transform_caches(train_loader.dataset)
+    if len(caches) > 0:
+        hooks.append(ReportHook("transform cache", lambda: pop_cache_stats(caches)))
     return model.train(
         train_loader,
         val_loader,
         n_epoch=train_option.n_epoch,
         result_dir=result_dir,
         debug=False,
+        hooks=hooks,
     )
 
 
@@ -332,6 +358,8 @@ if __name__ == "__main__":
     parser.add_argument("--weight", type=float, default=2)
     parser.add_argument("--batch_size", type=int, default=1)
     parser.add_argument("--pred_diff", action="store_true")
+    parser.add_argument("--use_pyramid", action="store_true")
+    parser.add_argument("--transform_cache_dir", type=str, default="")
     args = parser.parse_args()
 
     study_name = "ct"